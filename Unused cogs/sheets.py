@@ -2,10 +2,17 @@ import discord
 from discord.ext import commands, tasks
 import pandas as pd
 import datetime as DT
-import urllib.request
+import asyncio
+import hashlib
+import io
 import json
+import urllib.error
+import urllib.request
 import pygsheets
-import statistics
+
+from helpers.bulk import chunk_ids, fetch_all
+from helpers.records import average_prices, location_code, parse_history
+from helpers.shorthand import ENCHANT_NAMES, ENCHANT_NUMBERS, TIER_NAMES
 
 
 class Sheets(commands.Cog):
@@ -24,7 +31,7 @@ class Sheets(commands.Cog):
     Tasks:
         - refresh
             Refreshes buyorder and sellorder messages.
-            Done by recalling sheetsFetch and editing message.
+            Done by recalling sheetsFetch and editing message if it changed.
 
     Functions:
         - sheetsFetch(option)
@@ -33,6 +40,8 @@ class Sheets(commands.Cog):
             Returns embed with columns:
                 Item Name (Item ID)
                 Price Remaining/Quantity
+        - fetch_csv(URL)
+            Download CSV, using a conditional request if downloaded before.
     """
 
     def __init__(self, client):
@@ -54,7 +63,19 @@ class Sheets(commands.Cog):
         )
 
         # API URL
-        self.apiURL = "https://www.albion-online-data.com/api/v1/stats/charts/"
+        self.apiURL = "https://www.albion-online-data.com/api/v2/stats/charts/"
+
+        # Weekly average prices settings
+        # Items per request, and number of requests running at a time
+        self.historyChunkSize = 20
+        self.historyConcurrency = 4
+        self.averageLocations = [
+            "Thetford",
+            "Martlock",
+            "Lymhurst",
+            "Bridgewatch",
+            "Fort Sterling",
+        ]
 
         # Spreadsheets
         self.spreadsheet = "The Pangolin Trading Company Buy-Order Reference Sheet"
@@ -63,6 +84,18 @@ class Sheets(commands.Cog):
         # The auth file that allows bot to edit google sheet (refer to google sheet's API)
         self.serviceFile = "editor_servicefile.json"
 
+        # Buy/sell order boards in self.marketChannel that refresh keeps updated
+        # Message ID -> {'option': 'buyorder'/'sellorder', 'hash': embed hash}
+        self.boardsFile = "boards.json"
+        try:
+            with open(self.boardsFile) as f:
+                self.boards = json.load(f)
+        except (OSError, ValueError):
+            self.boards = {}
+
+        # Last download of each sheet's CSV, for conditional requests
+        self.csvCache = {}
+
         # Start refresh task
         self.refresh.start()
 
@@ -82,8 +115,10 @@ class Sheets(commands.Cog):
         await msg.add_reaction("\u274c")  # Delete reaction button
 
         # Only add refresh 'flag' if in self.marketChannel channel
+        # and remember the message so that refresh does not need to search for it
         if ctx.channel == self.marketChannel:
             await msg.add_reaction("\U0001f504")
+            self.register_board(msg.id, "buyorder", em)
 
     @commands.command()
     async def sellorder(self, ctx):
@@ -101,8 +136,10 @@ class Sheets(commands.Cog):
         await msg.add_reaction("\u274c")  # Delete reaction button
 
         # Only add refresh 'flag' if in self.marketChannel channel
+        # and remember the message so that refresh does not need to search for it
         if ctx.channel == self.marketChannel:
             await msg.add_reaction("\U0001f504")
+            self.register_board(msg.id, "sellorder", em)
 
     @commands.command(aliases=["Updateprices", "UpdatePrices"])
     async def updateprices(self, ctx):
@@ -111,6 +148,8 @@ class Sheets(commands.Cog):
         - Average of all 5 cities except Caerleon and Black Market.
         - Reject outliers.
         - Only self.adminUsers can run this command.
+        - Items are fetched in chunks of self.historyChunkSize per request,
+            with at most self.historyConcurrency requests at a time.
         """
 
         # Debug message
@@ -118,109 +157,159 @@ class Sheets(commands.Cog):
         if str(ctx.author) not in self.adminUsers:
             return
 
-        def reject_outliers(data):
-            d = [abs(i - statistics.median(data)) for i in data]
-            mdev = statistics.median(d)
-            s = [i / mdev if mdev else 0 for i in d]
-            m = 10
-            indices = [i for (i, val) in enumerate(s) if val < m]
-
-            newData = [data[i] for i in indices]
-            return newData, indices
-
-        await ctx.send("Updating weekly average prices. This might take awhile.")
+        status = await ctx.send(
+            "Updating weekly average prices. This might take awhile."
+        )
 
         # Connect to Google Sheets
         gc = pygsheets.authorize(service_account_file=self.serviceFile)
         sh = gc.open(self.spreadsheet)
         wks = sh.worksheet_by_title(self.worksheet)
 
-        # Get list of item IDs from Google Sheets and get their _id from MongoDB
-        itemIDs = wks.get_values("A4", "A196")
+        # Get list of item IDs from Google Sheets
+        itemIDs = [itemID[0] for itemID in wks.get_values("A4", "A196")]
 
-        # Get dates of past 7 days
+        # Whole 7 days range in one request
         now = DT.datetime.utcnow()
-        dates = [None] * 7
-        for i in range(1, 8):
-            dates[i - 1] = (now - DT.timedelta(days=i)).strftime("%m-%d-%Y")
-
-        avgPrices = []
-        # Iterate over all items
-        for (i, itemID) in enumerate(itemIDs):
-
-            itemPrices = []
-            # Iterate over all 7 days
-            for date in dates:
-
-                # Retrieve the prices of each day for each item
-                try:
-                    fullURL = (
-                        self.apiURL
-                        + itemID[0]
-                        + "?date="
-                        + date
-                        + "&locations=Thetford,Martlock,Lymhurst,Bridgewatch,FortSterling"
-                    )
-                    with urllib.request.urlopen(fullURL) as url:
-                        prices = json.loads(url.read().decode())
-
-                    for price in prices:
-                        # Do not include Caerleon
-                        if price["location"] != "Caerleon":
-                            itemPrices.extend(price["data"]["prices_min"])
-                # Pass if no data on that day
-                except:
-                    pass
+        query = (
+            "?date="
+            + (now - DT.timedelta(days=7)).strftime("%m-%d-%Y")
+            + "&end_date="
+            + now.strftime("%m-%d-%Y")
+            + "&locations=Thetford,Martlock,Lymhurst,Bridgewatch,FortSterling"
+            + "&time-scale=1"
+        )
 
-            try:
-                # Reject outliers
-                itemPrices, indices = reject_outliers(itemPrices)
+        # Pack many item IDs into each request
+        uniqueIDs = list(dict.fromkeys(itemIDs))
+        chunks = chunk_ids(
+            uniqueIDs, self.historyChunkSize, len(self.apiURL) + len(query)
+        )
+        urls = [self.apiURL + ",".join(chunk) + query for chunk in chunks]
+
+        # Edit status message as chunks come in (at most every 5 seconds)
+        lastUpdate = DT.datetime.utcnow()
+
+        async def progress(done, total):
+            nonlocal lastUpdate
+            if (DT.datetime.utcnow() - lastUpdate).total_seconds() > 5:
+                lastUpdate = DT.datetime.utcnow()
+                await status.edit(
+                    content=f"Updating weekly average prices. ({done}/{total} requests)"
+                )
+
+        results = await fetch_all(urls, self.historyConcurrency, progress)
+
+        # Parse all chunks into one structured array, item codes index uniqueIDs
+        itemCodes = {itemID: i for (i, itemID) in enumerate(uniqueIDs)}
+        history = parse_history(
+            [series for result in results if result for series in result],
+            itemCodes,
+        )
 
-                # Find average and append it to avgPrices
-                # Each element in avgPrices need to be in a list (Google Sheets requirement)
-                average = int(statistics.mean(itemPrices))
-                avgPrices.append([average])
+        # All averages in one pass, Caerleon is not included
+        averages = average_prices(
+            history,
+            len(uniqueIDs),
+            [location_code(city) for city in self.averageLocations],
+        )
 
-            # If itemPrices is []
-            except:
-                avgPrices.append([0])
+        # Each element in avgPrices need to be in a list (Google Sheets requirement)
+        avgPrices = [[int(averages[itemCodes[itemID]])] for itemID in itemIDs]
 
         # Send avgPrices to Google Sheets
         wks.update_values(crange="C4:C196", values=avgPrices)
 
-        await ctx.send("Weekly prices updated.")
+        failed = results.count(None)
+        await ctx.send(
+            f"Weekly prices updated. ({len(urls) - failed}/{len(urls)} requests succeeded)"
+        )
         await self.debugChannel.send("Weekly prices updated.")
 
     @tasks.loop(seconds=900)
     async def refresh(self):
         """Refresh buyorder and sellorder messages.
 
-        - Only refreshes if messages are in the self.marketChannel channel.
-        - Only refreshes if message has \U0001f504 reaction by the bot.
-        - Scans through self.marketChannel history to find the messages.
-        - Refreshes by recalling sheetsFetch and edit message.
+        - Only refreshes messages in self.boards (saved to self.boardsFile).
+        - If self.boards is empty, scans self.marketChannel history once for
+            messages with \U0001f504 reaction by the bot.
+        - Each sheet is fetched at most once per refresh, shared by its boards.
+        - Messages are only edited if the embed changed.
         """
 
-        messages = await self.marketChannel.history(limit=50).flatten()
-        for message in messages:
-            # Use try as some messages does not have reaction
+        if not self.boards:
+            await self.find_boards()
+
+        # One embed per sheet, fetched in a thread
+        loop = asyncio.get_event_loop()
+        embeds = {}
+        for option in {board["option"] for board in self.boards.values()}:
             try:
-                for reaction in message.reactions:
-                    # If reaction has '\U0001f504' reaction by the bot
-                    if reaction.emoji == "\U0001f504" and reaction.me:
-
-                        # If message is buy order
-                        if "BUY ORDERS" in message.embeds[0].title:
-                            em = self.sheetsFetch("buyorder")
-                            await message.edit(embed=em)
-
-                        # If message is sell order
-                        elif "SELL ORDERS" in message.embeds[0].title:
-                            em = self.sheetsFetch("sellorder")
-                            await message.edit(embed=em)
+                embeds[option] = await loop.run_in_executor(
+                    None, self.sheetsFetch, option
+                )
             except Exception as e:
-                if e[0:2] != "400":
-                    await self.debugChannel.send(e)
+                await self.debugChannel.send(f"refresh {option} failed: {e}")
+
+        changed = False
+        for (messageID, board) in list(self.boards.items()):
+            em = embeds.get(board["option"])
+            if em is None:
+                continue
+
+            # Skip if rendered embed is the same as last time
+            embedHash = embed_hash(em)
+            if embedHash == board["hash"]:
+                continue
+
+            try:
+                message = await self.marketChannel.fetch_message(int(messageID))
+                await message.edit(embed=em)
+                board["hash"] = embedHash
+            # Message was deleted, stop tracking it
+            except discord.NotFound:
+                del self.boards[messageID]
+            except Exception as e:
+                await self.debugChannel.send(e)
+            changed = True
+
+        if changed:
+            self.save_boards()
+
+    async def find_boards(self):
+        """Find buy/sell order messages in self.marketChannel and track them.
+
+        - Only used when no boards are tracked yet, e.g. first run.
+        """
+
+        messages = await self.marketChannel.history(limit=50).flatten()
+        for message in messages:
+            # If message has '\U0001f504' reaction by the bot
+            if not message.embeds or not any(
+                reaction.emoji == "\U0001f504" and reaction.me
+                for reaction in message.reactions
+            ):
+                continue
+
+            if "BUY ORDERS" in message.embeds[0].title:
+                self.register_board(message.id, "buyorder")
+            elif "SELL ORDERS" in message.embeds[0].title:
+                self.register_board(message.id, "sellorder")
+
+    def register_board(self, messageID, option, em=None):
+        """Track message as a board of option, saved to self.boardsFile."""
+
+        self.boards[str(messageID)] = {
+            "option": option,
+            "hash": embed_hash(em) if em is not None else None,
+        }
+        self.save_boards()
+
+    def save_boards(self):
+        """Write tracked boards to self.boardsFile."""
+
+        with open(self.boardsFile, "w") as f:
+            json.dump(self.boards, f)
 
     @commands.command(aliases=["RefreshBoard", "Refreshboard"])
     async def refreshboard(self, ctx):
@@ -235,6 +324,9 @@ class Sheets(commands.Cog):
             return
 
         else:
+            # Forget embed hashes so that every board is edited
+            for board in self.boards.values():
+                board["hash"] = None
             self.refresh.restart()
             await self.debugChannel.send("Market blackboard refreshed.")
 
@@ -263,48 +355,22 @@ class Sheets(commands.Cog):
             )
             quantity = "Quantity"
 
-        # Read CSV with pandas
-        df = pd.read_csv(URL, header=2)
+        # Download CSV once, read it with pandas for table and footer
+        csvText = self.fetch_csv(URL)
+        df = pd.read_csv(io.StringIO(csvText), header=2)
 
         # Drop 0 Remaining and nan values
         if option == "buyorder":
             df = df[df["Remaining"] > 0]
             color = 0x3194FF
-            footer = pd.read_csv(URL).iloc[0, 1]
+            footer = pd.read_csv(io.StringIO(csvText)).iloc[0, 1]
         elif option == "sellorder":
             color = 0xF05A57
-            footer = pd.read_csv(URL).iloc[0, 0]
+            footer = pd.read_csv(io.StringIO(csvText)).iloc[0, 0]
 
         # Discord embed
         em = discord.Embed(title=title, description=self.marketURL, colour=color)
 
-        # Tier and enchantment names to remove
-        tierNames = [
-            "Beginner's",
-            "Novice's",
-            "Journeyman's",
-            "Adept's",
-            "Expert's",
-            "Master's",
-            "Grandmaster's",
-            "Elder's",
-            "Beginner",
-            "Novice",
-            "Journeyman",
-            "Adept",
-            "Expert",
-            "Master",
-            "Grandmaster",
-            "Elder",
-            "Stonestream",
-            "Rushwater",
-            "Thunderfall",
-        ]
-        enchantNames = ["Uncommon", "Rare", "Exceptional"]
-
-        # Enchantment labels at end of item ID to know if item has enchantment
-        enchantNumbers = ["@1", "@2", "@3"]
-
         # Express data in columns for Discord embed
         embedItemString = ""
         embedPriceString = ""
@@ -330,11 +396,11 @@ class Sheets(commands.Cog):
                 quality = ""
 
             # Remove tier names and enchantment names if exist
-            if name.split()[0] in tierNames or name.split()[0] in enchantNames:
+            if name.split()[0] in TIER_NAMES or name.split()[0] in ENCHANT_NAMES:
                 name = " ".join(name.split()[1:])
 
             # Add enchantment label to tier if exist
-            if df["Item ID"][i][-2:] in enchantNumbers:
+            if df["Item ID"][i][-2:] in ENCHANT_NUMBERS:
                 tier += "." + df["Item ID"][i][-1]
 
             # Only add tier in front if it is a tier
@@ -359,6 +425,43 @@ class Sheets(commands.Cog):
         em.set_footer(text=f"Updated on: {footer}")
         return em
 
+    def fetch_csv(self, URL):
+        """Download CSV text of URL, reusing the last download if unchanged.
+
+        - Sends If-None-Match/If-Modified-Since from the last response.
+        - A 304 Not Modified response returns the cached text.
+        """
+
+        cached = self.csvCache.get(URL)
+        request = urllib.request.Request(URL)
+        if cached:
+            if cached["etag"]:
+                request.add_header("If-None-Match", cached["etag"])
+            if cached["lastModified"]:
+                request.add_header("If-Modified-Since", cached["lastModified"])
+
+        try:
+            with urllib.request.urlopen(request) as url:
+                text = url.read().decode("utf-8")
+                self.csvCache[URL] = {
+                    "etag": url.headers.get("ETag"),
+                    "lastModified": url.headers.get("Last-Modified"),
+                    "text": text,
+                }
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                return cached["text"]
+            raise
+
+        return text
+
+
+def embed_hash(em):
+    """Returns hash of embed's content, to know if a board changed."""
+
+    content = json.dumps(em.to_dict(), sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
 
 def setup(client):
     client.add_cog(Sheets(client))
@@ -1,5 +1,8 @@
 import discord
 from discord.ext import commands
+import asyncio
+import json
+import time
 
 
 class Talk(commands.Cog):
@@ -21,10 +24,15 @@ class Talk(commands.Cog):
             Sends a welcome message to specific user. (Uses user ID)
         - send_info_all
             Sends a welcome message to existing member who have self.memberRoles role.
+            Runs in the background, and can be resumed after a restart.
+        - broadcast_resume, broadcast_status, broadcast_cancel
+            Resume, check or stop the send_info_all broadcast.
 
     Functions:
         - welcome_message
             - Returns the welcome message for members.
+        - run_broadcast
+            - Sends the broadcast DMs concurrently, within rate limits.
     """
 
     def __init__(self, client):
@@ -39,6 +47,24 @@ class Talk(commands.Cog):
         # The channel to send welcome message
         self.generalChannel = client.get_channel(12345678)
 
+        # Broadcast (send_info_all) settings
+        # DMs sent at a time, seconds between starting DMs, and how often to save
+        self.broadcastConcurrency = 3
+        self.broadcastInterval = 0.5
+        self.broadcastSaveEvery = 20
+
+        # Progress of current broadcast, so that it can be resumed
+        # Pending member IDs are a set, so each send removes its member in O(1)
+        self.broadcastFile = "broadcast.json"
+        try:
+            with open(self.broadcastFile) as f:
+                self.broadcast = json.load(f)
+        except (OSError, ValueError):
+            self.broadcast = None
+        if self.broadcast:
+            self.broadcast["pending"] = set(self.broadcast["pending"])
+        self.broadcastTask = None
+
     @commands.Cog.listener()
     async def on_member_join(self, member):
         """Send a welcome message on self.generalChannel when someone joined."""
@@ -119,7 +145,11 @@ class Talk(commands.Cog):
 
     @commands.command()
     async def send_info_all(self, ctx):
-        """Send direct message to all members."""
+        """Send direct message to all members, as a background job.
+
+        - Recipients are members with a role in self.memberRoles.
+        - Progress is saved to self.broadcastFile, see broadcast_resume.
+        """
 
         # Enable/Disable debug message here
         # await self.debugChannel.send(f'{ctx.author} -> send_info')
@@ -128,28 +158,171 @@ class Talk(commands.Cog):
         if str(ctx.author) not in self.adminUsers:
             return
 
-        # Get direct messages
-        message = self.welcome_message()
+        if self.broadcast and self.broadcast["pending"]:
+            await ctx.send(
+                "A broadcast is not finished yet. Use `broadcast_resume` or `broadcast_cancel`."
+            )
+            return
 
-        sentto = ""
-        errorUsers = ""
+        guild = self.client.guilds[0]
+
+        # Role names -> role IDs once, then a set lookup per member
+        memberRoleIDs = {
+            role.id for role in guild.roles if str(role) in self.memberRoles
+        }
+        recipients = [
+            member.id
+            for member in guild.members
+            if any(role.id in memberRoleIDs for role in member.roles)
+        ]
+
+        self.broadcast = {
+            "guild": guild.id,
+            "channel": ctx.channel.id,
+            "message": self.welcome_message(),
+            "pending": set(recipients),
+            "sent": [],
+            "failed": [],
+        }
+        self.save_broadcast()
+
+        await ctx.send(f"Sending to {len(recipients)} members in the background.")
+        self.start_broadcast()
 
-        # Only send to members who have Member role
-        for member in self.client.guilds[0].members:
-            roles = [str(role) for role in member.roles]
-            if set(roles) & set(self.memberRoles):
-                try:
-                    await member.send(message)
-                    sentto += str(member.name) + ", "
-                except:
-                    errorUsers += str(member.name) + ", "
+    @commands.command()
+    async def broadcast_resume(self, ctx):
+        """Resume an unfinished broadcast, e.g. after a restart."""
 
-        """Enable/Disable debug message here
-        await self.debugChannel.send(f'Welcome messages sent to {sentto}')
-        await self.debugChannel.send(
-            f'Welcome messages failed to send to {errorUsers}')
+        # Only callable for admins
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if not self.broadcast or not self.broadcast["pending"]:
+            await ctx.send("There is no broadcast to resume.")
+            return
+
+        await ctx.send(f"Resuming, {len(self.broadcast['pending'])} members left.")
+        self.start_broadcast()
+
+    @commands.command()
+    async def broadcast_status(self, ctx):
+        """Show progress of the current broadcast."""
+
+        # Only callable for admins
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if not self.broadcast:
+            await ctx.send("There is no broadcast.")
+            return
+
+        running = self.broadcastTask is not None and not self.broadcastTask.done()
+        await ctx.send(
+            f"Sent: {len(self.broadcast['sent'])}, "
+            f"Failed: {len(self.broadcast['failed'])}, "
+            f"Pending: {len(self.broadcast['pending'])}, "
+            f"{'Running' if running else 'Stopped'}"
+        )
+
+    @commands.command()
+    async def broadcast_cancel(self, ctx):
+        """Stop the current broadcast and forget its progress."""
+
+        # Only callable for admins
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if self.broadcastTask is not None:
+            self.broadcastTask.cancel()
+        self.broadcast = None
+        self.save_broadcast()
+
+        await ctx.send("Broadcast cancelled.")
+
+    def start_broadcast(self):
+        """Start run_broadcast as a background task, if not already running."""
+
+        if self.broadcastTask is None or self.broadcastTask.done():
+            self.broadcastTask = self.client.loop.create_task(self.run_broadcast())
+
+    async def run_broadcast(self):
+        """Send self.broadcast's message to its pending members.
+
+        - At most self.broadcastConcurrency DMs at a time,
+            and at most one DM started every self.broadcastInterval seconds.
+        - Progress is saved every self.broadcastSaveEvery DMs.
+        - Sends a report with throughput and failures when done.
         """
 
+        broadcast = self.broadcast
+        guild = self.client.get_guild(broadcast["guild"])
+        semaphore = asyncio.Semaphore(self.broadcastConcurrency)
+        started = time.monotonic()
+        count = 0
+
+        async def send(memberID):
+            nonlocal count
+
+            async with semaphore:
+                try:
+                    member = guild.get_member(memberID) if guild else None
+                    if member is None:
+                        member = await self.client.fetch_user(memberID)
+                    await member.send(broadcast["message"])
+                    broadcast["sent"].append(memberID)
+                except Exception:
+                    broadcast["failed"].append(memberID)
+
+            broadcast["pending"].discard(memberID)
+            count += 1
+            if count % self.broadcastSaveEvery == 0:
+                self.save_broadcast()
+
+        # Start sends spaced out by broadcastInterval
+        sends = []
+        try:
+            for memberID in list(broadcast["pending"]):
+                sends.append(self.client.loop.create_task(send(memberID)))
+                await asyncio.sleep(self.broadcastInterval)
+
+            await asyncio.gather(*sends)
+        except asyncio.CancelledError:
+            # Sends already started would keep going otherwise
+            for task in sends:
+                task.cancel()
+            raise
+        finally:
+            self.save_broadcast()
+
+        # Report
+        elapsed = time.monotonic() - started
+        failedNames = []
+        for memberID in broadcast["failed"]:
+            member = guild.get_member(memberID) if guild else None
+            failedNames.append(str(member.name) if member else str(memberID))
+
+        report = (
+            f"Welcome messages sent to {len(broadcast['sent'])} members, "
+            f"{len(broadcast['failed'])} failed, "
+            f"in {elapsed:.0f}s ({count / elapsed if elapsed else 0:.1f} DMs/s)."
+        )
+        if failedNames:
+            report += "\nFailed: " + ", ".join(failedNames)
+
+        channel = self.client.get_channel(broadcast["channel"]) or self.debugChannel
+        await channel.send(report[:2000])
+
+    def save_broadcast(self):
+        """Write self.broadcast to self.broadcastFile."""
+
+        # JSON has no sets, pending is saved as a list
+        broadcast = self.broadcast
+        if broadcast is not None:
+            broadcast = {**broadcast, "pending": list(broadcast["pending"])}
+
+        with open(self.broadcastFile, "w") as f:
+            json.dump(broadcast, f)
+
     def welcome_message(self):
 
         # Message to send
@@ -0,0 +1,515 @@
+import discord
+from discord.ext import commands, tasks
+import asyncio
+import datetime as DT
+import calendar
+import configparser
+import os
+import numpy as np
+
+from helpers import admission, cooldown, warmstart
+from helpers.bulk import chunk_ids, fetch_all
+from helpers.catalog import load_catalog
+from helpers.digest import change_since, price_changes, top_movers
+from helpers.pages import field_value
+from helpers.records import (
+    LOCATION_LABELS,
+    LOCATION_QUERY,
+    LOCATIONS,
+    location_code,
+    parse_history,
+    parse_prices,
+)
+from helpers.settings import WatchLists
+from helpers.snapshot import SnapshotStore
+
+
+class Digest(commands.Cog):
+    """Cog that builds a daily market digest off-peak, and keeps it cached.
+
+    Commands:
+        - digest
+            Show the last digest, with this server's watch list. No API calls.
+        - watch
+            List, add or remove items on this server's watch list.
+
+    Tasks:
+        - post
+            Build the digest of every server in one batched pass,
+            and post it to the digest channels.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        # Load config.ini and get configs
+        currentPath = os.path.dirname(os.path.realpath(__file__))
+        configs = configparser.ConfigParser()
+        configs.read(os.path.dirname(currentPath) + "/config.ini")
+
+        debugChannel = int(configs["Channels"]["debugChannelID"])
+        workChannel = [
+            int(ID) for ID in configs["Channels"]["workChannelID"].split(", ")
+        ]
+        self.debugChannel = client.get_channel(debugChannel)
+        self.workChannel = workChannel
+
+        self.onlyWork = configs["General"].getboolean("onlyWork")
+        self.debug = configs["General"].getboolean("debug")
+        self.adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
+
+        # Digest settings
+        self.hourUTC = configs["Digest"].getint("hourUTC")
+        self.channelIDs = [
+            int(ID) for ID in configs["Digest"]["channelIDs"].split(", ") if int(ID)
+        ]
+        self.location = location_code(configs["Digest"]["location"])
+        self.hotItems = configs["Digest"].getint("hotItems")
+        self.topMovers = configs["Digest"].getint("topMovers")
+        self.watchMax = configs["Digest"].getint("watchMax")
+        self.chunkSize = configs["Digest"].getint("chunkSize")
+        self.concurrency = configs["Digest"].getint("concurrency")
+
+        # API URLs
+        self.historyURL = "https://www.albion-online-data.com/api/v2/stats/charts/"
+        self.pricesURL = "https://www.albion-online-data.com/api/v2/stats/prices/"
+        self.goldURL = "https://www.albion-online-data.com/api/v2/stats/gold?date="
+
+        # Items watched by each server
+        self.watchLists = WatchLists(
+            os.path.join(os.path.dirname(currentPath), configs["Digest"]["watchFile"])
+        )
+
+        # Most asked for items are picked from the prices snapshot
+        # Watched items' prices fetched for the digest are saved to it too
+        self.snapshot = SnapshotStore(
+            os.path.join(
+                os.path.dirname(currentPath), configs["Snapshot"]["databaseFile"]
+            )
+        )
+
+        # Same item catalog as the prices cog (shared memory-mapped file)
+        self.itemList = "https://raw.githubusercontent.com/broderickhyman/ao-bin-dumps/master/formatted/items.json"
+        catalogFile = os.path.join(
+            os.path.dirname(currentPath), configs["Catalog"]["catalogFile"]
+        )
+        try:
+            self.catalog = load_catalog(
+                catalogFile, self.itemList, configs["Catalog"].getfloat("maxAgeHours")
+            )
+        except Exception as e:
+            print(e)
+
+        # Last digest, built by post() or by the first 'digest' command
+        # The lock makes concurrent callers share one build
+        # A digest of the last run is kept if it is less than a day old
+        self.report = None
+        self.lock = asyncio.Lock()
+        warmstart.register("digest", lambda: self.report, self.load_report)
+
+        if configs["Digest"].getboolean("enabled"):
+            self.post.start()
+
+    def cog_unload(self):
+        self.post.cancel()
+
+    async def cog_before_invoke(self, ctx):
+        # Admission control, sheds the command with Busy if too many are running
+        await admission.admit(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        admission.release(ctx)
+
+    async def cog_command_error(self, ctx, error):
+        # Shed by admission control, whichever command of this cog it was
+        if isinstance(error, admission.Busy):
+            await ctx.send("Busy right now, please try again in a bit.")
+
+    async def build(self):
+        """Build the digest of every server in one batched pass.
+
+        - Items are the self.hotItems most asked for and every watched item.
+        - History requests (digest city only, 2 days), price requests of
+            watched items (all cities) and the gold request all run together,
+            self.chunkSize item IDs per request.
+        - Returns report dict, shown by digest_embed.
+        """
+
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+        today = DT.datetime.utcnow()
+
+        watched = self.watchLists.all_items()
+        # SQLite waits for the snapshot's lock, so off the event loop
+        loop = self.client.loop
+        hot = await loop.run_in_executor(
+            None, self.snapshot.hot_items, self.hotItems, now - 7 * 86400
+        )
+        itemIDs = list(dict.fromkeys(hot + watched))
+        itemCodes = {itemID: i for (i, itemID) in enumerate(itemIDs)}
+
+        historyQuery = (
+            "?date="
+            + (today - DT.timedelta(days=2)).strftime("%m-%d-%Y")
+            + "&locations="
+            + LOCATIONS[self.location].replace(" ", "")
+            + "&time-scale=1"
+        )
+        historyChunks = chunk_ids(
+            itemIDs, self.chunkSize, len(self.historyURL) + len(historyQuery)
+        )
+        historyURLs = [
+            self.historyURL + ",".join(chunk) + historyQuery for chunk in historyChunks
+        ]
+
+        # All cities, so that the snapshot gets whole items
+        pricesQuery = "?locations=" + LOCATION_QUERY
+        priceChunks = chunk_ids(
+            watched, self.chunkSize, len(self.pricesURL) + len(pricesQuery)
+        )
+        priceURLs = [
+            self.pricesURL + ",".join(chunk) + pricesQuery for chunk in priceChunks
+        ]
+
+        goldURL = self.goldURL + (today - DT.timedelta(days=7)).strftime("%m-%d-%Y")
+
+        results = await fetch_all(historyURLs + priceURLs + [goldURL], self.concurrency)
+        historyResults = results[: len(historyURLs)]
+        priceResults = results[len(historyURLs) : -1]
+        gold = results[-1]
+
+        # Price changes of every item at once
+        history = parse_history(
+            [series for result in historyResults if result for series in result],
+            itemCodes,
+        )
+        (recent, previous) = price_changes(history, len(itemIDs), self.location, now)
+        movers = [
+            (itemIDs[code], previous[code], recent[code])
+            for code in top_movers(recent, previous, self.topMovers)
+        ]
+
+        # Lowest sell order of watched items in the digest city
+        sellPrices = {}
+        for (chunk, result) in zip(priceChunks, priceResults):
+            if result is None:
+                continue
+
+            records = parse_prices(result)
+            await loop.run_in_executor(None, self.snapshot.put, chunk, records, now)
+            for record in records:
+                if (
+                    record.location == self.location
+                    and record.quality <= 1
+                    and record.sellPriceMin
+                ):
+                    sellPrices[record.item] = min(
+                        record.sellPriceMin,
+                        sellPrices.get(record.item, record.sellPriceMin),
+                    )
+
+        items = {
+            itemID: (
+                sellPrices.get(itemID),
+                recent[itemCodes[itemID]],
+                previous[itemCodes[itemID]],
+            )
+            for itemID in watched
+        }
+
+        # Gold, latest price and its change over a day and a week
+        goldTrend = None
+        if gold:
+            timestamps = np.array(
+                [entry["timestamp"][:19] for entry in gold], dtype="datetime64[s]"
+            ).astype("int64")
+            prices = np.array([entry["price"] for entry in gold], dtype="f8")
+            order = np.argsort(timestamps, kind="stable")
+            (timestamps, prices) = (timestamps[order], prices[order])
+
+            (latest, dayChange) = change_since(timestamps, prices, 86400)
+            (_, weekChange) = change_since(timestamps, prices, 7 * 86400)
+            goldTrend = (latest, dayChange, weekChange)
+
+        return {
+            "builtAt": now,
+            "movers": movers,
+            "items": items,
+            "gold": goldTrend,
+            "requests": len(results),
+            "failed": results.count(None),
+        }
+
+    def load_report(self, report, downtime):
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+        if now - report["builtAt"] < 86400:
+            self.report = report
+
+    async def get_report(self):
+        """Returns the last digest, built now if there is none yet."""
+
+        async with self.lock:
+            if self.report is None:
+                self.report = await self.build()
+
+        return self.report
+
+    def guild_locale(self, guildID):
+        """Returns locale of server, if the prices cog is loaded."""
+
+        fetchPrice = self.client.get_cog("FetchPrice")
+        if fetchPrice is None:
+            return "EN-US"
+        return fetchPrice.locales.get(None, guildID)
+
+    def item_name(self, itemID, locale):
+        row = self.catalog.index(itemID)
+        return self.catalog.name(row, locale) if row is not None else itemID
+
+    def digest_embed(self, report, guildID, locale):
+        """Returns Discord embed of report, with the watch list of server."""
+
+        city = LOCATION_LABELS[self.location]
+        em = discord.Embed(
+            title=":newspaper: Market Digest :newspaper:",
+            colour=discord.Colour.gold(),
+        )
+
+        # Top movers, over the last 24 hours
+        lines = [
+            f"**{self.item_name(itemID, locale)}** ({itemID})\n"
+            f"{previous:,.0f} \u2192 {recent:,.0f} ({recent / previous - 1:+.1%})"
+            for (itemID, previous, recent) in report["movers"]
+        ]
+        em.add_field(
+            name=f"Top Movers in {city} (24h average)",
+            value=field_value(lines) or "No data.",
+            inline=False,
+        )
+
+        # Gold trend
+        if report["gold"] is not None:
+            (latest, dayChange, weekChange) = report["gold"]
+            em.add_field(
+                name="Gold",
+                value=f"{latest:,.0f} ({dayChange:+.1%} 24h, {weekChange:+.1%} 7d)",
+                inline=False,
+            )
+
+        # Server's watch list, items added after the build are not in it yet
+        watched = self.watchLists.get(guildID) if guildID is not None else []
+        if watched:
+            lines = []
+            for itemID in watched:
+                name = self.item_name(itemID, locale)
+                if itemID not in report["items"]:
+                    lines.append(f"**{name}**: in the next digest")
+                    continue
+
+                (sellPrice, recent, previous) = report["items"][itemID]
+                line = f"**{name}**: " + (
+                    f"{sellPrice:,d}" if sellPrice is not None else "no sell orders"
+                )
+                if np.isfinite(recent) and np.isfinite(previous) and previous:
+                    line += f" ({recent / previous - 1:+.1%} 24h)"
+                lines.append(line)
+
+            em.add_field(
+                name=f"Watch List ({city})", value=field_value(lines), inline=False
+            )
+
+        builtAgo = round(
+            (calendar.timegm(DT.datetime.utcnow().timetuple()) - report["builtAt"]) / 60
+        )
+        em.set_footer(
+            text=f"Built {builtAgo} mins ago. React with \u274c to delete this post."
+        )
+
+        return em
+
+    @tasks.loop(hours=24)
+    async def post(self):
+        """Build the digest, and post it to every digest channel.
+
+        - If the build fails, the last digest is kept and nothing is posted.
+        """
+
+        started = DT.datetime.utcnow()
+
+        # An error would end the loop, so only this digest is skipped
+        try:
+            async with self.lock:
+                self.report = await self.build()
+        except Exception as e:
+            print(e)
+            if self.debugChannel is not None:
+                await self.debugChannel.send(f"Digest | Build failed: {e!r}"[:2000])
+            return
+
+        for channelID in self.channelIDs:
+            channel = self.client.get_channel(channelID)
+            if channel is None:
+                continue
+
+            guild = getattr(channel, "guild", None)
+            guildID = guild.id if guild is not None else None
+            try:
+                await channel.send(
+                    embed=self.digest_embed(
+                        self.report, guildID, self.guild_locale(guildID)
+                    )
+                )
+            except discord.HTTPException as e:
+                print(e)
+
+        if self.debug:
+            seconds = (DT.datetime.utcnow() - started).total_seconds()
+            await self.debugChannel.send(
+                f"Digest | {self.report['requests']} requests, "
+                f"{self.report['failed']} failed, {seconds:.0f}s"
+            )
+
+    @post.before_loop
+    async def before_post(self):
+        await self.client.wait_until_ready()
+
+        # First digest at hourUTC, then every 24 hours
+        now = DT.datetime.utcnow()
+        first = now.replace(hour=self.hourUTC, minute=0, second=0, microsecond=0)
+        if first <= now:
+            first += DT.timedelta(days=1)
+        await asyncio.sleep((first - now).total_seconds())
+
+    @commands.command()
+    async def digest(self, ctx):
+        """Show the last market digest.
+
+        - Usage: <commandPrefix> digest
+        - Top movers, gold trend, and this server's watch list.
+        - Answered from the cached digest, built off-peak.
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content}")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        retryAfter = cooldown.charge(ctx, cooldown.cost("digest"))
+        if retryAfter:
+            await ctx.send(f"Slow down! Try again in {retryAfter:.0f}s.")
+            return
+
+        if self.report is None:
+            await ctx.channel.trigger_typing()
+        report = await self.get_report()
+
+        guildID = ctx.guild.id if ctx.guild else None
+        msg = await ctx.send(
+            embed=self.digest_embed(report, guildID, self.guild_locale(guildID))
+        )
+        await msg.add_reaction("\u274c")
+
+    @commands.group(invoke_without_command=True)
+    async def watch(self, ctx):
+        """List items on this server's watch list.
+
+        - Usage: <commandPrefix> watch [add/remove <item name>]
+        - Watched items' prices are in the digest.
+        """
+
+        if ctx.guild is None:
+            await ctx.send("Watch lists are per server.")
+            return
+
+        locale = self.guild_locale(ctx.guild.id)
+        watched = self.watchLists.get(ctx.guild.id)
+        if not watched:
+            await ctx.send("No watched items, add one with `watch add <item name>`.")
+            return
+
+        await ctx.send(
+            "Watched items:\n"
+            + "\n".join(
+                f"{self.item_name(itemID, locale)} ({itemID})" for itemID in watched
+            )
+        )
+
+    def can_edit_watch(self, ctx):
+        return ctx.guild is not None and (
+            ctx.author.guild_permissions.manage_guild
+            or str(ctx.author) in self.adminUsers
+        )
+
+    def match_item(self, item, locale):
+        """Returns (name, ID) of closest item, None if not found.
+
+        - Uses the prices cog's matching if loaded, else item IDs only.
+        """
+
+        fetchPrice = self.client.get_cog("FetchPrice")
+        if fetchPrice is not None:
+            (itemNames, itemIDs) = fetchPrice.items_match([item], locale)
+            return itemNames[0], itemIDs[0]
+
+        if self.catalog.index(item.upper()) is None:
+            return None
+        return self.item_name(item.upper(), locale), item.upper()
+
+    @watch.command(name="add")
+    async def watch_add(self, ctx, *, item):
+        """Add an item to this server's watch list (needs Manage Server)."""
+
+        if not self.can_edit_watch(ctx):
+            await ctx.send("You need the Manage Server permission to do that.")
+            return
+
+        if len(self.watchLists.get(ctx.guild.id)) >= self.watchMax:
+            await ctx.send(f"At most {self.watchMax} items can be watched.")
+            return
+
+        match = self.match_item(item, self.guild_locale(ctx.guild.id))
+        if match is None:
+            await ctx.send("Item not found.")
+            return
+
+        (itemName, itemID) = match
+        self.watchLists.add(ctx.guild.id, itemID)
+        await ctx.send(f"Watching {itemName} ({itemID}).")
+
+    @watch.command(name="remove")
+    async def watch_remove(self, ctx, *, item):
+        """Remove an item from this server's watch list (needs Manage Server)."""
+
+        if not self.can_edit_watch(ctx):
+            await ctx.send("You need the Manage Server permission to do that.")
+            return
+
+        # Exact IDs first, so any watched item can be removed
+        itemID = item.strip().upper()
+        if itemID not in self.watchLists.get(ctx.guild.id):
+            match = self.match_item(item, self.guild_locale(ctx.guild.id))
+            itemID = match[1] if match is not None else None
+
+        if itemID is None or not self.watchLists.remove(ctx.guild.id, itemID):
+            await ctx.send("That item is not watched.")
+            return
+
+        await ctx.send(f"Stopped watching {itemID}.")
+
+    # Error messages
+    @watch_add.error
+    async def watch_add_error(self, ctx, error):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send("Please specify item.")
+
+    @watch_remove.error
+    async def watch_remove_error(self, ctx, error):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send("Please specify item.")
+
+
+def setup(client):
+    client.add_cog(Digest(client))
@@ -6,7 +6,14 @@ import datetime as DT
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import configparser
+import io
 import os
+import time
+import numpy as np
+
+from helpers import admission, cachemanager, cooldown
+from helpers.chartcache import chart_cache, chart_key, renderer
+from helpers.rolling import rolling_store
 
 
 class FetchGold(commands.Cog):
@@ -35,9 +42,52 @@ class FetchGold(commands.Cog):
         self.onlyWork = configs["General"].getboolean("onlyWork")
         self.debug = configs["General"].getboolean("debug")
 
+        # Concurrency limits of commands, see helpers/admission.py
+        admission.configure(configs["Admission"])
+
+        # Per user/channel/guild quotas, see helpers/cooldown.py
+        cooldown.configure(configs["Cooldowns"])
+
+        # Memory budget shared by all caches, see helpers/cachemanager.py
+        cachemanager.configure(configs["CacheBudget"])
+
+        # Rendered plots, reused when the plotted data has not changed
+        self.charts = chart_cache(
+            configs["Charts"].getfloat("cacheMegabytes") * 2 ** 20,
+            os.path.join(os.path.dirname(currentPath), configs["Charts"]["directory"])
+            if configs["Charts"]["directory"]
+            else None,
+            configs["Charts"].getfloat("directoryMegabytes") * 2 ** 20,
+        )
+
+        # Rolling statistics of gold prices (helpers/rolling.py)
+        # Only points newer than the last fetch are added
+        self.rollingHours = configs["Rolling"].getfloat("windowHours")
+        self.bandWidth = configs["Rolling"].getfloat("bandWidth")
+        self.rolling = rolling_store(
+            "gold",
+            self.rollingHours * 3600,
+            configs["Rolling"].getfloat("emaHours") * 3600,
+            configs["Rolling"].getint("goldKeepPoints"),
+            1,
+            configs["Rolling"].getfloat("maxMegabytes") * 2 ** 20,
+        )
+
         # API URLs
         self.goldURL = "https://www.albion-online-data.com/api/v2/stats/gold?date="
 
+    async def cog_before_invoke(self, ctx):
+        # Admission control, sheds the command with Busy if too many are running
+        await admission.admit(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        admission.release(ctx)
+
+    async def cog_command_error(self, ctx, error):
+        # Shed by admission control, whichever command of this cog it was
+        if isinstance(error, admission.Busy):
+            await ctx.send("Busy right now, please try again in a bit.")
+
     @commands.command()
     async def gold(self, ctx, *, days):
 
@@ -57,7 +107,19 @@ class FetchGold(commands.Cog):
             numDays = int(days)
         except:
             await ctx.send("Please enter a single number.")
+            return
 
+        if numDays < 1:
+            await ctx.send("Please enter at least 1 day.")
+            return
+
+        # Spend quota, longer windows cost more
+        retryAfter = cooldown.charge(
+            ctx, cooldown.cost("gold") + cooldown.cost("goldPerWeek", 0) * numDays / 7
+        )
+        if retryAfter:
+            await ctx.send(f"Slow down! Try again in {retryAfter:.0f}s.")
+            return
 
         # Get date of past numDays
         today = DT.datetime.utcnow()
@@ -74,19 +136,20 @@ class FetchGold(commands.Cog):
         )
 
         # Extracting latest gold prices and timestamps
+        goldPrices = []
+        timeStamps = []
         try:
             if data == []:
                 raise Exception
 
             # Get data in a list
-            goldPrices = []
-            timeStamps = []
+            # Both appended together, so they stay the same length on errors
             for (i, price) in enumerate(data):
-                goldPrices.append(price["price"])
                 timeStamp = DT.datetime.strptime(
                     price["timestamp"], "%Y-%m-%dT%H:%M:%S"
                 )
                 timeStamps.append(timeStamp)
+                goldPrices.append(price["price"])
 
             # Format data for Discord embed for past 6 hours data
             embedGoldPriceString = ""
@@ -110,26 +173,39 @@ class FetchGold(commands.Cog):
             )
 
         finally:
-            # Plot the data
-            plt.style.use("seaborn")
-            plt.figure(figsize=(9, 5))
-
-            # Settings for date xaxis
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%m/%d/%Y"))
-            plt.gca().xaxis.set_major_locator(mdates.AutoDateLocator())
+            # Rolling statistics, gold has no volume so no VWAP
+            # Outside the try above, so that a failure here is not 'no data'
+            stats = self.rolling.feed("gold", timeStamps, goldPrices)
+            if stats is not None:
+                (lower, upper) = stats.bands(self.bandWidth)
+                em.add_field(
+                    name=f"{self.rollingHours:g}h Average",
+                    value=f"SMA {stats.sma:,.0f}\nEMA {stats.ema:,.0f}\n"
+                    f"Band {lower:,.0f} - {upper:,.0f}",
+                    inline=False,
+                )
 
-            plt.plot(timeStamps, goldPrices, ".-", color="goldenrod")
+            # Rolling SMA and bands over the plotted days
+            values = stats.history() if stats is not None else None
+            if values is not None and timeStamps:
+                values = values[values["timestamp"] >= np.datetime64(timeStamps[0])]
 
-            plt.gcf().autofmt_xdate()
-            plt.title(f"Past {numDays} Days Gold Prices")
-            plt.xlabel("Dates")
-            plt.ylabel("Prices")
-            plt.savefig("goldplot.png", bbox_inches="tight")
-            plt.close("all")
+            # Plot the data, reusing the plot if the data has not changed
+            key = chart_key(
+                "gold", numDays, *[str(t) for t in timeStamps], *goldPrices, values
+            )
+            # Plotted by the render thread, so the event loop is not blocked
+            png = self.charts.get(key)
+            if png is None:
+                started = time.perf_counter()
+                png = await self.client.loop.run_in_executor(
+                    renderer(), self.plot_gold, timeStamps, goldPrices, values, numDays
+                )
+                self.charts.put(key, png, time.perf_counter() - started)
 
             # \u274c is a red X
             em.set_footer(text="React with \u274c to delete this post.")
-            plotFile = discord.File("./goldplot.png", filename="goldplot.png")
+            plotFile = discord.File(io.BytesIO(png), filename="goldplot.png")
 
             msg = await ctx.send(embed=em, file=plotFile)
 
@@ -141,6 +217,52 @@ class FetchGold(commands.Cog):
                     f"{ctx.message.content} | Gold Matched"
                 )
 
+    def plot_gold(self, timeStamps, goldPrices, values, numDays):
+        """Plot gold prices, returns PNG bytes.
+
+        - values is a ROLLING_DTYPE array of the plotted days (or None), its
+            SMA and bands are drawn over the prices.
+        """
+
+        plt.style.use("seaborn")
+        plt.figure(figsize=(9, 5))
+
+        # Settings for date xaxis
+        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%m/%d/%Y"))
+        plt.gca().xaxis.set_major_locator(mdates.AutoDateLocator())
+
+        plt.plot(timeStamps, goldPrices, ".-", color="goldenrod")
+
+        if values is not None and len(values):
+            plt.plot(
+                values["timestamp"].astype(object),
+                values["sma"],
+                "--",
+                color="darkgoldenrod",
+                linewidth=1,
+                label=f"{self.rollingHours:g}h SMA",
+            )
+            plt.fill_between(
+                values["timestamp"].astype(object),
+                values["sma"] - self.bandWidth * values["std"],
+                values["sma"] + self.bandWidth * values["std"],
+                color="goldenrod",
+                alpha=0.15,
+                label=f"\u00b1{self.bandWidth:g} std",
+            )
+            plt.legend()
+
+        plt.gcf().autofmt_xdate()
+        plt.title(f"Past {numDays} Days Gold Prices")
+        plt.xlabel("Dates")
+        plt.ylabel("Prices")
+
+        plot = io.BytesIO()
+        plt.savefig(plot, format="png", bbox_inches="tight")
+        plt.close("all")
+
+        return plot.getvalue()
+
     # Error message of gold
     @gold.error
     async def gold_error(self, ctx, error):
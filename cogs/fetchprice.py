@@ -1,15 +1,60 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import urllib.request
 import json
 import datetime as DT
-import statistics
 import difflib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.gridspec as gridspec
 import configparser
+import calendar
+import io
 import os
+import re
+import time
+import numpy as np
+
+from helpers import admission, cachemanager, cooldown
+from helpers.bulk import chunk_ids, fetch_all
+from helpers.catalog import load_catalog
+from helpers.chartcache import chart_cache, chart_key, renderer
+from helpers.pages import chunk_lines, field_value, page_cache, send_paginated
+from helpers.rolling import ROLLING_DTYPE, rolling_store
+from helpers.settings import ScopedSettings
+from helpers.snapshot import SnapshotStore
+from helpers.records import (
+    LOCATIONS,
+    LOCATION_LABELS,
+    LOCATION_QUERY,
+    age_string,
+    history_series,
+    parse_history,
+    parse_prices,
+)
+
+# Location codes of the 6 main cities, in plotting order
+MAIN_CITIES = [3, 2, 4, 5, 6, 9]
+
+
+def now_timestamp():
+    """Returns current UTC time as epoch seconds."""
+
+    return calendar.timegm(DT.datetime.utcnow().timetuple())
+
+
+def city_code(name):
+    """Returns location code of a city name, None if not a city.
+
+    - Case, spaces and apostrophes are ignored, e.g. 'fort sterling',
+        'FortSterling' and "arthur's rest" all work.
+    """
+
+    key = name.replace("'", "").replace(" ", "").lower()
+    for (code, label) in enumerate(LOCATION_LABELS):
+        if label.replace("'", "").replace(" ", "").lower() == key:
+            return code
+    return None
 
 
 class FetchPrice(commands.Cog):
@@ -21,15 +66,42 @@ class FetchPrice(commands.Cog):
             Also send plot of 7 days historical prices.
                 - quick (part of prices)
                     Same as prices command but without plots (faster).
+        - locale
+            Show or set language of item names, per user or per server.
+        - lookup
+            List items starting with a prefix, without any API calls.
+        - compare
+            Plot 7 days historical prices of a few items in one city.
 
     Functions:
+        - fetch_prices(item)
+            Get item's current prices as a list of PriceRecord.
+        - add_price_fields(em, records)
+            Add sell/buy order columns of PriceRecord to embed.
         - item_match(item)
             Find closest matching item name/ID of input item.
-            Uses difflib.
-            Returns first 4 closest match.
+            Uses difflib over the columns of the item catalog.
+            Returns first count (default 4) closest match.
+        - items_match(inputWords)
+            Closest match of each input, scored in one pass.
+        - fetch_history(item)
+            Get item's 7 days historical prices as a structured array.
+        - current_prices(item)
+            Get item's current prices from snapshot, or live if not in snapshot.
         - grabHistory(item)
             Get item's 7 days historical prices for all cities.
-            Plots them out to 'plot.png'.
+            Returns plot as PNG bytes, reusing cached plots of the same data.
+        - attach_history(ctx, msg, em, item, itemName)
+            Plot item's history and add it to an already sent price embed.
+        - add_stats_field(em, item)
+            Add rolling SMA/EMA/VWAP and bands of item's main cities to embed.
+        - grabComparison(itemIDs, itemNames, location)
+            Get several items' 7 days historical prices in one city, in one request.
+            Returns overlaid plot as PNG bytes.
+
+    Tasks:
+        - ingest
+            Refresh snapshot of current prices in bulk.
     """
 
     def __init__(self, client):
@@ -55,22 +127,128 @@ class FetchPrice(commands.Cog):
 
         # Latest
         self.apiURL = "https://www.albion-online-data.com/api/v2/stats/prices/"
-        self.locationURL = "?locations=Caerleon,Lymhurst,Martlock,Bridgewatch,FortSterling,Thetford,ArthursRest,MerlynsRest,MorganasRest,BlackMarket"
+        self.locationURL = "?locations=" + LOCATION_QUERY
         # Historical
         self.historyURL = "https://www.albion-online-data.com/api/v2/stats/charts/"
-        self.historyLocationURL = "&locations=Thetford,Martlock,Caerleon,Lymhurst,Bridgewatch,FortSterling,ArthursRest,MerlynsRest,MorganasRest,BlackMarket"
+        self.historyLocationURL = "&locations=" + LOCATION_QUERY
+
+        self.adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
+
+        # Locale used to search and show item names, per user or per guild
+        self.locales = ScopedSettings(
+            os.path.join(
+                os.path.dirname(currentPath), configs["Locale"]["settingsFile"]
+            ),
+            configs["Locale"]["defaultLocale"],
+        )
 
         # Bot will search items through this list
         # There are also different localization names
         self.itemList = "https://raw.githubusercontent.com/broderickhyman/ao-bin-dumps/master/formatted/items.json"
 
-        # Open list of items
+        # Open list of items as a memory-mapped columnar catalog
+        # The catalog file is only rebuilt from itemList when it is too old
+        catalogFile = os.path.join(
+            os.path.dirname(currentPath), configs["Catalog"]["catalogFile"]
+        )
+        maxAgeHours = configs["Catalog"].getfloat("maxAgeHours")
         try:
-            with urllib.request.urlopen(self.itemList) as url:
-                self.itemData = json.loads(url.read().decode())
+            self.catalog = load_catalog(catalogFile, self.itemList, maxAgeHours)
         except Exception as e:
             print(e)
 
+        # Concurrency limits of commands, see helpers/admission.py
+        admission.configure(configs["Admission"])
+
+        # Per user/channel/guild quotas, see helpers/cooldown.py
+        cooldown.configure(configs["Cooldowns"])
+
+        # Memory budget shared by all caches, see helpers/cachemanager.py
+        cachemanager.configure(configs["CacheBudget"])
+
+        # Rendered plots, reused when the plotted data has not changed
+        self.charts = chart_cache(
+            configs["Charts"].getfloat("cacheMegabytes") * 2 ** 20,
+            os.path.join(os.path.dirname(currentPath), configs["Charts"]["directory"])
+            if configs["Charts"]["directory"]
+            else None,
+            configs["Charts"].getfloat("directoryMegabytes") * 2 ** 20,
+        )
+
+        # More suggestions, on pages turned by reactions (see helpers/pages.py)
+        self.pages = page_cache(
+            configs["Pages"].getint("maxMessages"),
+            configs["Pages"].getfloat("ttlMinutes") * 60,
+            configs["Pages"].getfloat("maxMegabytes") * 2 ** 20,
+        )
+        self.suggestionsPerPage = configs["Pages"].getint("suggestionsPerPage")
+        self.suggestionPages = configs["Pages"].getint("suggestionPages")
+
+        # Progressive mode sends prices first, and adds the plot when rendered
+        # Plots are uploaded to chartChannel to show them in the embed
+        self.progressive = configs["Progressive"].getboolean("enabled")
+        chartChannel = int(configs["Progressive"]["chartChannelID"])
+        self.chartChannel = client.get_channel(chartChannel) if chartChannel else None
+
+        # Rolling statistics of each item's history per city (helpers/rolling.py)
+        # Updated with only the new hours every time a history is fetched
+        self.rollingHours = configs["Rolling"].getfloat("windowHours")
+        self.bandWidth = configs["Rolling"].getfloat("bandWidth")
+        self.rolling = rolling_store(
+            "history",
+            self.rollingHours * 3600,
+            configs["Rolling"].getfloat("emaHours") * 3600,
+            configs["Rolling"].getint("keepPoints"),
+            configs["Rolling"].getint("maxSeries"),
+            configs["Rolling"].getfloat("maxMegabytes") * 2 ** 20,
+        )
+
+        # compare plots up to maxItems items, in defaultCity unless one is given
+        self.compareMaxItems = configs["Compare"].getint("maxItems")
+        self.compareLocation = city_code(configs["Compare"]["defaultCity"])
+
+        # Local snapshot of current prices
+        # prices/quick answer from it if it is fresh enough, else fetch live
+        # 'hot' mode refreshes the most asked for items, 'all' every tiered item
+        self.snapshotEnabled = configs["Snapshot"].getboolean("enabled")
+        self.snapshotMode = configs["Snapshot"]["mode"]
+        self.snapshotHotItems = configs["Snapshot"].getint("hotItems")
+        self.snapshotMaxAge = configs["Snapshot"].getfloat("maxAgeMinutes") * 60
+        self.snapshotChunkSize = configs["Snapshot"].getint("chunkSize")
+        self.snapshotConcurrency = configs["Snapshot"].getint("concurrency")
+        self.snapshot = SnapshotStore(
+            os.path.join(
+                os.path.dirname(currentPath), configs["Snapshot"]["databaseFile"]
+            )
+        )
+
+        if self.snapshotEnabled:
+            self.ingest.change_interval(
+                minutes=configs["Snapshot"].getfloat("refreshMinutes")
+            )
+            self.ingest.start()
+
+    def cog_unload(self):
+        self.ingest.cancel()
+
+    async def cog_before_invoke(self, ctx):
+        # Admission control, sheds the command with Busy if too many are running
+        await admission.admit(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        admission.release(ctx)
+
+    async def cog_command_error(self, ctx, error):
+        # Shed by admission control, whichever command of this cog it was
+        # prices has its own gate apart from quick, which it suggests instead
+        if isinstance(error, admission.Busy):
+            if error.name == "prices":
+                await ctx.send(
+                    "Busy right now, try `quick <item>` for prices without the plot."
+                )
+            else:
+                await ctx.send("Busy right now, please try again in a bit.")
+
     @commands.command(
         aliases=["price", "quick",]
     )
@@ -80,6 +258,7 @@ class FetchPrice(commands.Cog):
         - Usage: <commandPrefix> price <item name>
         - Item name can also be its ID
         - Uses difflib for item name recognition.
+        - Only names in the user's locale are searched, add --all to search all.
         - Outputs as Discord Embed with thumbnail.
         - Plots 7 days historical prices.
         """
@@ -96,136 +275,50 @@ class FetchPrice(commands.Cog):
             if ctx.channel.id not in self.workChannel:
                 return
 
+        # Spend quota, quick is cheap since it skips the history and plot
+        isQuick = any(["quick" in c.lower() for c in command[:2]])
+        retryAfter = cooldown.charge(
+            ctx, cooldown.cost("quick" if isQuick else "prices")
+        )
+        if retryAfter:
+            await ctx.send(f"Slow down! Try again in {retryAfter:.0f}s.")
+            return
+
         await ctx.channel.trigger_typing()
 
+        # Search and show names in the user's (or server's) language
+        # '--all' searches names in every language instead (slower)
+        locale = self.locales.get(ctx.author.id, ctx.guild.id if ctx.guild else None)
+        allLocales = "--all" in item.split()
+        if allLocales:
+            item = " ".join(word for word in item.split() if word != "--all")
+
         # difflib for input search
-        itemNames, itemIDs = self.item_match(item)
+        # 3 suggestions are shown, and more on extra pages
+        itemNames, itemIDs = self.item_match(
+            item,
+            locale,
+            allLocales,
+            count=4 + self.suggestionsPerPage * self.suggestionPages,
+        )
 
-        # Grab prices from full URL
-        fullURL = self.apiURL + itemIDs[0] + self.locationURL
-        with urllib.request.urlopen(fullURL) as url:
-            data = json.loads(url.read().decode())
+        # Get prices from snapshot, or grab them live if not in snapshot
+        # SQLite and the live request both block, so they run in a thread
+        records, fetchedAt = await self.client.loop.run_in_executor(
+            None, self.current_prices, itemIDs[0]
+        )
 
         # Create Discord embed
         em = discord.Embed(
             title=f"Current Prices for:\n**{itemNames[0]} ({itemIDs[0]})**"
         )
 
-        # Extracting locations' timestamps and minimum sell order prices
+        # Add locations' timestamps and minimum sell order prices
         try:
-            if data == []:
+            if records == []:
                 raise Exception
 
-            timeStringAll = []
-            timeStringAllBuy = []
-            locationStringAll = []
-            sellPriceMinStringAll = []
-            buyPriceMaxStringAll = []
-
-            for (i, indivData) in enumerate(data):
-
-                # Skip if no data for entry
-                if indivData["sell_price_min"] == 0 and indivData["buy_price_max"] == 0:
-                    continue
-
-                # Convert timestamp to datetime format
-                # And find how long ago is timestamp in seconds
-                timestamp = DT.datetime.strptime(
-                    indivData["sell_price_min_date"], "%Y-%m-%dT%H:%M:%S"
-                )
-                tdelta = DT.datetime.utcnow() - timestamp
-                tdelta = DT.timedelta.total_seconds(tdelta)
-
-                if tdelta >= 94608000:
-                    timeString = "NIL"
-                elif tdelta >= 3600:
-                    timeString = str(round(tdelta / 3600, 1)) + " hours ago"
-                elif tdelta >= 60:
-                    timeString = str(round(tdelta / 60)) + " mins ago"
-                else:
-                    timeString = str(round(tdelta)) + " sec ago"
-
-                timeStringAll.append(timeString)
-
-                # Convert timestamp for max buy order price dates
-                timestamp = DT.datetime.strptime(
-                    indivData["buy_price_max_date"], "%Y-%m-%dT%H:%M:%S"
-                )
-                tdelta = DT.datetime.utcnow() - timestamp
-                tdelta = DT.timedelta.total_seconds(tdelta)
-
-                if tdelta >= 94608000:
-                    timeString = "NIL"
-                elif tdelta >= 3600:
-                    timeString = str(round(tdelta / 3600, 1)) + " hours ago"
-                elif tdelta >= 60:
-                    timeString = str(round(tdelta / 60)) + " mins ago"
-                else:
-                    timeString = str(round(tdelta)) + " sec ago"
-
-                timeStringAllBuy.append(timeString)
-
-                # Put quality beside location
-                try:
-                    if indivData["quality"] == 0 or indivData["quality"] == 1:
-                        locationString = indivData["city"]
-                    elif indivData["quality"] == 2:
-                        locationString = indivData["city"] + " (Good)"
-                    elif indivData["quality"] == 3:
-                        locationString = indivData["city"] + " (Oustanding)"
-                    elif indivData["quality"] == 4:
-                        locationString = indivData["city"] + " (Excellent)"
-                    elif indivData["quality"] == 5:
-                        locationString = indivData["city"] + " (Masterpiece)"
-                # Quality not given for items without quality
-                except:
-                    locationString = indivData["city"]
-
-                locationStringAll.append(locationString)
-
-                # Getting the minimum sell order prices
-                sellPriceMinStringAll.append(indivData["sell_price_min"])
-
-                # Getting the maximum buy order prices
-                buyPriceMaxStringAll.append(indivData["buy_price_max"])
-
-            # Express in embed format
-            # Basically just output list as column
-            embedLocationString = ""
-            embedPriceString = ""
-            embedTimeString = ""
-            embedPriceStringBuy = ""
-            embedTimeStringBuy = ""
-            embedLocationStringBuy = ""
-
-            for (i, locationString) in enumerate(locationStringAll):
-                # Don't output if no data
-                if sellPriceMinStringAll[i] != 0:
-                    embedLocationString += locationString + "\n"
-                    embedPriceString += format(sellPriceMinStringAll[i], ',d') + "\n"
-                    embedTimeString += timeStringAll[i] + "\n"
-
-                if buyPriceMaxStringAll[i] != 0:
-                    embedLocationStringBuy += locationString + "\n"
-                    embedPriceStringBuy += format(buyPriceMaxStringAll[i], ',d') + "\n"
-                    embedTimeStringBuy += timeStringAllBuy[i] + "\n"
-
-            # Only add embeds if there are prices to show
-            if embedPriceString:
-                # Add the fields to Discord embed
-                em.add_field(name="Locations", value=embedLocationString, inline=True)
-                em.add_field(name="Min Sell Price", value=embedPriceString, inline=True)
-                em.add_field(name="Last Updated", value=embedTimeString, inline=True)
-
-            if embedPriceStringBuy:
-                # Add fields for buy orders
-                em.add_field(
-                    name="Locations", value=embedLocationStringBuy, inline=True
-                )
-                em.add_field(
-                    name="Max Buy Price", value=embedPriceStringBuy, inline=True
-                )
-                em.add_field(name="Last Updated", value=embedTimeStringBuy, inline=True)
+            self.add_price_fields(em, records)
 
         # If data is empty
         except:
@@ -239,39 +332,68 @@ class FetchPrice(commands.Cog):
         finally:
             # Next 3 closest item matches suggestions
             # Good for people if they don't remember item's name and type wrongly
-            em.add_field(
-                name="Suggestions:",
-                value=f"{itemNames[1]} ({itemIDs[1]})\n{itemNames[2]} ({itemIDs[2]})\n{itemNames[3]} ({itemIDs[3]})",
-                inline=False,
-            )
+            # The rest are on pages turned by reactions, no need to match again
+            suggestionIndex = len(em.fields)
+            suggestionPages = [[]]
+            if len(itemIDs) > 1:
+                suggestions = [
+                    f"{itemName} ({itemID})"
+                    for (itemName, itemID) in zip(itemNames[1:], itemIDs[1:])
+                ]
+                suggestionPages = [
+                    [("Suggestions:", field_value(lines), False)]
+                    for lines in [suggestions[:3]]
+                    + chunk_lines(suggestions[3:], self.suggestionsPerPage)
+                ]
+                em.add_field(
+                    name="Suggestions:",
+                    value=field_value(suggestions[:3]),
+                    inline=False,
+                )
 
             # Adding thumbnail
             iconFullURL = self.iconURL + itemIDs[0] + ".png"
 
             em.set_thumbnail(url=iconFullURL)
 
+            # Show how old the snapshot is if prices are not live
             # \u274c is a red X
-            em.set_footer(text="React with \u274c to delete this post.")
+            snapshotAge = now_timestamp() - fetchedAt
+            if snapshotAge >= 60:
+                em.set_footer(
+                    text=f"Prices as of {round(snapshotAge / 60)} mins ago. "
+                    "React with \u274c to delete this post."
+                )
+            else:
+                em.set_footer(text="React with \u274c to delete this post.")
 
             try:
                 # Skip plotting if command is quick
-                if any(["quick" in c.lower() for c in command[:2]]):
+                # Progressive mode sends the embed now, the plot follows below
+                if isQuick or self.progressive:
                     raise Exception
 
                 # Trigger typing again so that user know its still loading
                 await ctx.channel.trigger_typing()
 
                 # Grab past 7 days historical prices and plot them
-                self.grabHistory(itemIDs[0], itemNames[0])
+                png = await self.grabHistory(itemIDs[0], itemNames[0])
+                if png is None:
+                    raise Exception
 
-                plotFile = discord.File("./plot.png", filename="plot.png")
+                self.add_stats_field(em, itemIDs[0])
+                plotFile = discord.File(io.BytesIO(png), filename="plot.png")
 
                 # Finally send the embed
-                msg = await ctx.send(embed=em, file=plotFile)
+                msg = await send_paginated(
+                    ctx, self.pages, em, suggestionIndex, suggestionPages, file=plotFile
+                )
 
             # Just send embed without plot if command is quick
             except:
-                msg = await ctx.send(embed=em)
+                msg = await send_paginated(
+                    ctx, self.pages, em, suggestionIndex, suggestionPages
+                )
 
             # Add delete reaction button
             await msg.add_reaction("\u274c")
@@ -281,199 +403,786 @@ class FetchPrice(commands.Cog):
                     f"{ctx.message.content} | Matched -> {itemNames[0]} ({itemIDs[0]})"
                 )
 
+            # Progressive mode, plot is added once rendered
+            if self.progressive and not isQuick:
+                await ctx.channel.trigger_typing()
+                await self.attach_history(ctx, msg, em, itemIDs[0], itemNames[0])
+
+    @commands.command()
+    async def compare(self, ctx, *, items):
+        """Plot 7 days historical prices of a few items in one city.
+
+        - Usage: <commandPrefix> compare <item 1>, <item 2>, ... [in <city>]
+        - All names are matched in one pass over the item catalog.
+        - All histories are fetched in one request, for that city only.
+        - Outputs as Discord Embed with one plot of every item.
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content}")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        # Costs about as much as one prices, as it is one request and one plot
+        retryAfter = cooldown.charge(ctx, cooldown.cost("compare"))
+        if retryAfter:
+            await ctx.send(f"Slow down! Try again in {retryAfter:.0f}s.")
+            return
+
+        # Optional city at the end, e.g. '... in fort sterling'
+        location = self.compareLocation
+        match = re.search(r"\s+in\s+([^,]+)$", items, re.IGNORECASE)
+        if match and city_code(match.group(1)) is not None:
+            location = city_code(match.group(1))
+            items = items[: match.start()]
+
+        inputWords = [word.strip() for word in items.split(",") if word.strip()]
+        if len(inputWords) < 2:
+            await ctx.send("Please specify at least 2 items, separated by commas.")
+            return
+
+        await ctx.channel.trigger_typing()
+
+        locale = self.locales.get(ctx.author.id, ctx.guild.id if ctx.guild else None)
+        itemNames, itemIDs = self.items_match(
+            inputWords[: self.compareMaxItems], locale
+        )
+
+        # Same item typed twice is only plotted once
+        matched = dict(zip(itemIDs, itemNames))
+        itemIDs = list(matched)
+        itemNames = list(matched.values())
+
+        png = await self.grabComparison(itemIDs, itemNames, location)
+
+        em = discord.Embed(
+            title=f"7 Days Sell Order Prices in {LOCATION_LABELS[location]}"
+        )
+        em.add_field(
+            name="Items",
+            value=field_value(
+                [
+                    f"{itemName} ({itemID})"
+                    for (itemName, itemID) in zip(itemNames, itemIDs)
+                ]
+            ),
+            inline=False,
+        )
+        if len(inputWords) > self.compareMaxItems:
+            em.description = (
+                f"Only the first {self.compareMaxItems} items are compared."
+            )
+        em.set_footer(text="React with \u274c to delete this post.")
+
+        if png is None:
+            em.add_field(
+                name="NO DATA",
+                value="There are no data for these items in this city.",
+                inline=False,
+            )
+            msg = await ctx.send(embed=em)
+        else:
+            plotFile = discord.File(io.BytesIO(png), filename="plot.png")
+            em.set_image(url="attachment://plot.png")
+            msg = await ctx.send(embed=em, file=plotFile)
+
+        # Add delete reaction button
+        await msg.add_reaction("\u274c")
+
+        if self.debug:
+            await self.debugChannel.send(
+                f"{ctx.message.content} | Matched -> {', '.join(itemIDs)}"
+            )
+
+    @commands.command()
+    async def locale(self, ctx, *options):
+        """Show or change the language used to search and show item names.
+
+        - Usage: <commandPrefix> locale [server] <locale>
+        - 'locale' shows current and available locales.
+        - 'locale DE-DE' sets it for yourself, 'locale reset' removes it.
+        - 'locale server DE-DE' sets it for the server (needs Manage Server).
+        """
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        guildID = ctx.guild.id if ctx.guild else None
+        options = list(options)
+
+        # Show current locale and the available ones
+        if not options:
+            await ctx.send(
+                f"Current locale: `{self.locales.get(ctx.author.id, guildID)}`\n"
+                f"Available: `{', '.join(self.catalog.locales)}`"
+            )
+            return
+
+        # Server-wide locale
+        if options[0].lower() == "server":
+            if ctx.guild is None or (
+                not ctx.author.guild_permissions.manage_guild
+                and str(ctx.author) not in self.adminUsers
+            ):
+                await ctx.send("You need the Manage Server permission to do that.")
+                return
+            setLocale = self.locales.set_guild
+            scopeID = guildID
+            options = options[1:]
+        else:
+            setLocale = self.locales.set_user
+            scopeID = ctx.author.id
+
+        if not options:
+            await ctx.send(f"Usage: `locale [server] <locale>`")
+            return
+
+        # Remove setting
+        if options[0].lower() == "reset":
+            setLocale(scopeID, None)
+            await ctx.send("Locale reset.")
+            return
+
+        # Locales are case insensitive, e.g. de-de
+        matches = [
+            locale
+            for locale in self.catalog.locales
+            if locale.lower() == options[0].lower()
+        ]
+        if not matches:
+            await ctx.send(
+                f"Unknown locale `{options[0]}`.\nAvailable: `{', '.join(self.catalog.locales)}`"
+            )
+            return
+
+        setLocale(scopeID, matches[0])
+        await ctx.send(f"Locale set to `{matches[0]}`.")
+
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content} | Locale set")
+
+    @commands.command(aliases=["complete"])
+    async def lookup(self, ctx, *, prefix):
+        """List items whose ID or name starts with prefix.
+
+        - Usage: <commandPrefix> lookup <prefix>
+        - Answered from the item catalog only, no API calls.
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content}")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        locale = self.locales.get(ctx.author.id, ctx.guild.id if ctx.guild else None)
+        # Every matching key is looked at, so broad prefixes still list the closest
+        rows = self.catalog.prefix_index(locale).complete(prefix, limit=15, scan=None)
+
+        em = discord.Embed(title=f"Items starting with: **{prefix}**")
+        if rows:
+            em.add_field(
+                name="Did you mean:",
+                value="\n".join(
+                    f"{self.catalog.name(i, locale)} ({self.catalog.id(i)})"
+                    for i in rows
+                ),
+                inline=False,
+            )
+        else:
+            em.add_field(
+                name="No items found.",
+                value=f"Try `prices {prefix}` for a closest match instead.",
+                inline=False,
+            )
+
+        # \u274c is a red X
+        em.set_footer(text="React with \u274c to delete this post.")
+
+        msg = await ctx.send(embed=em)
+        await msg.add_reaction("\u274c")
+
+    # Error message of lookup
+    @lookup.error
+    async def lookup_error(self, ctx, error):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send("Please specify the start of an item name.")
+
+    @compare.error
+    async def compare_error(self, ctx, error):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send("Please specify items, separated by commas.")
+
     # Error message of prices
     @prices.error
     async def prices_error(self, ctx, error):
         if isinstance(error, commands.MissingRequiredArgument):
             await ctx.send("Please specify item.")
 
-    def item_match(self, inputWord):
-        """Find closest matching item name and ID of input item.
+    def current_prices(self, item):
+        """Returns (records, fetchedAt) of item's current prices.
 
-        - Matches both item ID (UniqueName) and item name (LocalizedNames)
-        - Uses difflib.
-        - Returns 4 closest match.
+        - From the snapshot if fetched less than self.snapshotMaxAge ago.
+        - Else fetched live, and saved to the snapshot.
+        - Every call counts as a query of item, for 'hot' mode.
+        - Blocks (SQLite, urllib), so it is run in an executor.
         """
 
-        itemNames = []
-        itemIDs = []
-        jDists = []
+        now = now_timestamp()
 
-        # Read item list
-        data = self.itemData
+        if self.snapshotEnabled:
+            self.snapshot.hit(item, now)
+            snapshot = self.snapshot.get(item)
+            if snapshot is not None and now - snapshot[1] <= self.snapshotMaxAge:
+                return snapshot
 
-        # Loop through each item in item.json
-        # Store distance and item index of each item
-        for (i, indivData) in enumerate(data):
+        records = self.fetch_prices(item)
+        if self.snapshotEnabled:
+            self.snapshot.put([item], records, now)
 
-            # Calculate distance for item ID (UniqueName)
-            try:
-                w1 = inputWord.lower()
-                w2 = indivData["UniqueName"].lower()
+        return records, now
 
-                # Use difflib's SequenceMatcher
-                jDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
-                jDists.append([jDist, i])
+    @tasks.loop(minutes=10)
+    async def ingest(self):
+        """Refresh snapshot prices in bulk.
 
-            # If item has no 'UniqueName'
-            except:
-                # Max distance is 1
-                jDists.append([1, i])
+        - 'hot' mode: the self.snapshotHotItems most asked for items in the past week.
+        - 'all' mode: every tiered item in the catalog.
+        - Item IDs are packed self.snapshotChunkSize per request.
+        - SQLite reads and writes run in an executor, off the event loop.
+        """
 
-            # Calculate distance for item name (LocalizedNames)
-            try:
-                w1 = inputWord.lower()
+        loop = self.client.loop
+        now = now_timestamp()
+
+        # An error would end the loop, so only this refresh is skipped
+        try:
+            if self.snapshotMode == "all":
+                tradable = re.compile(r"^T[1-8]_")
+                itemIDs = [
+                    itemID
+                    for itemID in self.catalog.column("id")
+                    if tradable.match(itemID)
+                ]
+            else:
+                itemIDs = await loop.run_in_executor(
+                    None,
+                    self.snapshot.hot_items,
+                    self.snapshotHotItems,
+                    now - 7 * 86400,
+                )
 
-                # Get distance for all localizations
-                localDists = []
-                for name in indivData["LocalizedNames"]:
-                    w2 = indivData["LocalizedNames"][name].lower()
+            chunks = chunk_ids(
+                itemIDs,
+                self.snapshotChunkSize,
+                len(self.apiURL) + len(self.locationURL),
+            )
+            urls = [
+                self.apiURL + ",".join(chunk) + self.locationURL for chunk in chunks
+            ]
+            results = await fetch_all(urls, self.snapshotConcurrency)
 
-                    localDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
-                    localDists.append(localDist)
+            await loop.run_in_executor(None, self.store_snapshot, chunks, results, now)
+        except Exception as e:
+            print(e)
+            if self.debug:
+                await self.debugChannel.send(f"Snapshot refresh failed: {e!r}"[:2000])
 
-                # Pick the closest distance as jDist
-                jDist = min(localDists)
-                jDists.append([jDist, i])
+    def store_snapshot(self, chunks, results, fetchedAt):
+        """Parse fetched prices and save them to the snapshot, run in an executor.
 
-            # If item has no 'LocalizedNames'
-            except:
-                jDists.append([1, i])
+        - Only items of requests that succeeded are replaced.
+        """
+
+        for (chunk, result) in zip(chunks, results):
+            if result is not None:
+                self.snapshot.put(chunk, parse_prices(result), fetchedAt)
+
+    @ingest.before_loop
+    async def before_ingest(self):
+        await self.client.wait_until_ready()
+
+    def fetch_prices(self, item):
+        """Fetch item's current prices from Data Project API.
+
+        - Returns list of PriceRecord, entries without orders are skipped.
+        """
+
+        fullURL = self.apiURL + item + self.locationURL
+        with urllib.request.urlopen(fullURL) as url:
+            data = json.loads(url.read().decode())
+
+        return parse_prices(data)
+
+    def add_price_fields(self, em, records):
+        """Add sell and buy order columns of records to Discord embed.
+
+        - Columns: Locations, Min Sell Price/Max Buy Price, Last Updated.
+        - Rows with no sell (or buy) orders are left out of that column.
+        """
+
+        # Express in embed format
+        # Basically just output records as column
+        sellRecords = [record for record in records if record.sellPriceMin != 0]
+        buyRecords = [record for record in records if record.buyPriceMax != 0]
+
+        # Only add embeds if there are prices to show
+        if sellRecords:
+            em.add_field(
+                name="Locations",
+                value="\n".join(record.label for record in sellRecords),
+                inline=True,
+            )
+            em.add_field(
+                name="Min Sell Price",
+                value="\n".join(
+                    format(record.sellPriceMin, ",d") for record in sellRecords
+                ),
+                inline=True,
+            )
+            em.add_field(
+                name="Last Updated",
+                value="\n".join(
+                    age_string(record.sellPriceMinDate) for record in sellRecords
+                ),
+                inline=True,
+            )
+
+        if buyRecords:
+            # Add fields for buy orders
+            em.add_field(
+                name="Locations",
+                value="\n".join(record.label for record in buyRecords),
+                inline=True,
+            )
+            em.add_field(
+                name="Max Buy Price",
+                value="\n".join(
+                    format(record.buyPriceMax, ",d") for record in buyRecords
+                ),
+                inline=True,
+            )
+            em.add_field(
+                name="Last Updated",
+                value="\n".join(
+                    age_string(record.buyPriceMaxDate) for record in buyRecords
+                ),
+                inline=True,
+            )
+
+    def item_match(self, inputWord, locale="EN-US", allLocales=False, count=4):
+        """Find closest matching item name and ID of input item.
+
+        - Matches item ID (UniqueName) and item name in locale (LocalizedNames)
+        - allLocales matches names in every localization instead (slower).
+        - Tier/enchantment shorthand (e.g. '4.1 bag') skips matching entirely.
+        - If 4 or more items start with the input, only those are matched.
+        - Uses difflib.
+        - Returns up to count closest match, with names in locale.
+        """
+
+        catalog = self.catalog
+
+        # Shorthand like '4.1 bag' or 't6.3 claymore' is a table lookup
+        # Suggestions are the same item at other enchantments and tiers
+        shorthand = catalog.shorthand_table()
+        row = shorthand.resolve(inputWord)
+        if row is not None:
+            rows = [row] + shorthand.neighbours(inputWord)[: count - 1]
+            itemNames = [catalog.name(i, locale) for i in rows]
+            itemIDs = [catalog.id(i) for i in rows]
+            return itemNames, itemIDs
+
+        w1 = inputWord.lower()
+
+        # SequenceMatcher caches details of its second sequence
+        # So the input word is set once, and each item name is set as the first
+        matcher = difflib.SequenceMatcher(None)
+        matcher.set_seq2(w1)
+
+        def distance(w2):
+            # Max distance is 1 for missing names
+            if not w2:
+                return 1
+            matcher.set_seq1(w2)
+            return 1 - matcher.ratio()
+
+        # Only search the locale's names, unless asked to search all
+        if allLocales:
+            locales = catalog.locales
+        elif locale in catalog.locales:
+            locales = [locale]
+        else:
+            locales = []
+
+        # People often type the start of a name
+        # If enough items start with the input, only those are scored
+        # Prefix completions are a bisect on the locale's prefix index,
+        # None if too many keys match (e.g. 't4_'), then every item is scored
+        if allLocales:
+            prefixRows = []
+        else:
+            prefixRows = (
+                catalog.prefix_index(locale).complete(inputWord, limit=64) or []
+            )
 
-        # Sort JDists
-        # Closest match has lowest distance
-        jDists = sorted(jDists)
+        if len(prefixRows) >= 4:
+            idColumn = catalog.search_column("id")
+            nameColumns = [catalog.search_column(name) for name in locales]
 
-        # Get item names and IDs of first 4 closest match
-        itemNames = [data[jDist[1]]["LocalizedNames"]["EN-US"] for jDist in jDists[:4]]
-        itemIDs = [data[jDist[1]]["UniqueName"] for jDist in jDists[:4]]
+            def item_distance(i):
+                return min(
+                    [distance(idColumn[i])]
+                    + [distance(column[i]) for column in nameColumns]
+                )
+
+            closest = sorted(prefixRows, key=item_distance)
+
+        else:
+            # Distance of each item is the closest of its item ID
+            # and its names in the searched localizations
+            jDists = [distance(itemID) for itemID in catalog.search_column("id")]
+            for searchLocale in locales:
+                for (i, name) in enumerate(catalog.search_column(searchLocale)):
+                    jDist = distance(name)
+                    if jDist < jDists[i]:
+                        jDists[i] = jDist
+
+            # Sort item indices by distance
+            # Closest match has lowest distance
+            # The few prefix completions are always listed first
+            for i in prefixRows:
+                jDists[i] = -1
+            closest = sorted(range(len(jDists)), key=jDists.__getitem__)
+
+        # Get item names and IDs of first count closest match
+        itemNames = [catalog.name(i, locale) for i in closest[:count]]
+        itemIDs = [catalog.id(i) for i in closest[:count]]
 
         return itemNames, itemIDs
 
-    def grabHistory(self, item, itemName):
-        """Grab item's 7 days historical prices for all cities, and plots them.
+    def items_match(self, inputWords, locale="EN-US"):
+        """Find the closest matching item of each input, in one pass.
 
-        - Grabbed from Data Project API.
-        - Plots timeseries to 'plot.png'.
+        - Same rules as item_match: shorthand first, then prefix completions.
+        - The remaining inputs are scored together, in one pass over the item
+            ID column and the locale's name column.
+        - Returns (itemNames, itemIDs), one closest match per input, in order.
         """
 
-        # Outliers makes the plot useless, so we find and remove them
-        # This function is not very effective though
-        def reject_outliers(data):
-            d = [abs(i - statistics.median(data)) for i in data]
-            mdev = statistics.median(d)
-            s = [i / mdev if mdev else 0 for i in d]
-            m = 10
-            indices = [i for (i, val) in enumerate(s) if val < m]
+        catalog = self.catalog
+        shorthand = catalog.shorthand_table()
+        idColumn = catalog.search_column("id")
+        if locale in catalog.locales:
+            nameColumns = [catalog.search_column(locale)]
+        else:
+            nameColumns = []
+
+        # One matcher per input, each caches details of its input word
+        matchers = []
+        for inputWord in inputWords:
+            matcher = difflib.SequenceMatcher(None)
+            matcher.set_seq2(inputWord.lower())
+            matchers.append(matcher)
+
+        def distance(matcher, w2):
+            # Max distance is 1 for missing names
+            if not w2:
+                return 1
+            matcher.set_seq1(w2)
+            return 1 - matcher.ratio()
+
+        rows = [None] * len(inputWords)
+        pending = []
+        for (k, inputWord) in enumerate(inputWords):
+            # Shorthand like '4.1 bag' is a table lookup
+            row = shorthand.resolve(inputWord)
+            if row is not None:
+                rows[k] = row
+                continue
+
+            # Items starting with the input are the only ones scored,
+            # unless too many keys match and complete returns None
+            prefixRows = catalog.prefix_index(locale).complete(inputWord, limit=64)
+            if prefixRows:
+                rows[k] = min(
+                    prefixRows,
+                    key=lambda i: min(
+                        [distance(matchers[k], idColumn[i])]
+                        + [distance(matchers[k], column[i]) for column in nameColumns]
+                    ),
+                )
+            else:
+                pending.append(k)
+
+        # Every other input is scored in the same pass over the columns
+        if pending:
+            bestDists = {k: 2 for k in pending}
+            for column in [idColumn] + nameColumns:
+                for (i, name) in enumerate(column):
+                    if not name:
+                        continue
+                    for k in pending:
+                        jDist = distance(matchers[k], name)
+                        if jDist < bestDists[k]:
+                            bestDists[k] = jDist
+                            rows[k] = i
+
+        itemNames = [catalog.name(i, locale) for i in rows]
+        itemIDs = [catalog.id(i) for i in rows]
 
-            newData = [data[i] for i in indices]
+        return itemNames, itemIDs
 
-            return newData, indices
+    def fetch_history(self, item, itemCodes=None, locations=None):
+        """Fetch item's 7 days hourly historical prices for all cities.
+
+        - Grabbed from Data Project API.
+        - item can be several comma separated IDs, with itemCodes mapping
+            each ID to its code in the 'item' field (see parse_history).
+        - locations is an API location query, all cities if not given.
+        - Returns HISTORY_DTYPE structured array, None if request failed.
+        """
 
         # Find API URL for past 7 days
         # historyURL requires dates in %m-%d-%Y format
         today = DT.datetime.utcnow()
         numDays = 7
         date = (today - DT.timedelta(days=numDays)).strftime("%m-%d-%Y")
+        if locations is None:
+            locationURL = self.historyLocationURL
+        else:
+            locationURL = "&locations=" + locations
         fullURL = (
             self.historyURL
             + item
             + "?date="
             + date
-            + self.historyLocationURL
+            + locationURL
             + "&time-scale=1"
         )
 
-        # List will have 10 different indices for 10 different cities
-        # The indices corresponds to this ordering of cities (Alphabetical):
-        # Arthurs, BlackMarket, Bridgewatch, Caerleon, Fort Sterling, Lymhurst, Martlock, Merlyns, Morganas, Thetford
-        prices_minAll = [[], [], [], [], [], [], [], [], [], []]
-        timestampsAll = [[], [], [], [], [], [], [], [], [], []]
-        itemCountsAll = [[], [], [], [], [], [], [], [], [], []]
-
-        # Get price
         try:
             with urllib.request.urlopen(fullURL) as url:
                 prices = json.loads(url.read().decode())
+        except Exception as e:
+            print(e)
+            return None
+
+        return parse_history(prices, itemCodes)
+
+    async def attach_history(self, ctx, msg, em, item, itemName):
+        """Plot item's history, and add it to the already sent embed msg.
+
+        - discord.py 1.x can't add files to a sent message, so the plot is
+            uploaded to chartChannel and shown as the embed's image.
+        - Without a chartChannel, the plot is sent as a reply to msg.
+        - Rolling statistics are added to the embed either way.
+        """
 
+        # The prices are already sent, so a failed plot is left out quietly
+        try:
+            png = await self.grabHistory(item, itemName)
         except Exception as e:
             print(e)
+            png = None
+        if png is None:
             return
 
+        plotFile = discord.File(io.BytesIO(png), filename="plot.png")
+        self.add_stats_field(em, item)
+
+        if self.chartChannel is None:
+            reply = await ctx.send(file=plotFile, reference=msg, mention_author=False)
+            await reply.add_reaction("\u274c")
         else:
-            for price in prices:
-                if price["quality"] == 1:
-                    if price["location"] == "Arthurs Rest":
-                        prices_minAll[0].extend(price["data"]["prices_avg"])
-                        timestampsAll[0].extend(price["data"]["timestamps"])
-                        itemCountsAll[0].extend(price["data"]["item_count"])
-                    elif price["location"] == "Black Market":
-                        prices_minAll[1].extend(price["data"]["prices_avg"])
-                        timestampsAll[1].extend(price["data"]["timestamps"])
-                        itemCountsAll[1].extend(price["data"]["item_count"])
-                    elif price["location"] == "Bridgewatch":
-                        prices_minAll[2].extend(price["data"]["prices_avg"])
-                        timestampsAll[2].extend(price["data"]["timestamps"])
-                        itemCountsAll[2].extend(price["data"]["item_count"])
-                    elif price["location"] == "Caerleon":
-                        prices_minAll[3].extend(price["data"]["prices_avg"])
-                        timestampsAll[3].extend(price["data"]["timestamps"])
-                        itemCountsAll[3].extend(price["data"]["item_count"])
-                    elif price["location"] == "Fort Sterling":
-                        prices_minAll[4].extend(price["data"]["prices_avg"])
-                        timestampsAll[4].extend(price["data"]["timestamps"])
-                        itemCountsAll[4].extend(price["data"]["item_count"])
-                    elif price["location"] == "Lymhurst":
-                        prices_minAll[5].extend(price["data"]["prices_avg"])
-                        timestampsAll[5].extend(price["data"]["timestamps"])
-                        itemCountsAll[5].extend(price["data"]["item_count"])
-                    elif price["location"] == "Martlock":
-                        prices_minAll[6].extend(price["data"]["prices_avg"])
-                        timestampsAll[6].extend(price["data"]["timestamps"])
-                        itemCountsAll[6].extend(price["data"]["item_count"])
-                    elif price["location"] == "Merlyns Rest":
-                        prices_minAll[7].extend(price["data"]["prices_avg"])
-                        timestampsAll[7].extend(price["data"]["timestamps"])
-                        itemCountsAll[7].extend(price["data"]["item_count"])
-                    elif price["location"] == "Morganas Rest":
-                        prices_minAll[8].extend(price["data"]["prices_avg"])
-                        timestampsAll[8].extend(price["data"]["timestamps"])
-                        itemCountsAll[8].extend(price["data"]["item_count"])
-                    elif price["location"] == "Thetford":
-                        prices_minAll[9].extend(price["data"]["prices_avg"])
-                        timestampsAll[9].extend(price["data"]["timestamps"])
-                        itemCountsAll[9].extend(price["data"]["item_count"])
-
-        # Parse datetime
-        for (i, timestamps) in enumerate(timestampsAll):
-            timestampsAll[i] = [
-                DT.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S")
-                for timestamp in timestamps
-            ]
+            upload = await self.chartChannel.send(
+                f"{itemName} ({item})", file=plotFile
+            )
+            em.set_image(url=upload.attachments[0].url)
 
-        # Reject outliers from prices data as well as their corresponding timestamps
-        for (i, prices) in enumerate(prices_minAll):
-            try:
-                prices_minAll[i], indices = reject_outliers(prices)
-                timestampsAll[i] = [timestampsAll[i][j] for j in indices]
-                itemCountsAll[i] = [itemCountsAll[i][j] for j in indices]
-            # Pass if prices_minAll = []
-            except:
-                pass
-
-        # Plot labels and plot colors
-        names = [
-            "Arthur's Rest",
-            "Black Market",
-            "Bridgewatch",
-            "Caerleon",
-            "Fort Sterling",
-            "Lymhurst",
-            "Martlock",
-            "Merlyn's Rest",
-            "Morgana's Rest",
-            "Thetford",
+        # Keep the page the user turned to, pages are copies of em
+        paginated = self.pages.get(msg.id)
+        await msg.edit(embed=paginated.render() if paginated else em)
+
+    async def grabHistory(self, item, itemName):
+        """Grab item's 7 days historical prices for all cities, and plots them.
+
+        - Grabbed from Data Project API.
+        - Returns plot as PNG bytes, None if prices could not be grabbed.
+        - Plot is reused from self.charts if the prices have not changed.
+        - Fetched and plotted in threads, so the event loop is not blocked.
+        - New hours are added to each city's rolling statistics.
+        """
+
+        loop = self.client.loop
+        history = await loop.run_in_executor(None, self.fetch_history, item)
+        if history is None:
+            return None
+
+        # One series per location code (see helpers.records.LOCATIONS)
+        # Normal quality only, sorted by time, and with outliers removed
+        # Outliers makes the plot useless, so we find and remove them
+        seriesAll = [
+            history_series(history, code) for code in range(len(LOCATION_LABELS))
+        ]
+
+        # Rolling statistics, only hours newer than the last fetch are added
+        # Kept values are cut to the plotted hours
+        statsAll = []
+        for (code, series) in enumerate(seriesAll):
+            stats = self.rolling.feed(
+                (item, code), series["timestamp"], series["price"], series["count"]
+            )
+            if stats is None:
+                statsAll.append(np.zeros(0, dtype=ROLLING_DTYPE))
+            else:
+                values = stats.history()
+                statsAll.append(values[values["timestamp"] >= series["timestamp"][0]])
+
+        # Same data and title gives the same plot
+        key = chart_key("history", item, itemName, *seriesAll, *statsAll)
+        png = self.charts.get(key)
+        if png is None:
+            started = time.perf_counter()
+            png = await loop.run_in_executor(
+                renderer(), self.plot_history, seriesAll, statsAll, item, itemName
+            )
+            # Render time is what evicting the chart would cost
+            self.charts.put(key, png, time.perf_counter() - started)
+
+        return png
+
+    async def grabComparison(self, itemIDs, itemNames, location):
+        """Grab several items' 7 days historical prices in one city, and plots them.
+
+        - All items are fetched in one request, for that city only.
+        - Returns plot as PNG bytes, None if there are no prices to plot.
+        - Plot is reused from self.charts if the prices have not changed.
+        """
+
+        loop = self.client.loop
+        itemCodes = {itemID: k for (k, itemID) in enumerate(itemIDs)}
+        history = await loop.run_in_executor(
+            None,
+            self.fetch_history,
+            ",".join(itemIDs),
+            itemCodes,
+            LOCATIONS[location].replace(" ", ""),
+        )
+        if history is None:
+            return None
+
+        # One series per item, normal quality, outliers removed
+        seriesAll = [
+            history_series(history[history["item"] == k], location)
+            for k in range(len(itemIDs))
         ]
+        if not any(len(series) for series in seriesAll):
+            return None
+
+        key = chart_key("compare", location, *itemIDs, *itemNames, *seriesAll)
+        png = self.charts.get(key)
+        if png is None:
+            started = time.perf_counter()
+            png = await loop.run_in_executor(
+                renderer(),
+                self.plot_comparison,
+                seriesAll,
+                itemIDs,
+                itemNames,
+                location,
+            )
+            self.charts.put(key, png, time.perf_counter() - started)
+
+        return png
+
+    def plot_comparison(self, seriesAll, itemIDs, itemNames, location):
+        """Plot 7 days historical prices of items in one city, returns PNG bytes.
+
+        - seriesAll has one HISTORY_DTYPE series per item, same order as itemIDs.
+        - Prices are overlaid on one plot, item counts are below it.
+        """
+
+        plt.style.use("seaborn")
+        fig = plt.figure(figsize=(12, 7))
+        gs = gridspec.GridSpec(2, 1, height_ratios=[4, 1], hspace=0.1)
+
+        # First grid is for prices, second for item counts
+        ax0 = fig.add_subplot(gs[0])
+        ax1 = fig.add_subplot(gs[1], sharex=ax0)
+
+        for (series, itemID, itemName) in zip(seriesAll, itemIDs, itemNames):
+            (line,) = ax0.plot(
+                series["timestamp"], series["price"], label=f"{itemName} ({itemID})"
+            )
+            ax1.bar(
+                series["timestamp"],
+                series["count"],
+                width=0.04,
+                color=line.get_color(),
+                alpha=0.6,
+            )
+
+        ax0.set_title(f"7 Days Sell Order Prices in {LOCATION_LABELS[location]}")
+        ax0.set_ylabel("Silvers")
+        ax0.legend(loc="upper left", bbox_to_anchor=(1, 1))
+        plt.setp(ax0.get_xticklabels(), visible=False)
+
+        ax1.set_ylabel("Volume")
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
+
+        plot = io.BytesIO()
+        fig.savefig(plot, format="png", bbox_inches="tight")
+        plt.close("all")
+
+        return plot.getvalue()
+
+    def add_stats_field(self, em, item):
+        """Add rolling statistics of item's main cities to Discord embed.
+
+        - One line per city with a fetched history: SMA, EMA, VWAP and band.
+        - Read from self.rolling, filled in by grabHistory.
+        """
+
+        lines = []
+        for code in MAIN_CITIES:
+            stats = self.rolling.get((item, code))
+            if stats is None:
+                continue
+
+            (lower, upper) = stats.bands(self.bandWidth)
+            vwap = stats.vwap
+            lines.append(
+                f"{LOCATION_LABELS[code]}: {stats.sma:,.0f} / {stats.ema:,.0f} / "
+                + (f"{vwap:,.0f}" if vwap is not None else "-")
+                + f" ({max(lower, 0):,.0f} - {upper:,.0f})"
+            )
+
+        if lines:
+            em.add_field(
+                name=f"{self.rollingHours:g}h SMA / EMA / VWAP (Band)",
+                value=field_value(lines),
+                inline=False,
+            )
+
+    def plot_history(self, seriesAll, statsAll, item, itemName):
+        """Plot 7 days historical prices of 6 main cities, returns PNG bytes.
+
+        - seriesAll has one HISTORY_DTYPE series per location code.
+        - statsAll has one ROLLING_DTYPE array per location code, its SMA
+            and bands are drawn over the main city.
+        """
+
+        # Plot colors
         colors = [
             "red",
             "rosybrown",
@@ -486,7 +1195,7 @@ class FetchPrice(commands.Cog):
             "purple",
             "brown",
         ]
-        plotOrders = [3, 2, 4, 5, 6, 9]
+        plotOrders = MAIN_CITIES
 
         # Plot the data
         plt.style.use("seaborn")
@@ -514,28 +1223,41 @@ class FetchPrice(commands.Cog):
             else:
                 ax1 = plt.subplot(gs[1], sharex=ax0)
 
-            # Iterate over all cities and plot each one
-            for (i, timestamp) in enumerate(timestampsAll):
-                try:
-                    # Only plot those that are in plotOrders
-                    if i in plotOrders:
-                        ax0.plot(
-                            timestampsAll[i], prices_minAll[i], color="gray", alpha=0.3,
-                        )
-                # Pass if prices_minAll = []
-                except:
-                    pass
+            # Plot all cities in plotOrders as background
+            for i in plotOrders:
+                ax0.plot(
+                    seriesAll[i]["timestamp"],
+                    seriesAll[i]["price"],
+                    color="gray",
+                    alpha=0.3,
+                )
 
             # Plot the main city
+            series = seriesAll[plotOrders[j]]
+            ax0.plot(
+                series["timestamp"], series["price"], color=colors[plotOrders[j]],
+            )
+
+            # Rolling SMA and bands of the main city
+            stats = statsAll[plotOrders[j]]
             ax0.plot(
-                timestampsAll[plotOrders[j]],
-                prices_minAll[plotOrders[j]],
+                stats["timestamp"],
+                stats["sma"],
+                color=colors[plotOrders[j]],
+                linestyle="--",
+                linewidth=1,
+            )
+            ax0.fill_between(
+                stats["timestamp"],
+                stats["sma"] - self.bandWidth * stats["std"],
+                stats["sma"] + self.bandWidth * stats["std"],
                 color=colors[plotOrders[j]],
+                alpha=0.1,
             )
 
             # Plot item counts
             ax1.bar(
-                timestampsAll[plotOrders[j]], itemCountsAll[plotOrders[j]], width=0.04,
+                series["timestamp"], series["count"], width=0.04,
             )
 
             # Remember item counts axis for sharey
@@ -554,13 +1276,14 @@ class FetchPrice(commands.Cog):
                 plt.setp(ax1.get_xticklabels(), visible=False)
 
             # Title and date axis
-            ax0.set_title(f"{names[plotOrders[j]]}")
+            ax0.set_title(f"{LOCATION_LABELS[plotOrders[j]]}")
             ax1.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
 
-        fig.savefig("plot.png", bbox_inches="tight")
+        plot = io.BytesIO()
+        fig.savefig(plot, format="png", bbox_inches="tight")
         plt.close("all")
 
-        return
+        return plot.getvalue()
 
 
 def setup(client):
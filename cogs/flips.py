@@ -0,0 +1,244 @@
+import discord
+from discord.ext import commands, tasks
+import datetime as DT
+import calendar
+import configparser
+import os
+import re
+
+from helpers import warmstart
+from helpers.bulk import chunk_ids, fetch_all
+from helpers.catalog import load_catalog
+from helpers.flips import find_flips
+from helpers.records import (
+    LOCATIONS,
+    LOCATION_QUERY,
+    age_string,
+    parse_prices,
+    price_matrix,
+)
+
+
+class Flips(commands.Cog):
+    """Cog that finds profitable market flips over the whole item catalog.
+
+    Commands:
+        - flips
+            Show best city to city and city to Black Market flips.
+            Answered from the last scan, no API calls.
+
+    Tasks:
+        - scan
+            Fetch current prices of every tradable item in bulk,
+            and work out the best flips from an item x city price matrix.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        # Load config.ini and get configs
+        currentPath = os.path.dirname(os.path.realpath(__file__))
+        configs = configparser.ConfigParser()
+        configs.read(os.path.dirname(currentPath) + "/config.ini")
+
+        debugChannel = int(configs["Channels"]["debugChannelID"])
+        workChannel = [
+            int(ID) for ID in configs["Channels"]["workChannelID"].split(", ")
+        ]
+        self.debugChannel = client.get_channel(debugChannel)
+        self.workChannel = workChannel
+
+        self.onlyWork = configs["General"].getboolean("onlyWork")
+        self.debug = configs["General"].getboolean("debug")
+
+        # Scan settings
+        self.scanMinutes = configs["Flips"].getfloat("scanMinutes")
+        self.chunkSize = configs["Flips"].getint("chunkSize")
+        self.concurrency = configs["Flips"].getint("concurrency")
+        self.maxAgeHours = configs["Flips"].getfloat("maxAgeHours")
+        self.tax = configs["Flips"].getfloat("tax")
+        self.minMargin = configs["Flips"].getfloat("minMargin")
+        self.topN = configs["Flips"].getint("topN")
+
+        # API URLs
+        self.apiURL = "https://www.albion-online-data.com/api/v2/stats/prices/"
+        self.locationURL = "?locations=" + LOCATION_QUERY + "&qualities=1"
+
+        # Same item catalog as the prices cog (shared memory-mapped file)
+        self.itemList = "https://raw.githubusercontent.com/broderickhyman/ao-bin-dumps/master/formatted/items.json"
+        catalogFile = os.path.join(
+            os.path.dirname(currentPath), configs["Catalog"]["catalogFile"]
+        )
+        # Tradable items are the tiered ones, e.g. T4_BAG, T6_2H_CLAYMORE@3
+        tradable = re.compile(r"^T[1-8]_")
+        try:
+            self.catalog = load_catalog(
+                catalogFile, self.itemList, configs["Catalog"].getfloat("maxAgeHours")
+            )
+            self.itemIDs = [
+                itemID
+                for itemID in self.catalog.column("id")
+                if tradable.match(itemID)
+            ]
+        except Exception as e:
+            print(e)
+            self.itemIDs = []
+
+        # Results of the last scan, or of the last run if still fresh
+        self.results = None
+        self.scannedAt = None
+        warmstart.register("flips", self.dump_results, self.load_results)
+
+        self.scan.change_interval(minutes=self.scanMinutes)
+        self.scan.start()
+
+    def cog_unload(self):
+        self.scan.cancel()
+
+    def dump_results(self):
+        """Returns results of the last scan with its item IDs, for a warm restart."""
+
+        if self.results is None:
+            return None
+        return (self.results, self.scannedAt, self.itemIDs)
+
+    def load_results(self, state, downtime):
+        # Flips refer to items by index, so the item list must be the same
+        (results, scannedAt, itemIDs) = state
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+        if now - scannedAt <= self.maxAgeHours * 3600 and itemIDs == self.itemIDs:
+            (self.results, self.scannedAt) = (results, scannedAt)
+
+    @tasks.loop(minutes=30)
+    async def scan(self):
+        """Fetch prices of all tradable items and find the best flips.
+
+        - Item IDs are packed self.chunkSize per request.
+        - At most self.concurrency requests run at a time.
+        """
+
+        chunks = chunk_ids(
+            self.itemIDs, self.chunkSize, len(self.apiURL) + len(self.locationURL)
+        )
+        urls = [self.apiURL + ",".join(chunk) + self.locationURL for chunk in chunks]
+
+        started = DT.datetime.utcnow()
+        results = await fetch_all(urls, self.concurrency)
+
+        records = []
+        for result in results:
+            if result:
+                records.extend(parse_prices(result))
+
+        # Every request failed, keep the last good results
+        if not records:
+            if self.debug:
+                await self.debugChannel.send(
+                    f"Flips scan | {len(urls)} requests failed, kept last results"
+                )
+            return
+
+        # Dense item x city matrix, then all flips at once
+        itemCodes = {itemID: i for (i, itemID) in enumerate(self.itemIDs)}
+        matrix = price_matrix(records, itemCodes, len(self.itemIDs))
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+        self.results = find_flips(
+            matrix,
+            now,
+            self.maxAgeHours * 3600,
+            self.tax,
+            self.topN,
+            self.minMargin,
+        )
+        self.scannedAt = now
+
+        if self.debug:
+            seconds = (DT.datetime.utcnow() - started).total_seconds()
+            await self.debugChannel.send(
+                f"Flips scan | {len(urls)} requests, {results.count(None)} failed, {seconds:.0f}s"
+            )
+
+    @scan.before_loop
+    async def before_scan(self):
+        await self.client.wait_until_ready()
+
+    @commands.command(aliases=["flip"])
+    async def flips(self, ctx, option="all"):
+        """Show best flips from the last scan.
+
+        - Usage: <commandPrefix> flips [bm/city]
+        - bm: buy in a city, sell instantly to the Black Market.
+        - city: buy in a city, sell with a sell order in another city.
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content}")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        if self.results is None:
+            await ctx.send("Still scanning the market, try again in a few minutes.")
+            return
+
+        option = option.lower()
+        if option in ("bm", "blackmarket"):
+            kinds = [("bm", "City \u2192 Black Market")]
+        elif option in ("city", "cities"):
+            kinds = [("city", "City \u2192 City")]
+        else:
+            kinds = [("city", "City \u2192 City"), ("bm", "City \u2192 Black Market")]
+
+        # Item names in the user's locale, if the prices cog is loaded
+        fetchPrice = self.client.get_cog("FetchPrice")
+        if fetchPrice is not None:
+            locale = fetchPrice.locales.get(
+                ctx.author.id, ctx.guild.id if ctx.guild else None
+            )
+        else:
+            locale = "EN-US"
+
+        em = discord.Embed(
+            title=":moneybag: Best Flips :moneybag:", colour=discord.Colour.gold()
+        )
+
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+        for (kind, name) in kinds:
+            lines = []
+            for flip in self.results[kind]:
+                # flip.age is as of the scan, the older of its two prices
+                seen = age_string(self.scannedAt - flip.age, now)
+
+                itemID = self.itemIDs[flip.item]
+                row = self.catalog.index(itemID)
+                line = (
+                    f"**{self.catalog.name(row, locale)}** ({itemID})\n"
+                    f"{LOCATIONS[flip.src]} {flip.buyPrice:,d} \u2192 "
+                    f"{LOCATIONS[flip.dst]} {flip.sellPrice:,d} | "
+                    f"+{flip.profit:,d} ({flip.margin:.0%}) | {seen}"
+                )
+
+                # Discord field values are limited to 1024 chars
+                if sum(len(prev) + 1 for prev in lines) + len(line) > 1024:
+                    break
+                lines.append(line)
+
+            em.add_field(
+                name=name, value="\n".join(lines) or "No flips found.", inline=False
+            )
+
+        scannedAgo = round((now - self.scannedAt) / 60)
+        em.set_footer(
+            text=f"Scanned {scannedAgo} mins ago, after {self.tax:.1%} tax. "
+            "React with \u274c to delete this post."
+        )
+
+        msg = await ctx.send(embed=em)
+        await msg.add_reaction("\u274c")
+
+
+def setup(client):
+    client.add_cog(Flips(client))
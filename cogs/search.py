@@ -6,6 +6,9 @@ import datetime as DT
 import configparser
 import os
 
+from helpers import admission, cachemanager, cooldown
+from helpers.pages import page_cache, send_paginated
+
 
 class Search(commands.Cog):
     """Cog that deals with official API database.
@@ -38,6 +41,23 @@ class Search(commands.Cog):
         self.onlyWork = configs["General"].getboolean("onlyWork")
         self.debug = configs["General"].getboolean("debug")
 
+        # Concurrency limits of commands, see helpers/admission.py
+        admission.configure(configs["Admission"])
+
+        # Per user/channel/guild quotas, see helpers/cooldown.py
+        cooldown.configure(configs["Cooldowns"])
+
+        # Memory budget shared by all caches, see helpers/cachemanager.py
+        cachemanager.configure(configs["CacheBudget"])
+
+        # Guild members, on pages turned by reactions (see helpers/pages.py)
+        self.pages = page_cache(
+            configs["Pages"].getint("maxMessages"),
+            configs["Pages"].getfloat("ttlMinutes") * 60,
+            configs["Pages"].getfloat("maxMegabytes") * 2 ** 20,
+        )
+        self.membersPerPage = configs["Pages"].getint("membersPerPage")
+
         # API URLs
         self.allianceURL = (
             "https://gameinfo.albiononline.com/api/gameinfo/alliances/"  # + ID
@@ -56,6 +76,18 @@ class Search(commands.Cog):
         # API can provide recipe
         self.itemURL = "https://gameinfo.albiononline.com/api/gameinfo/items/"  # + item name + /data
 
+    async def cog_before_invoke(self, ctx):
+        # Admission control, sheds the command with Busy if too many are running
+        await admission.admit(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        admission.release(ctx)
+
+    async def cog_command_error(self, ctx, error):
+        # Shed by admission control, whichever command of this cog it was
+        if isinstance(error, admission.Busy):
+            await ctx.send("Busy right now, please try again in a bit.")
+
     @commands.command()
     async def search(self, ctx, option, *, name):
         """Search and retrieve details for players and guilds."""
@@ -69,6 +101,15 @@ class Search(commands.Cog):
             if ctx.channel.id not in self.workChannel:
                 return
 
+        # Spend quota, guild searches fetch every member so they cost more
+        if option.lower() in ["guild", "guilds"]:
+            retryAfter = cooldown.charge(ctx, cooldown.cost("searchGuild"))
+        else:
+            retryAfter = cooldown.charge(ctx, cooldown.cost("searchPlayer"))
+        if retryAfter:
+            await ctx.send(f"Slow down! Try again in {retryAfter:.0f}s.")
+            return
+
         await ctx.channel.trigger_typing()
 
         # URL spaces are replaced with '%20'
@@ -229,18 +270,25 @@ class Search(commands.Cog):
                 ]
                 sortedFames = sorted(fames, reverse=True)
 
-                # Display only 10 members max
-                if len(sortedMembers) > 10:
-                    membersLength = 10
-                else:
-                    membersLength = len(sortedMembers)
-
-                # Put sorted members and fames in column format for Discord embed
-                memberString = ""
-                fameString = ""
-                for i in range(membersLength):
-                    memberString += f"{sortedMembers[i]}\n"
-                    fameString += f"{sortedFames[i]:,}\n"
+                # Pages of members and fames, in column format for Discord embed
+                # Only the first page is shown, the rest are turned to by reactions
+                memberPages = []
+                perPage = self.membersPerPage
+                for start in range(0, max(len(sortedMembers), 1), perPage):
+                    pageMembers = sortedMembers[start : start + perPage]
+                    pageFames = sortedFames[start : start + perPage]
+
+                    if start == 0:
+                        title = f"Top {len(pageMembers)} Members"
+                    else:
+                        title = f"Members {start + 1}-{start + len(pageMembers)}"
+
+                    # \u200b (zero width space) as fields can't be empty
+                    memberString = "\n".join(pageMembers) or "\u200b"
+                    fameString = "\n".join(f"{fame:,}" for fame in pageFames) or "\u200b"
+                    memberPages.append(
+                        [(title, memberString, True), ("Fame", fameString, True)]
+                    )
 
                 # Create Discord embed
                 em = discord.Embed(title=f":crossed_swords:**{guild}**:crossed_swords:")
@@ -269,17 +317,16 @@ class Search(commands.Cog):
                 )
                 em.add_field(name="\u200b", value="\u200b", inline=True)
 
-                # Fifth row
-                em.add_field(
-                    name=f"Top {membersLength} Members",
-                    value=memberString,
-                    inline=True,
-                )
-                em.add_field(name="Fame", value=fameString, inline=True)
+                # Fifth row, first page of members
+                memberIndex = len(em.fields)
+                for (fieldName, fieldValue, fieldInline) in memberPages[0]:
+                    em.add_field(name=fieldName, value=fieldValue, inline=fieldInline)
 
                 em.set_footer(text="React with \u274c to delete this post.")
 
-                msg = await ctx.send(embed=em)
+                msg = await send_paginated(
+                    ctx, self.pages, em, memberIndex, memberPages
+                )
                 await msg.add_reaction("\u274c")  # Delete reaction button
 
                 # Debug message
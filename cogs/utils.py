@@ -1,7 +1,16 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+import asyncio
 import configparser
+import io
 import os
+import threading
+
+from helpers import cachemanager, memory, metrics, warmstart
+from helpers.pages import NEXT, PREVIOUS, page_cache
+from helpers.profiler import SamplingProfiler
+from helpers.recorder import CommandRecorder
+from helpers.watchdog import LoopWatchdog
 
 
 class Utils(commands.Cog):
@@ -24,14 +33,30 @@ class Utils(commands.Cog):
     Commands:
         - ping
             Return latency.
+        - metrics
+            Return all metrics (admission queue depths etc.).
+        - profile
+            Profile the bot for some seconds, results go to debugChannel.
+        - memory
+            Memory report (top growing allocations, cache sizes) to debugChannel.
         - exec
             Execute Python codes with exec function.
         - eval
             Eval Python values with eval function.
 
+    Background:
+        - Event loop watchdog
+            Logs the command and function that block the event loop.
+        - Memory reports
+            Sends a memory report to debugChannel every [Memory] reportMinutes.
+
     Listens:
         - Delete reaction button (on_raw_reaction_add)
             Deletes a bot message when reacted with '\u274c' (red X).
+        - Page turning (on_raw_reaction_add, on_raw_reaction_remove)
+            Turns pages of paginated embeds with '\u25c0' and '\u25b6'.
+        - Command recording (on_message)
+            Saves commands to [Replay] recordFile if record set to True.
     """
 
     def __init__(self, client):
@@ -54,6 +79,70 @@ class Utils(commands.Cog):
 
         self.adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
 
+        # Record the command stream, for load testing with tools/replay.py
+        self.recorder = None
+        if configs["Replay"].getboolean("record"):
+            self.recorder = CommandRecorder(
+                os.path.join(
+                    os.path.dirname(currentPath), configs["Replay"]["recordFile"]
+                )
+            )
+
+        # Sampling profiler, only exists while the profile command runs
+        self.profiler = None
+        self.profileMaxSeconds = configs["Profiler"].getfloat("maxSeconds")
+        self.profileInterval = configs["Profiler"].getfloat("intervalMs") / 1000
+
+        # Logs what blocks the event loop, see helpers/watchdog.py
+        self.watchdog = None
+        if configs["Watchdog"].getboolean("enabled"):
+            self.watchdog = LoopWatchdog(
+                client.loop,
+                configs["Watchdog"].getfloat("thresholdMs") / 1000,
+                configs["Watchdog"].getfloat("intervalMs") / 1000,
+            )
+            self.watchdog.start()
+
+        # Memory budget shared by all caches, see helpers/cachemanager.py
+        cachemanager.configure(configs["CacheBudget"])
+
+        # Paginated embeds of other cogs, see helpers/pages.py
+        self.pages = page_cache(
+            configs["Pages"].getint("maxMessages"),
+            configs["Pages"].getfloat("ttlMinutes") * 60,
+            configs["Pages"].getfloat("maxMegabytes") * 2 ** 20,
+        )
+
+        # Allocation tracing and periodic memory reports, see helpers/memory.py
+        self.memoryTracker = memory.MemoryTracker(configs["Memory"].getint("frames"))
+        if configs["Memory"].getboolean("trace"):
+            self.memoryTracker.start()
+            self.memory_report.change_interval(
+                minutes=configs["Memory"].getfloat("reportMinutes")
+            )
+            self.memory_report.start()
+
+        # Caches are saved every saveMinutes for warm restarts (helpers/warmstart.py)
+        # main.py restores them at startup, and saves them again on shutdown
+        self.warmStartFile = None
+        if configs["WarmStart"].getboolean("enabled"):
+            self.warmStartFile = os.path.join(
+                os.path.dirname(currentPath), configs["WarmStart"]["file"]
+            )
+            self.warmStartMinutes = configs["WarmStart"].getfloat("saveMinutes")
+            self.save_caches.change_interval(minutes=self.warmStartMinutes)
+            self.save_caches.start()
+
+    def cog_unload(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.memory_report.cancel()
+        self.save_caches.cancel()
+        if self.profiler is not None and self.profiler.running:
+            self.profiler.stop()
+
     @commands.command()
     async def ping(self, ctx):
         """Returns latency of bot."""
@@ -73,6 +162,159 @@ class Utils(commands.Cog):
 
         await ctx.send(f"Pong! {round(self.client.latency * 1000)}ms")
 
+    @commands.command()
+    async def metrics(self, ctx):
+        """Returns all metrics, e.g. admission queue depths.
+
+        - Only allows adminUser.
+        """
+
+        # Check if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        values = metrics.snapshot()
+        if not values:
+            await ctx.send("No metrics yet.")
+            return
+
+        lines = [f"{name} = {value}" for (name, value) in values.items()]
+
+        # Discord messages are limited to 2000 chars
+        text = "\n".join(lines)
+        if len(text) > 1900:
+            await ctx.send(
+                file=discord.File(io.BytesIO(text.encode()), filename="metrics.txt")
+            )
+        else:
+            await ctx.send(f"```\n{text}\n```")
+
+    @commands.command()
+    async def caches(self, ctx):
+        """Returns size, budget and hit rate of each cache.
+
+        - Only allows adminUser.
+        """
+
+        # Check if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        text = "\n".join(cachemanager.report())
+        await ctx.send(f"```\n{text}\n```")
+
+    @commands.command()
+    async def profile(self, ctx, seconds: float = 30):
+        """Profile the bot for some seconds, and send results to debugChannel.
+
+        - Only allows adminUser.
+        - Samples stacks of all threads, capped at [Profiler] maxSeconds.
+        - Sends the top functions of the event loop's thread, and all stacks
+            as a collapsed stacks file (for flamegraph.pl or speedscope).
+        """
+
+        # Check if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if self.profiler is not None and self.profiler.running:
+            await ctx.send("Already profiling.")
+            return
+
+        seconds = max(1, min(seconds, self.profileMaxSeconds))
+        await ctx.send(f"Profiling for {seconds:.0f}s.")
+
+        self.profiler = SamplingProfiler(self.profileInterval)
+        self.profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.profiler.stop()
+
+        # This coroutine runs on the event loop's thread
+        loopThread = threading.current_thread().name
+        top = self.profiler.top_functions(15, loopThread)
+        summary = "\n".join(f"{fraction:6.1%} {label}" for (label, fraction) in top)
+
+        await self.debugChannel.send(
+            f"Profile of {seconds:.0f}s, {self.profiler.samples} samples. "
+            f"Top functions on the event loop ({loopThread}):\n```\n{summary[:1700]}\n```",
+            file=discord.File(
+                io.BytesIO(self.profiler.collapsed().encode()), filename="profile.txt"
+            ),
+        )
+        if ctx.channel != self.debugChannel:
+            await ctx.send("Profile sent to the debug channel.")
+
+    @commands.command()
+    async def memory(self, ctx, option=None):
+        """Send a memory report to debugChannel.
+
+        - Only allows adminUser.
+        - 'memory start' and 'memory stop' turn allocation tracing on and off.
+        - With tracing on, shows allocation sites that grew since the last report.
+        """
+
+        # Check if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if option == "start":
+            self.memoryTracker.start()
+            await ctx.send("Tracing allocations.")
+            return
+        elif option == "stop":
+            self.memoryTracker.stop()
+            await ctx.send("Stopped tracing allocations.")
+            return
+
+        await ctx.channel.trigger_typing()
+        await self.send_memory_report()
+        if ctx.channel != self.debugChannel:
+            await ctx.send("Memory report sent to the debug channel.")
+
+    @tasks.loop(minutes=60)
+    async def memory_report(self):
+        await self.send_memory_report()
+
+    @memory_report.before_loop
+    async def before_memory_report(self):
+        await self.client.wait_until_ready()
+
+    @tasks.loop(minutes=15)
+    async def save_caches(self):
+        """Save caches for a warm restart.
+
+        - Pickled on the event loop, so no cache changes halfway through.
+        - Compressed and written in a thread.
+        """
+
+        pickled = warmstart.dumps()
+        await self.client.loop.run_in_executor(
+            None, warmstart.write, self.warmStartFile, pickled
+        )
+
+    @save_caches.before_loop
+    async def before_save_caches(self):
+        await self.client.wait_until_ready()
+
+        # Caches are only just restored at startup, nothing new to save
+        await asyncio.sleep(self.warmStartMinutes * 60)
+
+    async def send_memory_report(self):
+        """Send memory report to debugChannel, as a file if it is long."""
+
+        text = memory.report(self.client, self.memoryTracker)
+
+        # Discord messages are limited to 2000 chars
+        if len(text) > 1900:
+            await self.debugChannel.send(
+                f"Memory report, RSS {memory.megabytes(memory.rss())}.",
+                file=discord.File(io.BytesIO(text.encode()), filename="memory.txt"),
+            )
+        else:
+            await self.debugChannel.send(f"```\n{text}\n```")
+
     @commands.command(aliases=["python"])
     async def exec(self, ctx, *, codes):
         """Execute Python codes with exec function
@@ -162,24 +404,71 @@ class Utils(commands.Cog):
         - and that reaction is not by the bot itself.
         """
 
-        # Get reacted message
-        channel = await self.client.fetch_channel(rawReaction.channel_id)
-        msg = await channel.fetch_message(rawReaction.message_id)
+        # Check the reaction first, so other reactions cost no API calls
+        # Compared by ID, as users are not cached with the lean cache preset
+        if (
+            str(rawReaction.emoji) != "\u274c"
+            or rawReaction.user_id == self.client.user.id
+        ):
+            return
+
+        # Get reacted message, from the cache if there, else fetched
+        channel = self.client.get_channel(rawReaction.channel_id)
+        if channel is None:
+            channel = await self.client.fetch_channel(rawReaction.channel_id)
+        msg = discord.utils.get(self.client.cached_messages, id=rawReaction.message_id)
+        if msg is None:
+            msg = await channel.fetch_message(rawReaction.message_id)
+
+        # Only delete message if it is bot's message
+        if msg.author == self.client.user:
+            await msg.delete()
+
+    @commands.Cog.listener("on_raw_reaction_add")
+    async def turn_page_add(self, rawReaction):
+        await self.turn_page(rawReaction)
 
-        # Get user who reacted and the reaction emoji
-        user = self.client.get_user(rawReaction.user_id)
-        emoji = rawReaction.emoji
+    @commands.Cog.listener("on_raw_reaction_remove")
+    async def turn_page_remove(self, rawReaction):
+        await self.turn_page(rawReaction)
+
+    async def turn_page(self, rawReaction):
+        """Turn page of a paginated embed by reaction.
+
+        - Adding or removing '\u25c0' or '\u25b6' turns the page, so users
+            don't need to remove their reaction before turning again.
+        - Pages come from the page cache, nothing is fetched or computed again.
+        """
 
-        # Only delete message if:
-        # it is bot's message,
-        # reaction is not by bot (bot adds reaction after each message)
-        # reaction emoji is \u274c (the :x: emoji)
         if (
-            msg.author == self.client.user
-            and user != self.client.user
-            and str(emoji) == "\u274c"
+            str(rawReaction.emoji) not in [PREVIOUS, NEXT]
+            or rawReaction.user_id == self.client.user.id
         ):
-            await msg.delete()
+            return
+
+        em = self.pages.turn(rawReaction.message_id, str(rawReaction.emoji))
+        if em is None:
+            return
+
+        # Edit without fetching the message
+        channel = self.client.get_channel(rawReaction.channel_id)
+        if channel is None:
+            channel = await self.client.fetch_channel(rawReaction.channel_id)
+        await channel.get_partial_message(rawReaction.message_id).edit(embed=em)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Record commands for replay, if recording is on.
+
+        - Only messages that are valid commands, and not by bots.
+        """
+
+        if self.recorder is None or message.author.bot:
+            return
+
+        ctx = await self.client.get_context(message)
+        if ctx.valid:
+            self.recorder.record(message)
 
 
 def setup(client):
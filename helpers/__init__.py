@@ -0,0 +1,5 @@
+"""Shared helpers used by the cogs.
+
+- Kept outside of /cogs so that main.py does not try to load them as extensions.
+- Modules in here are not reloaded by the 'extension reload' command.
+"""
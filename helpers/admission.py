@@ -0,0 +1,118 @@
+"""Admission control: per-command concurrency limits with bounded wait queues.
+
+- Each command has a gate: at most 'limit' running, at most 'queue' waiting.
+- A command that finds the queue full, or waits longer than 'timeout'
+    seconds, is shed with Busy instead of piling up.
+- Gates are shared by all cogs and kept over cog reloads.
+"""
+
+import asyncio
+
+from discord.ext import commands
+
+from helpers import metrics
+
+# Command name -> CommandGate
+_gates = {}
+
+# Command name -> (limit, queue, timeout), 'default' for the rest
+_settings = {"default": (4, 8, 10.0)}
+
+
+class Busy(commands.CommandError):
+    """Raised when a command is shed by admission control."""
+
+    def __init__(self, name):
+        super().__init__(f"{name} is busy.")
+        self.name = name
+
+
+class CommandGate:
+    """Concurrency limit and bounded wait queue of one command."""
+
+    def __init__(self, name, limit, queue, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+
+        # Queue depths and shed counts as metrics
+        metrics.gauge(f"admission.{name}.active", lambda: self.active)
+        metrics.gauge(f"admission.{name}.waiting", lambda: self.waiting)
+
+    async def acquire(self):
+        """Wait for a slot, raises Busy if shed."""
+
+        if self.semaphore.locked():
+            if self.waiting >= self.queue:
+                metrics.increment(f"admission.{self.name}.shed")
+                raise Busy(self.name)
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                metrics.increment(f"admission.{self.name}.timed_out")
+                raise Busy(self.name)
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+
+        self.active += 1
+        metrics.increment(f"admission.{self.name}.admitted")
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+
+def configure(section):
+    """Read limits from a config.ini section, e.g. 'prices = 4, 8, 10'.
+
+    - Values are limit, queue size, and timeout in seconds.
+    - Gates that already exist keep their old limits.
+    """
+
+    for (name, value) in section.items():
+        (limit, queue, timeout) = [part.strip() for part in value.split(",")]
+        _settings[name] = (int(limit), int(queue), float(timeout))
+
+
+def gate(name):
+    """Returns CommandGate of command name, created on first use."""
+
+    if name not in _gates:
+        (limit, queue, timeout) = _settings.get(name, _settings["default"])
+        _gates[name] = CommandGate(name, limit, queue, timeout)
+
+    return _gates[name]
+
+
+def gate_name(ctx):
+    """Name of gate used by a command context, 'quick' has its own gate."""
+
+    if ctx.invoked_with and ctx.invoked_with.lower() in _settings:
+        return ctx.invoked_with.lower()
+    return ctx.command.qualified_name
+
+
+async def admit(ctx):
+    """Acquire gate of ctx's command, for use in cog_before_invoke."""
+
+    commandGate = gate(gate_name(ctx))
+    await commandGate.acquire()
+    ctx.admissionGate = commandGate
+
+
+def release(ctx):
+    """Release gate acquired by admit, for use in cog_after_invoke."""
+
+    commandGate = getattr(ctx, "admissionGate", None)
+    if commandGate is not None:
+        ctx.admissionGate = None
+        commandGate.release()
@@ -0,0 +1,78 @@
+"""Bulk requests to the Data Project API.
+
+- Many item IDs are packed into each request (comma separated).
+- Requests are run in threads, at most 'concurrency' at a time,
+    so the event loop is never blocked by urlopen.
+"""
+
+import asyncio
+import json
+import urllib.request
+
+# Keep request URLs well below common URL length limits
+MAX_URL_LENGTH = 4000
+
+
+def fetch_json(fullURL, timeout=30):
+    """Blocking GET of fullURL, returns decoded JSON."""
+
+    with urllib.request.urlopen(fullURL, timeout=timeout) as url:
+        return json.loads(url.read().decode())
+
+
+def chunk_ids(itemIDs, chunkSize, baseLength=0):
+    """Split item IDs into lists of at most chunkSize IDs.
+
+    - A chunk is also cut short if its URL would exceed MAX_URL_LENGTH.
+    - baseLength is the length of the URL without the item IDs.
+    """
+
+    chunks = []
+    chunk = []
+    length = baseLength
+    for itemID in itemIDs:
+        if chunk and (
+            len(chunk) >= chunkSize or length + len(itemID) + 1 > MAX_URL_LENGTH
+        ):
+            chunks.append(chunk)
+            chunk = []
+            length = baseLength
+
+        chunk.append(itemID)
+        length += len(itemID) + 1
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+async def fetch_all(urls, concurrency=4, progress=None):
+    """Fetch all URLs concurrently, at most concurrency requests at a time.
+
+    - Returns decoded JSON of each URL in the same order, None if it failed.
+    - progress(done, total) is awaited after each request, if given.
+    """
+
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(urls)
+    done = 0
+
+    async def fetch(fullURL):
+        nonlocal done
+
+        async with semaphore:
+            try:
+                result = await loop.run_in_executor(None, fetch_json, fullURL)
+            except Exception as e:
+                print(e)
+                result = None
+
+        done += 1
+        if progress is not None:
+            await progress(done, total)
+
+        return result
+
+    return await asyncio.gather(*[fetch(fullURL) for fullURL in urls])
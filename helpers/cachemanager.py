@@ -0,0 +1,247 @@
+"""Caches under one memory budget, with size and cost aware eviction.
+
+- Cogs get their caches with cache(name, maxBytes, maxEntries), shared by all
+    cogs and kept over cog reloads.
+- Each entry has a size in bytes (approximate, see memory.approx_size) and a
+    cost, the seconds it took to make, so it is what evicting it would cost.
+- Entries are evicted by GreedyDual-Size: priority = clock + cost / size,
+    lowest first. A hit sets the entry's priority again, and each eviction
+    moves the clock up to the evicted priority, so entries that are not used
+    age out. Large cheap entries go first, small costly ones last.
+- Each cache stays within its own maxBytes, and all caches together within
+    the total budget, by evicting the lowest priority entry of any cache.
+- Bytes, entries and hit rate of each cache are metrics, and the 'caches'
+    admin command shows them.
+"""
+
+import heapq
+import itertools
+
+from helpers import memory, metrics
+
+# Name -> SizedCache, shared by all cogs and kept over cog reloads
+_caches = {}
+_totalBytes = 64 * 2 ** 20
+
+# Shared by all caches, so that their priorities compare
+_clock = 0.0
+_serial = itertools.count()
+
+
+def configure(section):
+    """Read the total budget from a config.ini section (totalMegabytes)."""
+
+    global _totalBytes
+
+    _totalBytes = section.getfloat("totalMegabytes") * 2 ** 20
+    enforce()
+
+
+class SizedCache:
+    """Entries by key, bounded by bytes and count, see module docstring.
+
+    - Entries are [value, size, cost, priority], the heap has
+        (priority, serial, key) and is cleaned up lazily: items whose
+        priority no longer matches their entry are skipped.
+    """
+
+    def __init__(self, name, maxBytes, maxEntries=None):
+        self.name = name
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+
+        self.entries = {}
+        self.heap = []
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    @property
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key, default=None):
+        """Returns value of key, default if not cached. Counts as a hit or miss."""
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._prioritize(key, entry)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Returns value of key like get(), without counting or a new priority."""
+
+        entry = self.entries.get(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key, value, size=None, cost=1.0):
+        """Cache value of key, then evict until within the budgets.
+
+        - size is in bytes, measured with memory.approx_size if None.
+        - cost is seconds it took to make value, or an estimate.
+        - Returns False if value is too big to ever fit.
+        """
+
+        if size is None:
+            size = memory.approx_size(value)
+        size = max(int(size), 1)
+
+        self.pop(key)
+        if size > self.maxBytes:
+            return False
+
+        entry = [value, size, cost, 0.0]
+        self.entries[key] = entry
+        self.size += size
+        self._prioritize(key, entry)
+
+        self.fit()
+        return key in self.entries
+
+    def fit(self):
+        """Evict until within its own budget, then within the total one."""
+
+        while self.size > self.maxBytes or (
+            self.maxEntries and len(self.entries) > self.maxEntries
+        ):
+            self.evict()
+        enforce()
+
+    def pop(self, key, default=None):
+        """Remove key, returns its value. Its heap item goes stale."""
+
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+
+        self.size -= entry[1]
+        return entry[0]
+
+    def items(self):
+        """Returns [(key, value, cost)], lowest priority first."""
+
+        ordered = sorted(self.entries.items(), key=lambda item: item[1][3])
+        return [(key, value, cost) for (key, (value, size, cost, _)) in ordered]
+
+    def lowest(self):
+        """Returns priority of the next entry to evict, None if empty."""
+
+        while self.heap:
+            (priority, _, key) = self.heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry[3] == priority:
+                return priority
+            heapq.heappop(self.heap)
+
+        return None
+
+    def evict(self):
+        """Evict the lowest priority entry, returns bytes freed."""
+
+        global _clock
+
+        priority = self.lowest()
+        if priority is None:
+            return 0
+
+        (_, _, key) = heapq.heappop(self.heap)
+        _clock = max(_clock, priority)
+
+        size = self.entries[key][1]
+        self.pop(key)
+        self.evictions += 1
+        return size
+
+    def _prioritize(self, key, entry):
+        entry[3] = _clock + entry[2] / entry[1]
+        heapq.heappush(self.heap, (entry[3], next(_serial), key))
+
+        # Rebuild once stale items outnumber entries, else hits grow the heap
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [
+                (entry[3], next(_serial), key) for (key, entry) in self.entries.items()
+            ]
+            heapq.heapify(self.heap)
+
+
+def cache(name, maxBytes, maxEntries=None):
+    """Returns the shared SizedCache of name, created on first call.
+
+    - Later calls update its budgets (e.g. a cog reloaded with a new config),
+        applied at once so an idle cache does not stay over them.
+    """
+
+    if name not in _caches:
+        sized = SizedCache(name, maxBytes, maxEntries)
+        _caches[name] = sized
+
+        metrics.gauge(f"cache.{name}.bytes", lambda: sized.size)
+        metrics.gauge(f"cache.{name}.entries", lambda: len(sized))
+        metrics.gauge(f"cache.{name}.hit_rate", lambda: round(sized.hitRate, 3))
+        metrics.gauge(f"cache.{name}.evictions", lambda: sized.evictions)
+        memory.track(name, lambda: (len(sized), sized.size))
+
+    sized = _caches[name]
+    sized.maxBytes = maxBytes
+    sized.maxEntries = maxEntries
+    sized.fit()
+
+    return sized
+
+
+def total_size():
+    """Returns bytes of all caches."""
+
+    return sum(sized.size for sized in _caches.values())
+
+
+def enforce():
+    """Evict the lowest priority entries of any cache until within the total budget."""
+
+    total = total_size()
+    while total > _totalBytes:
+        candidates = [
+            (priority, sized)
+            for sized in _caches.values()
+            for priority in [sized.lowest()]
+            if priority is not None
+        ]
+        if not candidates:
+            break
+
+        (_, sized) = min(candidates, key=lambda candidate: candidate[0])
+        total -= sized.evict()
+
+
+def report():
+    """Returns lines of the total and each cache's occupancy and hit rate."""
+
+    mb = 2 ** 20
+    total = total_size()
+    lines = [
+        f"Total: {total / mb:.1f}/{_totalBytes / mb:.1f} MB "
+        f"({100 * total / _totalBytes:.0f}%)"
+    ]
+
+    for sized in sorted(_caches.values(), key=lambda sized: -sized.size):
+        entries = f"{len(sized)}/{sized.maxEntries}" if sized.maxEntries else len(sized)
+        lines.append(
+            f"{sized.name}: {sized.size / mb:.1f}/{sized.maxBytes / mb:.1f} MB, "
+            f"{entries} entries, {100 * sized.hitRate:.0f}% hits "
+            f"of {sized.hits + sized.misses}, {sized.evictions} evicted"
+        )
+
+    return lines
@@ -0,0 +1,88 @@
+"""Gateway intents and discord.py cache settings, from config.ini [Cache].
+
+- Presets:
+    lean: only what this bot's commands need. Guild list, messages (for
+        commands) and reactions (delete button, pagination). No members,
+        presences, or message cache.
+    default: discord.py's defaults, caches messages and members.
+    full: every intent, caches every member (needed by the unused talk.py
+        cog, and by 'eval' on member lists).
+- Any of intents, maxMessages, memberCache and chunkGuilds set in [Cache]
+    override the preset.
+"""
+
+import discord
+
+PRESETS = {
+    "lean": {
+        "intents": "guilds, guild_messages, dm_messages, guild_reactions, dm_reactions",
+        "maxMessages": "0",
+        "memberCache": "none",
+        "chunkGuilds": "False",
+    },
+    "default": {
+        "intents": "default",
+        "maxMessages": "1000",
+        "memberCache": "intents",
+        "chunkGuilds": "False",
+    },
+    "full": {
+        "intents": "all",
+        "maxMessages": "1000",
+        "memberCache": "all",
+        "chunkGuilds": "True",
+    },
+}
+
+
+def make_intents(value):
+    """Returns discord.Intents of 'default', 'all', or a list of intent names."""
+
+    if value == "default":
+        return discord.Intents.default()
+    elif value == "all":
+        return discord.Intents.all()
+
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    return discord.Intents(**{name: True for name in names})
+
+
+def make_member_cache(value, intents):
+    """Returns discord.MemberCacheFlags of 'none', 'all', 'intents', or flag names."""
+
+    if value == "none":
+        return discord.MemberCacheFlags.none()
+    elif value == "all":
+        return discord.MemberCacheFlags.all()
+    elif value == "intents":
+        return discord.MemberCacheFlags.from_intents(intents)
+
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    return discord.MemberCacheFlags(**{name: True for name in names})
+
+
+def client_options(section):
+    """Returns keyword arguments of the bot's constructor for a [Cache] section.
+
+    - section is a config.ini section, or a dict of the same keys.
+    """
+
+    settings = dict(PRESETS[section.get("preset", "lean")])
+    for key in PRESETS["lean"]:
+        # configparser keys are lower case
+        if key.lower() in section:
+            settings[key] = section[key.lower()]
+        elif key in section:
+            settings[key] = section[key]
+
+    intents = make_intents(settings["intents"])
+    maxMessages = int(settings["maxMessages"])
+
+    return {
+        "intents": intents,
+        # None turns the message cache off
+        "max_messages": maxMessages if maxMessages > 0 else None,
+        "member_cache_flags": make_member_cache(settings["memberCache"], intents),
+        "chunk_guilds_at_startup": settings["chunkGuilds"].lower() == "true"
+        and intents.members,
+    }
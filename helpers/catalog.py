@@ -0,0 +1,289 @@
+"""Columnar, memory-mapped item catalog built from ao-bin-dumps items.json.
+
+- Column 'id' holds UniqueName, one column per locale holds LocalizedNames.
+- Each column is stored as an offsets table (uint32) followed by UTF-8 bytes.
+- The file is memory-mapped read-only, so processes share the same pages.
+
+File layout:
+    MAGIC | header length (uint32) | JSON header | padding | columns...
+    Each column: offsets (count + 1 uint32) | UTF-8 data | padding
+"""
+
+import datetime as DT
+import json
+import mmap
+import os
+import struct
+import urllib.request
+from sys import intern
+import numpy as np
+
+from helpers import warmstart
+from helpers.completion import PrefixIndex
+from helpers.shorthand import ShorthandTable
+
+MAGIC = b"AOCAT001"
+
+# Catalogs already opened in this process, keyed by real path
+# Cog reloads reuse these instead of mapping the file again
+_opened = {}
+
+
+def align(position):
+    """Round position up to a multiple of 8 bytes."""
+
+    return (position + 7) // 8 * 8
+
+
+def build_catalog(items, path, source=""):
+    """Write items.json data (list of dicts) to a catalog file at path.
+
+    - Written to a temporary file first, then renamed over path.
+    - Items with no 'UniqueName' are skipped.
+    - Missing localizations are stored as empty strings.
+    """
+
+    items = [item for item in items if item.get("UniqueName")]
+
+    # Every locale that appears in any item
+    locales = sorted(
+        {locale for item in items for locale in (item.get("LocalizedNames") or {})}
+    )
+
+    # Encode each column into (offsets, blob)
+    columnValues = [("id", [item["UniqueName"] for item in items])]
+    for locale in locales:
+        columnValues.append(
+            (
+                locale,
+                [(item.get("LocalizedNames") or {}).get(locale, "") for item in items],
+            )
+        )
+
+    encoded = []
+    for (name, values) in columnValues:
+        values = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(values) + 1, dtype="<u4")
+        offsets[1:] = np.cumsum([len(value) for value in values])
+        encoded.append((name, offsets.tobytes(), b"".join(values)))
+
+    # Column positions are relative to the start of the columns section
+    # Each column starts 8 bytes aligned
+    columns = []
+    position = 0
+    for (name, offsets, blob) in encoded:
+        columns.append(
+            {"name": name, "offsets": position, "data": position + len(offsets)}
+        )
+        position = align(position + len(offsets) + len(blob))
+
+    header = {
+        "count": len(items),
+        "locales": locales,
+        "columns": columns,
+        "source": source,
+        "built": DT.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    headerBytes = json.dumps(header).encode("utf-8")
+    columnsStart = align(len(MAGIC) + 4 + len(headerBytes))
+
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(headerBytes)))
+        f.write(headerBytes)
+
+        for column, (name, offsets, blob) in zip(columns, encoded):
+            f.write(b"\0" * (columnsStart + column["offsets"] - f.tell()))
+            f.write(offsets)
+            f.write(blob)
+
+    os.replace(tmpPath, path)
+
+
+class Catalog:
+    """Read-only view of a catalog file.
+
+    - name(i, locale) and id(i) decode a single entry straight from the map.
+    - column(name) decodes a whole column once and keeps it.
+    - search_column(name) is the lowercased column, used as a search index.
+    - prefix_index(locale) completes prefixes of item IDs and names in locale.
+    - shorthand_table() resolves tier/enchantment shorthand like '4.1 bag'.
+    - index(itemID) returns the row of an item ID.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog file.")
+
+        (headerLength,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        headerStart = len(MAGIC) + 4
+        header = json.loads(
+            self._map[headerStart : headerStart + headerLength].decode("utf-8")
+        )
+
+        self.count = header["count"]
+        self.locales = header["locales"]
+        self.built = header["built"]
+
+        # Column name -> (offsets array, start of data)
+        # Offsets are views on the map, nothing is copied
+        columnsStart = align(headerStart + headerLength)
+        self._columns = {}
+        for column in header["columns"]:
+            offsets = np.frombuffer(
+                self._map,
+                dtype="<u4",
+                count=self.count + 1,
+                offset=columnsStart + column["offsets"],
+            )
+            self._columns[column["name"]] = (offsets, columnsStart + column["data"])
+
+        # Decoded and lowercased columns, and ID -> row, only built when needed
+        # A locale's search index is only built once someone searches in it
+        self._decoded = {}
+        self._lowered = {}
+        self._prefixes = {}
+        self._shorthand = None
+        self._rows = None
+
+    def __len__(self):
+        return self.count
+
+    def _get(self, column, i):
+        offsets, data = self._columns[column]
+        return self._map[data + offsets[i] : data + offsets[i + 1]].decode("utf-8")
+
+    def id(self, i):
+        """Returns UniqueName of row i."""
+
+        return self._get("id", i)
+
+    def name(self, i, locale="EN-US"):
+        """Returns localized name of row i, falls back to its ID if missing."""
+
+        if locale in self._columns:
+            name = self._get(locale, i)
+            if name:
+                return name
+        return self.id(i)
+
+    def column(self, name):
+        """Returns whole column as a list of strings (decoded once)."""
+
+        if name not in self._decoded:
+            offsets, data = self._columns[name]
+            blob = self._map[data : data + int(offsets[-1])]
+            self._decoded[name] = [
+                intern(blob[offsets[i] : offsets[i + 1]].decode("utf-8"))
+                for i in range(self.count)
+            ]
+
+        return self._decoded[name]
+
+    def search_column(self, name):
+        """Returns whole column lowercased, built once per column."""
+
+        if name not in self._lowered:
+            self._lowered[name] = [value.lower() for value in self.column(name)]
+
+        return self._lowered[name]
+
+    def prefix_index(self, locale):
+        """Returns PrefixIndex of item IDs and names in locale, built once."""
+
+        if locale not in self._prefixes:
+            columns = [self.search_column("id")]
+            if locale in self._columns:
+                columns.append(self.search_column(locale))
+            self._prefixes[locale] = PrefixIndex(columns)
+
+        return self._prefixes[locale]
+
+    def shorthand_table(self):
+        """Returns ShorthandTable of the catalog, built once."""
+
+        if self._shorthand is None:
+            if "EN-US" in self._columns:
+                names = self.column("EN-US")
+            else:
+                names = [""] * self.count
+            self._shorthand = ShorthandTable(self.column("id"), names)
+
+        return self._shorthand
+
+    def index(self, itemID):
+        """Returns row of item ID, None if not in catalog."""
+
+        if self._rows is None:
+            self._rows = {itemID: i for (i, itemID) in enumerate(self.column("id"))}
+
+        return self._rows.get(itemID)
+
+    def dump_indexes(self):
+        """Returns the search indexes built so far, for a warm restart."""
+
+        return {
+            "built": self.built,
+            "lowered": self._lowered,
+            "prefixes": self._prefixes,
+            "shorthand": self._shorthand,
+            "rows": self._rows,
+        }
+
+    def load_indexes(self, state):
+        """Reuse search indexes of dump_indexes(), if built from the same file."""
+
+        if state["built"] != self.built:
+            return
+
+        self._lowered.update(state["lowered"])
+        self._prefixes.update(state["prefixes"])
+        self._shorthand = self._shorthand or state["shorthand"]
+        self._rows = self._rows or state["rows"]
+
+
+def load_catalog(path, sourceURL, maxAgeHours=24):
+    """Open catalog at path, rebuilding it from sourceURL if missing or too old.
+
+    - Reuses the Catalog already opened in this process if file is unchanged.
+    - If download fails but an old file exists, the old file is used.
+    """
+
+    path = os.path.realpath(path)
+
+    try:
+        age = DT.datetime.now().timestamp() - os.path.getmtime(path)
+    except OSError:
+        age = None
+
+    if age is None or age > maxAgeHours * 3600:
+        try:
+            with urllib.request.urlopen(sourceURL) as url:
+                items = json.loads(url.read().decode())
+            build_catalog(items, path, source=sourceURL)
+        except Exception as e:
+            print(e)
+            if age is None:
+                raise
+
+    mtime = os.path.getmtime(path)
+    if path in _opened and _opened[path][0] == mtime:
+        return _opened[path][1]
+
+    catalog = Catalog(path)
+    _opened[path] = (mtime, catalog)
+
+    # Search indexes built by the last run, if the catalog is the same
+    warmstart.register(
+        "catalog",
+        catalog.dump_indexes,
+        lambda state, downtime: catalog.load_indexes(state),
+    )
+
+    return catalog
@@ -0,0 +1,170 @@
+"""Cache of rendered chart PNGs, keyed by a hash of the chart's input data."""
+
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import cachemanager, warmstart
+
+# Shared by all cogs, and kept over cog reloads
+_cache = None
+_renderer = None
+
+
+def chart_key(*parts):
+    """Returns hash of chart inputs.
+
+    - parts can be NumPy arrays (hashed by their bytes), bytes, or anything
+        else (hashed by its str()).
+    """
+
+    sha = hashlib.sha1()
+    for part in parts:
+        if hasattr(part, "tobytes"):
+            data = part.tobytes()
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            data = str(part).encode("utf-8")
+
+        # Length prefix so that ('ab', 'c') and ('a', 'bc') differ
+        sha.update(len(data).to_bytes(8, "little"))
+        sha.update(data)
+
+    return sha.hexdigest()
+
+
+class ChartCache:
+    """Rendered charts in memory, and optionally on disk.
+
+    - The memory layer is the "charts" cache of helpers/cachemanager.py,
+        bounded by maxBytes and the total budget. Charts are evicted by
+        render time per byte, so slow plots stay longest.
+    - get(key) looks in memory first, then on disk.
+    - Disk files are written by the render thread, off the event loop, and
+        deleted oldest first once they exceed maxDiskBytes. Their sizes are
+        kept in diskFiles (listed once at startup), so no directory listing
+        per chart.
+    """
+
+    def __init__(self, maxBytes, directory=None, maxDiskBytes=0):
+        self.directory = directory
+        self.maxDiskBytes = maxDiskBytes
+        self.charts = cachemanager.cache("charts", maxBytes)
+
+        # Path -> bytes of each file on disk, oldest first
+        # Only changed by the render thread after this
+        self.diskFiles = OrderedDict()
+        self.diskSize = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+            files = []
+            for name in os.listdir(directory):
+                if name.endswith(".png"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+            for (mtime, size, path) in sorted(files):
+                self.diskFiles[path] = size
+                self.diskSize += size
+
+    def get(self, key):
+        """Returns PNG bytes of key, None if not cached."""
+
+        data = self.charts.get(key)
+        if data is not None:
+            return data
+
+        if self.directory:
+            try:
+                with open(os.path.join(self.directory, key + ".png"), "rb") as f:
+                    data = f.read()
+            except OSError:
+                pass
+            else:
+                self.charts.put(key, data, len(data))
+                return data
+
+        return None
+
+    def put(self, key, data, cost=1.0):
+        """Cache PNG bytes of key, cost is seconds it took to render."""
+
+        self.charts.put(key, data, len(data), cost)
+
+        if self.directory:
+            renderer().submit(self._write_disk, key, data)
+
+    def _write_disk(self, key, data):
+        # Runs on the render thread, errors are printed since nobody waits
+        try:
+            path = os.path.join(self.directory, key + ".png")
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+            self.diskSize += len(data) - self.diskFiles.pop(path, 0)
+            self.diskFiles[path] = len(data)
+            self._prune_disk()
+        except OSError as e:
+            print(f"Could not save chart {key}: {e}")
+
+    def _prune_disk(self):
+        if not self.maxDiskBytes:
+            return
+
+        while self.diskSize > self.maxDiskBytes and self.diskFiles:
+            (path, size) = self.diskFiles.popitem(last=False)
+            self.diskSize -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def chart_cache(maxBytes, directory=None, maxDiskBytes=0):
+    """Returns the shared ChartCache, created on first call.
+
+    - Later calls apply maxBytes, e.g. after a cog reload.
+    """
+
+    global _cache
+
+    if _cache is None:
+        _cache = ChartCache(maxBytes, directory, maxDiskBytes)
+        warmstart.register("charts", _dump, _load)
+    else:
+        cachemanager.cache("charts", maxBytes)
+
+    return _cache
+
+
+def _dump():
+    """Returns charts in memory as [(key, PNG bytes, cost)], lowest priority first."""
+
+    return _cache.charts.items()
+
+
+def _load(state, downtime):
+    # Charts are keyed by their data, so saved charts never go stale
+    for (key, data, cost) in state:
+        _cache.charts.put(key, data, len(data), cost)
+
+
+def renderer():
+    """Returns the shared thread that renders charts, created on first call.
+
+    - pyplot keeps global state, so all plots are drawn by this one thread,
+        off the event loop: loop.run_in_executor(renderer(), plot, ...).
+    """
+
+    global _renderer
+
+    if _renderer is None:
+        _renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+
+    return _renderer
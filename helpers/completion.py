@@ -0,0 +1,60 @@
+"""Prefix completion over item IDs and names, using a sorted array and bisect."""
+
+from array import array
+from bisect import bisect_left
+
+
+class PrefixIndex:
+    """Sorted (key, row) pairs for prefix lookups.
+
+    - Keys are lowercased item IDs and names.
+    - Every word of a name is also a key, so 'bag' completes "Adept's Bag".
+    - complete(prefix) is two bisects plus a scan of the matching keys.
+    """
+
+    def __init__(self, columns):
+        """columns: lowercased catalog columns (lists of strings, same length)."""
+
+        pairs = []
+        for column in columns:
+            for (row, value) in enumerate(column):
+                if not value:
+                    continue
+
+                # Whole value, then from the start of every following word
+                pairs.append((value, row))
+                start = value.find(" ")
+                while start != -1:
+                    pairs.append((value[start + 1 :], row))
+                    start = value.find(" ", start + 1)
+
+        pairs.sort()
+        self.keys = [key for (key, row) in pairs]
+        self.rows = array("I", [row for (key, row) in pairs])
+
+    def complete(self, prefix, limit=10, scan=256):
+        """Returns up to limit rows with a key starting with prefix.
+
+        - Shortest keys first, so the closest completions come first.
+        - Returns None if more than scan keys start with prefix (e.g. 't4_'),
+            since the shortest could be any of them. Callers fall back to
+            a full scan, or pass scan=None to look at every key.
+        """
+
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        if scan is not None and hi - lo > scan:
+            return None
+
+        # Keep shortest key of each row
+        best = {}
+        for i in range(lo, hi):
+            row = self.rows[i]
+            if row not in best or len(self.keys[i]) < best[row]:
+                best[row] = len(self.keys[i])
+
+        return sorted(best, key=lambda row: (best[row], row))[:limit]
@@ -0,0 +1,107 @@
+"""Cooldown buckets per user, channel and guild, in front of upstream calls.
+
+- Each key (e.g. a user) has a token bucket: 'capacity' tokens, refilled
+    evenly over 'period' seconds.
+- Commands spend tokens by cost, expensive commands cost more.
+- Buckets are kept in an LRU of at most maxKeys entries, so memory stays
+    bounded however many users the bot sees. A dropped bucket is simply full.
+"""
+
+import time
+from collections import OrderedDict
+
+from helpers import memory, metrics
+
+# Scope -> (capacity, period in seconds)
+_limits = {"user": (20.0, 120.0), "channel": (60.0, 120.0), "guild": (120.0, 120.0)}
+
+# Command path -> cost in tokens
+_costs = {}
+
+# (scope, ID) -> (tokens, last update time)
+_buckets = OrderedDict()
+_maxKeys = 10000
+
+metrics.gauge("cooldown.buckets", lambda: len(_buckets))
+memory.track("cooldown", lambda: (len(_buckets), memory.approx_size(_buckets)))
+
+
+def configure(section):
+    """Read limits and costs from a config.ini section.
+
+    - user/channel/guild = capacity, period
+    - maxKeys = most buckets kept
+    - Any other key is the cost of a command path, e.g. prices = 4
+    """
+
+    global _maxKeys
+
+    for (name, value) in section.items():
+        if name in _limits:
+            (capacity, period) = [float(part) for part in value.split(",")]
+            _limits[name] = (capacity, period)
+        elif name == "maxkeys":
+            _maxKeys = int(value)
+        else:
+            _costs[name] = float(value)
+
+
+def cost(path, default=1.0):
+    """Returns cost of command path, e.g. 'prices', 'searchguild'."""
+
+    return _costs.get(path.lower(), default)
+
+
+def _tokens(key, now):
+    """Returns current tokens of bucket key, refilled up to now."""
+
+    (capacity, period) = _limits[key[0]]
+
+    if key in _buckets:
+        (tokens, updated) = _buckets[key]
+        _buckets.move_to_end(key)
+        return min(capacity, tokens + (now - updated) * capacity / period)
+
+    return capacity
+
+
+def charge(ctx, amount):
+    """Spend amount tokens from the user's, channel's and guild's buckets.
+
+    - Returns 0 if allowed, else seconds until it would be allowed.
+    - Nothing is spent unless all three buckets can afford it.
+    - A cost above a bucket's capacity needs (and empties) a full bucket.
+    - A negative cost counts as 0, it never refills buckets.
+    """
+
+    amount = max(amount, 0)
+    now = time.monotonic()
+    keys = [("user", ctx.author.id), ("channel", ctx.channel.id)]
+    if ctx.guild is not None:
+        keys.append(("guild", ctx.guild.id))
+
+    tokens = [_tokens(key, now) for key in keys]
+
+    # Seconds until each short bucket has enough tokens
+    retryAfter = 0
+    for (key, available) in zip(keys, tokens):
+        (capacity, period) = _limits[key[0]]
+        needed = min(amount, capacity) - available
+        if needed > 0:
+            retryAfter = max(retryAfter, needed * period / capacity)
+
+    if retryAfter > 0:
+        metrics.increment("cooldown.limited")
+        return retryAfter
+
+    for (key, available) in zip(keys, tokens):
+        (capacity, period) = _limits[key[0]]
+        _buckets[key] = (available - min(amount, capacity), now)
+        _buckets.move_to_end(key)
+
+    # Drop least recently used buckets
+    while len(_buckets) > _maxKeys:
+        _buckets.popitem(last=False)
+
+    metrics.increment("cooldown.charged", amount)
+    return 0
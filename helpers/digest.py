@@ -0,0 +1,82 @@
+"""Market digest figures, worked out for every item at once.
+
+- Price changes compare the volume weighted average price of the last
+    'hours' to that of the 'hours' before, for every item in one pass
+    (np.bincount over item codes).
+- Volume weighting keeps rare one-off prices (outliers with a count of 1)
+    from dominating the average, without a per-item median.
+"""
+
+import numpy as np
+
+
+def window_averages(history, itemCount, mask):
+    """Volume weighted average price of each item code, over rows in mask.
+
+    - Returns float array of length itemCount, NaN for items without rows.
+    """
+
+    items = history["item"][mask]
+    counts = history["count"][mask].astype("f8")
+    values = np.bincount(
+        items, weights=history["price"][mask] * counts, minlength=itemCount
+    )
+    volumes = np.bincount(items, weights=counts, minlength=itemCount)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(volumes > 0, values / volumes, np.nan)
+
+
+def price_changes(history, itemCount, location, now, hours=24):
+    """Average price of each item in location, now and 'hours' earlier.
+
+    - history is a HISTORY_DTYPE array with item codes, now is epoch seconds.
+    - Only normal quality (0 or 1) rows are used.
+    - Returns (recent, previous) float arrays of length itemCount, NaN for
+        items without data in that window.
+    """
+
+    history = history[(history["location"] == location) & (history["quality"] <= 1)]
+    seconds = history["timestamp"].astype("int64")
+
+    recent = seconds > now - hours * 3600
+    previous = ~recent & (seconds > now - 2 * hours * 3600)
+
+    return (
+        window_averages(history, itemCount, recent),
+        window_averages(history, itemCount, previous),
+    )
+
+
+def top_movers(recent, previous, count):
+    """Returns item codes of the count largest price changes, largest first.
+
+    - Changes are relative (recent / previous - 1), up or down.
+    - Items without both prices are left out.
+    """
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        changes = recent / previous - 1
+
+    valid = np.flatnonzero(np.isfinite(changes) & (previous > 0))
+    order = np.argsort(-np.abs(changes[valid]), kind="stable")
+
+    return [int(code) for code in valid[order[:count]]]
+
+
+def change_since(timestamps, prices, seconds):
+    """Returns (price, relative change) of the last price vs 'seconds' before it.
+
+    - timestamps are sorted epoch seconds. The earlier price is the last one
+        at or before the time, the first one if none is.
+    - Returns (None, None) without prices.
+    """
+
+    if len(prices) == 0:
+        return None, None
+
+    i = int(np.searchsorted(timestamps, timestamps[-1] - seconds, side="right"))
+    earlier = prices[max(i - 1, 0)]
+
+    change = prices[-1] / earlier - 1 if earlier else 0.0
+    return prices[-1], change
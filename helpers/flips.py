@@ -0,0 +1,126 @@
+"""Find profitable city-to-city and city-to-Black-Market flips in a price matrix."""
+
+import numpy as np
+
+from helpers.records import LOCATION_CODES
+
+BLACK_MARKET = LOCATION_CODES["Black Market"]
+
+
+class Flip:
+    """One flip: buy item at src's min sell price, sell it at dst.
+
+    - City flips sell with a sell order at dst's min sell price.
+    - Black Market flips sell instantly to its max buy order.
+    - age is seconds since the older of the two prices was seen.
+    """
+
+    __slots__ = (
+        "item",
+        "src",
+        "dst",
+        "buyPrice",
+        "sellPrice",
+        "profit",
+        "margin",
+        "age",
+    )
+
+    def __init__(self, item, src, dst, buyPrice, sellPrice, profit, margin, age):
+        self.item = item
+        self.src = src
+        self.dst = dst
+        self.buyPrice = buyPrice
+        self.sellPrice = sellPrice
+        self.profit = profit
+        self.margin = margin
+        self.age = age
+
+
+def top_flips(profit, margin, age, buyPrices, sellPrices, topN, dst=None):
+    """Returns topN Flip by profit.
+
+    - profit, margin, age are (items x src x dst) arrays,
+        or (items x src) arrays if every flip goes to location dst.
+    - buyPrices is (items x src), sellPrices is (items x dst) or (items,).
+    - Entries with profit <= 0 are left out.
+    """
+
+    flat = profit.ravel()
+    candidates = np.flatnonzero(flat > 0)
+    if len(candidates) > topN:
+        candidates = candidates[np.argpartition(-flat[candidates], topN)[:topN]]
+    candidates = candidates[np.argsort(-flat[candidates], kind="stable")]
+
+    flips = []
+    for index in candidates:
+        if dst is None:
+            item, src, toLocation = np.unravel_index(index, profit.shape)
+            cell = (item, src, toLocation)
+            sellPrice = sellPrices[item, toLocation]
+        else:
+            item, src = np.unravel_index(index, profit.shape)
+            toLocation = dst
+            cell = (item, src)
+            sellPrice = sellPrices[item]
+
+        flips.append(
+            Flip(
+                int(item),
+                int(src),
+                int(toLocation),
+                int(buyPrices[item, src]),
+                int(sellPrice),
+                int(profit[cell]),
+                float(margin[cell]),
+                int(age[cell]),
+            )
+        )
+
+    return flips
+
+
+def find_flips(matrix, now, maxAge, tax, topN, minMargin=0.0):
+    """Find best flips in a price matrix (see records.price_matrix).
+
+    - Returns {'city': [Flip], 'bm': [Flip]}, best profit first.
+    - Prices older than maxAge seconds are not used.
+    - tax is the fraction of the sell price lost when selling.
+    - Flips below minMargin (profit / buy price) are left out.
+    """
+
+    sell = matrix["sell"].astype("f8")
+    bmBuy = matrix["buy"][:, BLACK_MARKET].astype("f8")
+    sellAge = now - matrix["sellDate"]
+    bmBuyAge = now - matrix["buyDate"][:, BLACK_MARKET]
+
+    # Buy side is always a city's min sell price, Black Market sells nothing
+    fresh = (sell > 0) & (sellAge <= maxAge)
+    fresh[:, BLACK_MARKET] = False
+
+    # City -> city: sell with a sell order at the destination's min sell price
+    # Arrays are (items x src x dst)
+    profit = sell[:, None, :] * (1 - tax) - sell[:, :, None]
+    valid = fresh[:, :, None] & fresh[:, None, :]
+    valid &= ~np.eye(sell.shape[1], dtype=bool)[None, :, :]
+    age = np.maximum(sellAge[:, :, None], sellAge[:, None, :])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(valid, profit / sell[:, :, None], 0)
+    profit = np.where(valid & (margin >= minMargin), profit, 0)
+
+    cityFlips = top_flips(profit, margin, age, sell, sell, topN)
+
+    # City -> Black Market: sell instantly to the Black Market's max buy order
+    # Arrays are (items x src)
+    bmProfit = bmBuy[:, None] * (1 - tax) - sell
+    bmValid = fresh & ((bmBuy > 0) & (bmBuyAge <= maxAge))[:, None]
+    bmAge = np.maximum(sellAge, bmBuyAge[:, None])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmMargin = np.where(bmValid, bmProfit / sell, 0)
+    bmProfit = np.where(bmValid & (bmMargin >= minMargin), bmProfit, 0)
+
+    bmFlips = top_flips(bmProfit, bmMargin, bmAge, sell, bmBuy, topN, dst=BLACK_MARKET)
+
+    return {"city": cityFlips, "bm": bmFlips}
@@ -0,0 +1,200 @@
+"""Memory introspection: tracemalloc snapshots, cache and cog sizes.
+
+- Tracing (tracemalloc) slows allocations down and uses memory itself, so it
+    only runs when turned on, by config or by 'memory start'.
+- Each report compares a new snapshot to the previous one, so the top
+    growing allocation sites show up over a few reports.
+- Caches register a function returning (entries, bytes) with track(), and
+    every cog's container attributes are measured too.
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import types
+from collections import deque
+
+# Name -> function returning (entries, bytes)
+_tracked = {}
+
+# Snapshot filters, tracemalloc's own allocations are noise
+_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+CONTAINERS = (dict, list, set, frozenset, tuple, deque)
+SHARED = (type, types.ModuleType, types.FunctionType, types.MethodType)
+
+
+def track(name, function):
+    """Register function() -> (entries, bytes) as the size of cache name."""
+
+    _tracked[name] = function
+
+
+def approx_size(obj, limit=20000):
+    """Returns approximate bytes of obj and what it contains.
+
+    - Follows containers and __slots__ (not __dict__, which would reach
+        the whole bot), up to limit objects.
+    - Shared objects are only counted once.
+    """
+
+    seen = set()
+    stack = [obj]
+    total = 0
+
+    while stack and len(seen) < limit:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        # Modules, classes and functions are shared by everything
+        if isinstance(item, SHARED):
+            continue
+
+        try:
+            total += sys.getsizeof(item)
+        except TypeError:
+            continue
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, CONTAINERS):
+            stack.extend(item)
+        elif hasattr(item, "nbytes"):
+            # NumPy arrays report their buffer separately
+            total += item.nbytes
+
+        for slot in getattr(type(item), "__slots__", ()):
+            if hasattr(item, slot):
+                stack.append(getattr(item, slot))
+
+    return total
+
+
+def rss():
+    """Returns current resident set size in bytes, None if unknown."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+
+        # Peak, not current, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def megabytes(size):
+    return f"{size / 2 ** 20:.1f} MB" if size is not None else "?"
+
+
+class MemoryTracker:
+    """tracemalloc snapshots, each diffed against the previous one."""
+
+    def __init__(self, frames=10):
+        self.frames = frames
+        self.previous = None
+        self.previousTime = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def growth(self, top=15):
+        """Take a snapshot, returns (traced bytes, top growing stats).
+
+        - Stats are grouped by line, largest growth since the last call
+            first. The first call compares against nothing.
+        """
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+        traced = tracemalloc.get_traced_memory()[0]
+
+        if self.previous is None:
+            stats = snapshot.statistics("lineno")[:top]
+        else:
+            stats = snapshot.compare_to(self.previous, "lineno")[:top]
+
+        self.previous = snapshot
+        self.previousTime = time.time()
+        return traced, stats
+
+
+def cog_sizes(client):
+    """Returns [(name, entries, bytes)] of every cog's container attributes."""
+
+    sizes = []
+    for (cogName, cog) in client.cogs.items():
+        for (name, value) in vars(cog).items():
+            # NumPy arrays count elements
+            if hasattr(value, "nbytes"):
+                sizes.append((f"{cogName}.{name}", value.size, value.nbytes))
+            elif isinstance(value, CONTAINERS):
+                sizes.append((f"{cogName}.{name}", len(value), approx_size(value)))
+
+    return sizes
+
+
+def report(client, tracker, top=15):
+    """Returns memory report text of the bot."""
+
+    lines = [f"RSS: {megabytes(rss())}"]
+    lines.append(f"GC objects: {len(gc.get_objects())}, counts {gc.get_count()}")
+
+    # discord.py's own caches
+    lines.append(
+        f"Discord cache: {len(client.guilds)} guilds, {len(client.users)} users, "
+        f"{sum(guild.member_count or 0 for guild in client.guilds)} members, "
+        f"{len(client.cached_messages)} messages"
+    )
+
+    lines.append("\nCaches:")
+    for (name, function) in sorted(_tracked.items()):
+        try:
+            (entries, size) = function()
+            lines.append(f"    {name}: {entries} entries, {megabytes(size)}")
+        except Exception as e:
+            lines.append(f"    {name}: error {e}")
+
+    lines.append("\nCog attributes:")
+    for (name, entries, size) in sorted(cog_sizes(client), key=lambda s: -s[2]):
+        lines.append(f"    {name}: {entries} entries, ~{megabytes(size)}")
+
+    if not tracker.tracing:
+        lines.append("\nTracing is off, 'memory start' to trace allocations.")
+        return "\n".join(lines)
+
+    since = tracker.previousTime
+    (traced, stats) = tracker.growth(top)
+    lines.append(f"\nTraced: {megabytes(traced)}")
+    if since is None:
+        lines.append("Largest allocation sites (first snapshot):")
+    else:
+        lines.append(f"Top growing allocation sites, since {time.ctime(since)}:")
+    for stat in stats:
+        lines.append(f"    {stat}")
+
+    return "\n".join(lines)
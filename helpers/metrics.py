@@ -0,0 +1,39 @@
+"""Process-wide metrics, shown by the 'metrics' admin command.
+
+- Counters are numbers that only go up (increment).
+- Gauges are functions that return the current value when read.
+"""
+
+_counters = {}
+_gauges = {}
+
+
+def increment(name, amount=1):
+    """Add amount to counter name."""
+
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_value(name, value):
+    """Set counter name to value, e.g. last measured lag."""
+
+    _counters[name] = value
+
+
+def gauge(name, function):
+    """Register function() as the value of gauge name (replaces old one)."""
+
+    _gauges[name] = function
+
+
+def snapshot():
+    """Returns dict of all metric names and their current values, sorted by name."""
+
+    values = dict(_counters)
+    for (name, function) in _gauges.items():
+        try:
+            values[name] = function()
+        except Exception as e:
+            values[name] = f"error: {e}"
+
+    return dict(sorted(values.items()))
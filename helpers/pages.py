@@ -0,0 +1,187 @@
+"""Paginated embeds, turned with reactions, kept in a short-lived cache.
+
+- A command that computed more results than fit in one embed (e.g. all guild
+    members, 20 more suggestions) adds the message to the cache with every
+    page, then adds the PREVIOUS/NEXT reactions.
+- Turning a page only edits the message from the cache, no API calls for
+    data and no matching work.
+- The cache is keyed by message ID, bounded by count and bytes (the "pages"
+    cache of helpers/cachemanager.py) and by age (pages expire after 'ttl'
+    seconds).
+"""
+
+import time
+
+import discord
+
+from helpers import cachemanager, metrics, warmstart
+
+PREVIOUS = "\u25c0"
+NEXT = "\u25b6"
+
+# Shared by all cogs, and kept over cog reloads
+_cache = None
+
+
+def chunk_lines(lines, perPage):
+    """Returns lines split into pages of perPage lines each."""
+
+    return [lines[i : i + perPage] for i in range(0, len(lines), perPage)]
+
+
+def field_value(lines, limit=1024):
+    """Returns lines joined for an embed field, dropping lines over limit chars."""
+
+    value = "\n".join(lines)
+    while len(value) > limit and "\n" in value:
+        value = value[: value.rindex("\n")]
+    return value[:limit]
+
+
+class Paginated:
+    """An embed whose fields from fieldIndex on change with the page.
+
+    - pages is a list of pages, each a list of (name, value, inline) fields.
+    - The embed's footer shows the page number.
+    """
+
+    __slots__ = ("embed", "fieldIndex", "pages", "page", "footer", "created")
+
+    def __init__(self, embed, fieldIndex, pages):
+        self.embed = embed
+        self.fieldIndex = fieldIndex
+        self.pages = pages
+        self.page = 0
+        self.footer = embed.footer.text or None
+        self.created = time.monotonic()
+
+    def render(self):
+        """Returns a copy of the embed showing the current page."""
+
+        em = self.embed.copy()
+        for (k, (name, value, inline)) in enumerate(self.pages[self.page]):
+            em.set_field_at(self.fieldIndex + k, name=name, value=value, inline=inline)
+
+        pageText = f"Page {self.page + 1}/{len(self.pages)}, {PREVIOUS} {NEXT} to turn."
+        em.set_footer(text=f"{self.footer} {pageText}" if self.footer else pageText)
+        return em
+
+
+class PageCache:
+    """Paginated embeds by message ID, bounded by count, bytes and age."""
+
+    def __init__(self, maxEntries, ttl, maxBytes):
+        self.ttl = ttl
+        self.entries = cachemanager.cache("pages", maxBytes, maxEntries)
+
+    def add(self, messageID, paginated):
+        # Pages are cheap to lose (the message just stops turning), so the
+        # cost is low next to charts
+        self.entries.put(messageID, paginated, cost=0.1)
+
+    def get(self, messageID):
+        """Returns Paginated of message, None if not cached or expired."""
+
+        paginated = self.entries.get(messageID)
+        if paginated is None:
+            return None
+
+        if time.monotonic() - paginated.created > self.ttl:
+            self.entries.pop(messageID)
+            return None
+
+        return paginated
+
+    def turn(self, messageID, emoji):
+        """Turn page of message by reaction emoji.
+
+        - Returns the embed to show, None if the message is not cached,
+            expired, or the page did not change.
+        """
+
+        paginated = self.get(messageID)
+        if paginated is None:
+            return None
+
+        if emoji == NEXT:
+            page = min(paginated.page + 1, len(paginated.pages) - 1)
+        elif emoji == PREVIOUS:
+            page = max(paginated.page - 1, 0)
+        else:
+            return None
+
+        if page == paginated.page:
+            return None
+
+        paginated.page = page
+        metrics.increment("pages.turned")
+        return paginated.render()
+
+
+def page_cache(maxEntries, ttl, maxBytes):
+    """Returns the shared PageCache, created on first call.
+
+    - Later calls apply maxEntries and maxBytes, e.g. after a cog reload.
+    """
+
+    global _cache
+
+    if _cache is None:
+        _cache = PageCache(maxEntries, ttl, maxBytes)
+        warmstart.register("pages", _dump, _load)
+    else:
+        cachemanager.cache("pages", maxBytes, maxEntries)
+
+    return _cache
+
+
+def _dump():
+    """Returns cached pages as plain data, with their age in seconds."""
+
+    now = time.monotonic()
+    return [
+        (
+            messageID,
+            paginated.embed.to_dict(),
+            paginated.fieldIndex,
+            paginated.pages,
+            paginated.page,
+            now - paginated.created,
+        )
+        for (messageID, paginated, _) in _cache.entries.items()
+    ]
+
+
+def _load(state, downtime):
+    # Pages that expired while the bot was down are left out
+    now = time.monotonic()
+    for (messageID, embed, fieldIndex, pages, page, age) in state:
+        age += downtime
+        if age > _cache.ttl:
+            continue
+
+        paginated = Paginated(discord.Embed.from_dict(embed), fieldIndex, pages)
+        paginated.page = page
+        paginated.created = now - age
+        _cache.add(messageID, paginated)
+
+
+async def send_paginated(ctx, cache, embed, fieldIndex, pages, **fields):
+    """Send embed showing the first page, and cache it if there are more.
+
+    - embed already has the first page's fields, at fieldIndex on.
+    - fields are passed on to ctx.send (e.g. file).
+    - Returns the sent message.
+    """
+
+    paginated = Paginated(embed, fieldIndex, pages)
+    msg = await ctx.send(
+        embed=paginated.render() if len(pages) > 1 else embed, **fields
+    )
+
+    if len(pages) > 1:
+        cache.add(msg.id, paginated)
+        await msg.add_reaction(PREVIOUS)
+        await msg.add_reaction(NEXT)
+
+    return msg
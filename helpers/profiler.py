@@ -0,0 +1,107 @@
+"""Sampling profiler, turned on for a while by the 'profile' admin command.
+
+- A background thread samples the stacks of all other threads every
+    'interval' seconds (sys._current_frames), so profiled code runs at full
+    speed and nothing is installed while it is off.
+- Results are collapsed stacks, one line per distinct stack:
+    'thread;outer (file:line);...;inner (file:line) count'
+    which flamegraph.pl and speedscope read directly.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_label(frame):
+    """Returns 'function (file:line)' of frame's code."""
+
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def stack_labels(frame, limit=100):
+    """Returns labels of frame and its callers, outermost first."""
+
+    labels = []
+    while frame is not None and len(labels) < limit:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Samples all threads' stacks until stopped."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.time()
+
+    def _run(self):
+        ownID = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for (threadID, frame) in sys._current_frames().items():
+                if threadID == ownID:
+                    continue
+
+                stack = [names.get(threadID, str(threadID))] + stack_labels(frame)
+                self.stacks[";".join(stack)] += 1
+
+            self.samples += 1
+
+    def collapsed(self):
+        """Returns collapsed stacks text, most sampled first."""
+
+        return "\n".join(
+            f"{stack} {count}" for (stack, count) in self.stacks.most_common()
+        )
+
+    def top_functions(self, n=10, thread=None):
+        """Returns [(label, fraction of samples)] of functions on most stacks.
+
+        - Counts each function once per stack (inclusive time).
+        - thread only counts stacks of that thread name.
+        """
+
+        counts = Counter()
+        for (stack, count) in self.stacks.items():
+            labels = stack.split(";")
+            if thread is not None and labels[0] != thread:
+                continue
+            for label in set(labels[1:]):
+                counts[label] += count
+
+        return [
+            (label, count / max(self.samples, 1))
+            for (label, count) in counts.most_common(n)
+        ]
@@ -0,0 +1,44 @@
+"""Recording of the bot's command stream, for replay by tools/replay.py.
+
+- One JSON object per line: time (epoch seconds), content, channel, guild
+    and author IDs.
+- Only enough to replay the commands, no names or other message data.
+"""
+
+import json
+import time
+
+
+class CommandRecorder:
+    """Appends command messages to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.count = 0
+
+    def record(self, message):
+        """Append message (a discord.Message) to the recording."""
+
+        entry = {
+            "time": time.time(),
+            "content": message.content,
+            "channel": message.channel.id,
+            "guild": message.guild.id if message.guild else None,
+            "author": message.author.id,
+        }
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def load_recording(path):
+    """Returns list of recorded entries in path, sorted by time."""
+
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    return sorted(entries, key=lambda entry: entry["time"])
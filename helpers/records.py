@@ -0,0 +1,337 @@
+"""Compact data model for market data returned by the Data Project API.
+
+- Current prices are parsed into PriceRecord (__slots__, no per-row dict).
+- Historical prices are parsed into a NumPy structured array (HISTORY_DTYPE).
+- Locations and qualities are stored as small integer codes.
+"""
+
+import calendar
+import datetime as DT
+from sys import intern
+import numpy as np
+
+# Locations in alphabetical order, the index is the location code
+# These are the names returned by the Data Project API
+LOCATIONS = (
+    "Arthurs Rest",
+    "Black Market",
+    "Bridgewatch",
+    "Caerleon",
+    "Fort Sterling",
+    "Lymhurst",
+    "Martlock",
+    "Merlyns Rest",
+    "Morganas Rest",
+    "Thetford",
+)
+
+# Names used for plot titles, same ordering as LOCATIONS
+LOCATION_LABELS = (
+    "Arthur's Rest",
+    "Black Market",
+    "Bridgewatch",
+    "Caerleon",
+    "Fort Sterling",
+    "Lymhurst",
+    "Martlock",
+    "Merlyn's Rest",
+    "Morgana's Rest",
+    "Thetford",
+)
+
+# Location names as used in the API query string, i.e. '?locations=...'
+LOCATION_QUERY = ",".join(name.replace(" ", "") for name in LOCATIONS)
+
+# Location name -> location code
+# Both 'Fort Sterling' and 'FortSterling' spellings map to the same code
+LOCATION_CODES = {}
+for (code, name) in enumerate(LOCATIONS):
+    LOCATION_CODES[name] = code
+    LOCATION_CODES[name.replace(" ", "")] = code
+
+# Code for locations that are not in LOCATIONS (e.g. new markets)
+UNKNOWN_LOCATION = 255
+
+# Quality code -> suffix shown beside location
+# Quality 0 is returned for items without quality
+QUALITY_SUFFIXES = (
+    "",
+    "",
+    " (Good)",
+    " (Outstanding)",
+    " (Excellent)",
+    " (Masterpiece)",
+)
+
+# One row per (item, location, quality, hour) in historical prices
+HISTORY_DTYPE = np.dtype(
+    [
+        ("item", "u4"),
+        ("location", "u1"),
+        ("quality", "u1"),
+        ("timestamp", "datetime64[s]"),
+        ("price", "f8"),
+        ("count", "i8"),
+    ]
+)
+
+# Timestamps older than this (3 years) are the API's way of saying no data
+NO_DATA_AGE = 94608000
+
+
+def location_code(name):
+    """Returns location code of an API location name."""
+
+    return LOCATION_CODES.get(name, UNKNOWN_LOCATION)
+
+
+def parse_timestamp(timestamp):
+    """Convert API timestamp '%Y-%m-%dT%H:%M:%S' to UTC epoch seconds."""
+
+    return calendar.timegm(
+        DT.datetime.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S").timetuple()
+    )
+
+
+def age_string(timestamp, now=None):
+    """Returns how long ago an epoch timestamp is, e.g. '1.5 hours ago'."""
+
+    if now is None:
+        now = calendar.timegm(DT.datetime.utcnow().timetuple())
+
+    tdelta = now - timestamp
+
+    if tdelta >= NO_DATA_AGE:
+        return "NIL"
+    elif tdelta >= 3600:
+        return str(round(tdelta / 3600, 1)) + " hours ago"
+    elif tdelta >= 60:
+        return str(round(tdelta / 60)) + " mins ago"
+    else:
+        return str(round(tdelta)) + " sec ago"
+
+
+class PriceRecord:
+    """Current sell/buy order prices of an item at one location and quality.
+
+    - Dates are UTC epoch seconds.
+    - location is a code, use LOCATIONS[location] for its name.
+    """
+
+    __slots__ = (
+        "item",
+        "location",
+        "quality",
+        "sellPriceMin",
+        "sellPriceMinDate",
+        "buyPriceMax",
+        "buyPriceMaxDate",
+    )
+
+    def __init__(
+        self,
+        item,
+        location,
+        quality,
+        sellPriceMin,
+        sellPriceMinDate,
+        buyPriceMax,
+        buyPriceMaxDate,
+    ):
+        self.item = item
+        self.location = location
+        self.quality = quality
+        self.sellPriceMin = sellPriceMin
+        self.sellPriceMinDate = sellPriceMinDate
+        self.buyPriceMax = buyPriceMax
+        self.buyPriceMaxDate = buyPriceMaxDate
+
+    @property
+    def label(self):
+        """Location name with quality beside it, e.g. 'Caerleon (Good)'."""
+
+        if self.location == UNKNOWN_LOCATION:
+            name = "Unknown"
+        else:
+            name = LOCATIONS[self.location]
+
+        try:
+            return name + QUALITY_SUFFIXES[self.quality]
+        except IndexError:
+            return name
+
+
+def parse_prices(data):
+    """Parse 'stats/prices' JSON into a list of PriceRecord.
+
+    - Entries with neither sell nor buy orders are skipped.
+    - Item IDs are interned as the same few IDs repeat for every row.
+    """
+
+    records = []
+    for indivData in data:
+
+        # Skip if no data for entry
+        if indivData["sell_price_min"] == 0 and indivData["buy_price_max"] == 0:
+            continue
+
+        records.append(
+            PriceRecord(
+                intern(indivData["item_id"]),
+                location_code(indivData["city"]),
+                indivData.get("quality", 0),
+                indivData["sell_price_min"],
+                parse_timestamp(indivData["sell_price_min_date"]),
+                indivData["buy_price_max"],
+                parse_timestamp(indivData["buy_price_max_date"]),
+            )
+        )
+
+    return records
+
+
+def parse_history(data, itemCodes=None):
+    """Parse 'stats/charts' JSON into a HISTORY_DTYPE structured array.
+
+    - itemCodes maps item ID to the code stored in the 'item' field.
+        If not given, every row gets item code 0 (single item requests).
+        Series of IDs not in itemCodes are left out.
+    - Each series is copied in with a single slice assignment.
+    """
+
+    # IDs that were not asked for (renamed, aliased, other case) are left out
+    if itemCodes is not None:
+        data = [series for series in data if series["item_id"] in itemCodes]
+
+    # Count rows first so that the array is only allocated once
+    total = sum(len(series["data"]["timestamps"]) for series in data)
+    history = np.zeros(total, dtype=HISTORY_DTYPE)
+
+    start = 0
+    for series in data:
+        points = series["data"]
+        end = start + len(points["timestamps"])
+
+        if itemCodes is None:
+            history["item"][start:end] = 0
+        else:
+            history["item"][start:end] = itemCodes[series["item_id"]]
+
+        history["location"][start:end] = location_code(series["location"])
+        history["quality"][start:end] = series["quality"]
+        history["timestamp"][start:end] = np.array(
+            [timestamp[:19] for timestamp in points["timestamps"]],
+            dtype="datetime64[s]",
+        )
+        history["price"][start:end] = points["prices_avg"]
+        history["count"][start:end] = points["item_count"]
+
+        start = end
+
+    return history
+
+
+def reject_outliers(prices, m=10):
+    """Returns boolean mask of prices that are not outliers.
+
+    - Uses distance from median, scaled by the median distance.
+    - Same rule as the old list-based reject_outliers.
+    """
+
+    if len(prices) == 0:
+        return np.zeros(0, dtype=bool)
+
+    d = np.abs(prices - np.median(prices))
+    mdev = np.median(d)
+    if mdev:
+        return d / mdev < m
+    return np.ones(len(prices), dtype=bool)
+
+
+def history_series(history, location, quality=1):
+    """Returns rows of one location and quality, sorted by time, outliers removed."""
+
+    series = history[
+        (history["location"] == location) & (history["quality"] == quality)
+    ]
+    series = series[np.argsort(series["timestamp"], kind="stable")]
+
+    return series[reject_outliers(series["price"])]
+
+
+def average_prices(history, itemCount, locations=None, m=10):
+    """Average price of each item code in history, outliers removed.
+
+    - Returns float array of length itemCount, 0 for items without data.
+    - Only rows in locations (codes) are used, if given.
+    - All items are done in one pass on a padded (items x points) array.
+    """
+
+    if locations is not None:
+        history = history[np.isin(history["location"], list(locations))]
+
+    averages = np.zeros(itemCount)
+    if len(history) == 0:
+        return averages
+
+    # Group rows by item, and give each row its position within its item
+    history = history[np.argsort(history["item"], kind="stable")]
+    items, starts, counts = np.unique(
+        history["item"], return_index=True, return_counts=True
+    )
+    positions = np.arange(len(history)) - np.repeat(starts, counts)
+
+    # Ragged prices -> padded array, missing points are NaN
+    prices = np.full((len(items), counts.max()), np.nan)
+    prices[np.repeat(np.arange(len(items)), counts), positions] = history["price"]
+
+    # Same rule as reject_outliers, for every item at once
+    d = np.abs(prices - np.nanmedian(prices, axis=1)[:, None])
+    mdev = np.nanmedian(d, axis=1)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        keep = np.where(mdev > 0, d / mdev < m, ~np.isnan(d))
+
+    kept = np.where(keep, prices, 0)
+    keptCounts = keep.sum(axis=1)
+    averages[items] = np.where(
+        keptCounts > 0, kept.sum(axis=1) / np.maximum(keptCounts, 1), 0
+    )
+
+    return averages
+
+
+def price_matrix(records, itemCodes, itemCount, qualities=(0, 1)):
+    """Dense item x location matrices of current prices.
+
+    - Returns dict of arrays, shape (itemCount, len(LOCATIONS)):
+        'sell', 'sellDate', 'buy', 'buyDate' (dates are epoch seconds).
+    - Missing prices are 0.
+    - Only records of the given qualities are used.
+    """
+
+    shape = (itemCount, len(LOCATIONS))
+    matrix = {
+        "sell": np.zeros(shape, dtype="i8"),
+        "sellDate": np.zeros(shape, dtype="i8"),
+        "buy": np.zeros(shape, dtype="i8"),
+        "buyDate": np.zeros(shape, dtype="i8"),
+    }
+
+    for record in records:
+        if record.quality not in qualities or record.location == UNKNOWN_LOCATION:
+            continue
+
+        # IDs that were not asked for (renamed, aliased, other case) are left out
+        code = itemCodes.get(record.item)
+        if code is None:
+            continue
+
+        cell = (code, record.location)
+        if record.sellPriceMin:
+            matrix["sell"][cell] = record.sellPriceMin
+            matrix["sellDate"][cell] = record.sellPriceMinDate
+        if record.buyPriceMax:
+            matrix["buy"][cell] = record.buyPriceMax
+            matrix["buyDate"][cell] = record.buyPriceMaxDate
+
+    return matrix
@@ -0,0 +1,260 @@
+"""Rolling statistics of price series, updated one point at a time.
+
+- Each series (e.g. an item in one city, or gold) keeps running sums over a
+    time window, so a new point costs O(1): it is added to the sums, and
+    points older than the window are taken out.
+    SMA: mean price over the window.
+    EMA: exponential moving average, weighted by time between points.
+    VWAP: mean price weighted by item count, None without counts.
+    std: standard deviation over the window, for bands of SMA +- width * std.
+- Only points newer than the last one fed are added, so refetching the same
+    7 days of history only adds the new hours.
+- The values at each point are kept in a ring buffer (ROLLING_DTYPE) for
+    plotting, up to 'keep' points per series.
+- Series of a store are kept in the "rolling.<name>" cache of
+    helpers/cachemanager.py, bounded by count and bytes.
+"""
+
+import math
+import sys
+from collections import deque
+
+import numpy as np
+
+from helpers import cachemanager, warmstart
+
+# One row per point fed, oldest first from RollingStats.history()
+ROLLING_DTYPE = np.dtype(
+    [
+        ("timestamp", "datetime64[s]"),
+        ("sma", "f8"),
+        ("ema", "f8"),
+        ("vwap", "f8"),
+        ("std", "f8"),
+    ]
+)
+
+# Name -> RollingStore, shared by all cogs and kept over cog reloads
+_stores = {}
+
+
+def epoch_seconds(timestamps):
+    """Returns int64 array of epoch seconds, of datetime64 or datetime values."""
+
+    return np.asarray(timestamps, dtype="datetime64[s]").astype("int64")
+
+
+class RollingStats:
+    """Rolling statistics of one series, see module docstring.
+
+    - window and tau (EMA time constant) are in seconds.
+    - Sums are of prices minus the first price, so that squares of large
+        prices do not lose precision.
+    """
+
+    __slots__ = (
+        "window",
+        "tau",
+        "points",
+        "shift",
+        "sumPrice",
+        "sumSquares",
+        "sumValue",
+        "sumCount",
+        "ema",
+        "first",
+        "last",
+        "ring",
+        "head",
+        "size",
+    )
+
+    def __init__(self, window, tau, keep):
+        self.window = window
+        self.tau = tau
+
+        # (timestamp, price, count) of points in the window
+        self.points = deque()
+        self.shift = None
+        self.sumPrice = 0.0
+        self.sumSquares = 0.0
+        self.sumValue = 0.0
+        self.sumCount = 0
+        self.ema = None
+
+        self.first = None
+        self.last = None
+
+        self.ring = np.zeros(keep, dtype=ROLLING_DTYPE)
+        self.head = 0
+        self.size = 0
+
+    def add(self, timestamp, price, count=0):
+        """Add a point newer than the last one, O(1) amortized."""
+
+        if self.shift is None:
+            self.shift = price
+            self.first = timestamp
+
+        # EMA weighted by time since the last point
+        if self.ema is None:
+            self.ema = price
+        else:
+            alpha = 1 - math.exp(-(timestamp - self.last) / self.tau)
+            self.ema += alpha * (price - self.ema)
+        self.last = timestamp
+
+        shifted = price - self.shift
+        self.points.append((timestamp, shifted, count))
+        self.sumPrice += shifted
+        self.sumSquares += shifted * shifted
+        self.sumValue += shifted * count
+        self.sumCount += count
+
+        # Take out points older than the window
+        while self.points[0][0] <= timestamp - self.window:
+            (_, oldShifted, oldCount) = self.points.popleft()
+            self.sumPrice -= oldShifted
+            self.sumSquares -= oldShifted * oldShifted
+            self.sumValue -= oldShifted * oldCount
+            self.sumCount -= oldCount
+
+        # Values at this point, oldest overwritten once keep points are kept
+        row = self.ring[self.head]
+        row["timestamp"] = timestamp
+        row["sma"] = self.sma
+        row["ema"] = self.ema
+        row["vwap"] = self.vwap if self.sumCount else np.nan
+        row["std"] = self.std
+        self.head = (self.head + 1) % len(self.ring)
+        self.size = min(self.size + 1, len(self.ring))
+
+    @property
+    def sma(self):
+        return self.shift + self.sumPrice / len(self.points)
+
+    @property
+    def vwap(self):
+        if not self.sumCount:
+            return None
+        return self.shift + self.sumValue / self.sumCount
+
+    @property
+    def std(self):
+        n = len(self.points)
+        mean = self.sumPrice / n
+        return math.sqrt(max(0.0, self.sumSquares / n - mean * mean))
+
+    def bands(self, width=2):
+        """Returns (lower, upper) band of SMA +- width standard deviations."""
+
+        (sma, std) = (self.sma, self.std)
+        return sma - width * std, sma + width * std
+
+    @property
+    def nbytes(self):
+        """Approximate bytes of the ring buffer and the window's points."""
+
+        # Each point is a tuple of 3 numbers, ~170 bytes
+        return self.ring.nbytes + sys.getsizeof(self.points) + 170 * len(self.points)
+
+    def history(self):
+        """Returns copy of the kept values, ROLLING_DTYPE array oldest first."""
+
+        if self.size < len(self.ring):
+            return self.ring[: self.size].copy()
+        return np.concatenate([self.ring[self.head :], self.ring[: self.head]])
+
+
+class RollingStore:
+    """RollingStats by key, at most maxSeries series and maxBytes."""
+
+    # A dropped series is rebuilt from the next history fetched, only its
+    # older points are lost, so it is cheap next to a chart
+    COST = 0.05
+
+    def __init__(self, name, window, tau, keep, maxSeries, maxBytes):
+        self.window = window
+        self.tau = tau
+        self.keep = keep
+        self.series = cachemanager.cache(f"rolling.{name}", maxBytes, maxSeries)
+
+    def get(self, key):
+        """Returns RollingStats of key, None if never fed."""
+
+        return self.series.peek(key)
+
+    def feed(self, key, timestamps, prices, counts=None):
+        """Add the points of a series that are newer than the last one fed.
+
+        - timestamps are datetime64 or datetime values, sorted.
+        - Starts over if the series goes back further than the kept
+            one (e.g. 'gold 30' after 'gold 7'), else earlier points
+            would be missing.
+        - Returns the series' RollingStats, None if no points are given
+            (e.g. a city without history this time), even if it was fed before.
+        """
+
+        seconds = epoch_seconds(timestamps)
+        if not len(seconds):
+            return None
+
+        # A hit when the series was kept, so only new points are added
+        stats = self.series.get(key)
+
+        if stats is not None and seconds[0] < stats.first:
+            stats = None
+        if stats is None:
+            stats = RollingStats(self.window, self.tau, self.keep)
+
+        # Only the new points, found with a bisect
+        start = 0
+        if stats.last is not None:
+            start = int(np.searchsorted(seconds, stats.last, side="right"))
+
+        for i in range(start, len(seconds)):
+            stats.add(
+                int(seconds[i]),
+                float(prices[i]),
+                int(counts[i]) if counts is not None else 0,
+            )
+
+        # Put again, since its size changed
+        self.series.put(key, stats, stats.nbytes, self.COST)
+
+        return stats
+
+    def restore(self, series):
+        """Put back saved [(key, RollingStats, cost)], lowest priority first.
+
+        - Series saved with another window, EMA time or keep are left out.
+        """
+
+        for (key, stats, cost) in series:
+            if (stats.window, stats.tau, len(stats.ring)) == (
+                self.window,
+                self.tau,
+                self.keep,
+            ):
+                self.series.put(key, stats, stats.nbytes, cost)
+
+
+def rolling_store(name, window, tau, keep, maxSeries, maxBytes):
+    """Returns the shared RollingStore of name, created on first call.
+
+    - window and tau are in seconds, keep is points kept per series.
+    - Later calls apply maxSeries and maxBytes, e.g. after a cog reload.
+    """
+
+    if name in _stores:
+        cachemanager.cache(f"rolling.{name}", maxBytes, maxSeries)
+    else:
+        store = RollingStore(name, window, tau, keep, maxSeries, maxBytes)
+        _stores[name] = store
+        warmstart.register(
+            f"rolling.{name}",
+            lambda: store.series.items(),
+            lambda state, downtime: store.restore(state),
+        )
+
+    return _stores[name]
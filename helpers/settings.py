@@ -0,0 +1,117 @@
+"""Per-user and per-guild settings persisted to JSON files."""
+
+import json
+import os
+
+
+class ScopedSettings:
+    """Settings that can be set per user and per guild.
+
+    - get(user, guild) returns the user's value, else the guild's, else default.
+    - Saved to path after every change.
+    - User and guild IDs are stored as strings (JSON keys).
+    """
+
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+
+        self.users = data.get("users", {})
+        self.guilds = data.get("guilds", {})
+
+    def get(self, userID, guildID=None):
+        """Returns setting of user, falls back to guild then default."""
+
+        if str(userID) in self.users:
+            return self.users[str(userID)]
+        if guildID is not None and str(guildID) in self.guilds:
+            return self.guilds[str(guildID)]
+        return self.default
+
+    def set_user(self, userID, value):
+        """Set (or clear with None) the setting of a user."""
+
+        self._set(self.users, userID, value)
+
+    def set_guild(self, guildID, value):
+        """Set (or clear with None) the setting of a guild."""
+
+        self._set(self.guilds, guildID, value)
+
+    def _set(self, scope, ID, value):
+        if value is None:
+            scope.pop(str(ID), None)
+        else:
+            scope[str(ID)] = value
+
+        self.save()
+
+    def save(self):
+        """Write settings to path (via a temporary file)."""
+
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump({"users": self.users, "guilds": self.guilds}, f)
+        os.replace(tmpPath, self.path)
+
+
+class WatchLists:
+    """Item IDs watched by each guild, persisted to a JSON file.
+
+    - Guild IDs are stored as strings (JSON keys), item IDs in the order added.
+    - Saved to path after every change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.guilds = json.load(f)
+        except (OSError, ValueError):
+            self.guilds = {}
+
+    def get(self, guildID):
+        """Returns list of item IDs watched by guild."""
+
+        return self.guilds.get(str(guildID), [])
+
+    def all_items(self):
+        """Returns item IDs watched by any guild, each once."""
+
+        return list(
+            dict.fromkeys(itemID for items in self.guilds.values() for itemID in items)
+        )
+
+    def add(self, guildID, itemID):
+        items = self.guilds.setdefault(str(guildID), [])
+        if itemID not in items:
+            items.append(itemID)
+            self.save()
+
+    def remove(self, guildID, itemID):
+        """Stop watching itemID, returns False if it was not watched."""
+
+        items = self.guilds.get(str(guildID), [])
+        if itemID not in items:
+            return False
+
+        items.remove(itemID)
+        if not items:
+            del self.guilds[str(guildID)]
+        self.save()
+        return True
+
+    def save(self):
+        """Write watch lists to path (via a temporary file)."""
+
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump(self.guilds, f)
+        os.replace(tmpPath, self.path)
@@ -0,0 +1,131 @@
+"""Resolve tier/enchantment shorthand like '4.1 bag' or 't6.3 claymore' to item IDs."""
+
+import re
+
+# Tier and enchantment names in front of English item names
+TIER_NAMES = [
+    "Beginner's",
+    "Novice's",
+    "Journeyman's",
+    "Adept's",
+    "Expert's",
+    "Master's",
+    "Grandmaster's",
+    "Elder's",
+    "Beginner",
+    "Novice",
+    "Journeyman",
+    "Adept",
+    "Expert",
+    "Master",
+    "Grandmaster",
+    "Elder",
+    "Stonestream",
+    "Rushwater",
+    "Thunderfall",
+]
+ENCHANT_NAMES = ["Uncommon", "Rare", "Exceptional"]
+
+# Enchantment labels at end of item ID to know if item has enchantment
+ENCHANT_NUMBERS = ["@1", "@2", "@3"]
+
+# Lowercased, for stripping names
+_PREFIX_WORDS = {name.lower() for name in TIER_NAMES + ENCHANT_NAMES}
+
+# T4_BAG, T6_2H_CLAYMORE@3, T4_HIDE_LEVEL1@1
+_ID_PATTERN = re.compile(r"^T([1-8])_(.+?)(?:_LEVEL\d)?(?:@(\d))?$")
+
+# '4.1 bag', 't6.3 claymore', 'T8 hide', 'bag 4.1'
+_SHORTHAND_FRONT = re.compile(r"^t?([1-8])(?:\.([0-4]))?\s+(.+)$")
+_SHORTHAND_BACK = re.compile(r"^(.+?)\s+t?([1-8])(?:\.([0-4]))?$")
+
+
+def parse_shorthand(text):
+    """Returns (base name, tier, enchantment) of a shorthand query, else None.
+
+    - Tier can be written as '4' or 't4', enchantment as '.1' (default 0).
+    - Base name is lowercased with single spaces.
+    """
+
+    text = " ".join(text.lower().split())
+
+    match = _SHORTHAND_FRONT.match(text)
+    if match:
+        tier, enchant, base = match.groups()
+    else:
+        match = _SHORTHAND_BACK.match(text)
+        if not match:
+            return None
+        base, tier, enchant = match.groups()
+
+    return base, int(tier), int(enchant or 0)
+
+
+def base_of_name(name):
+    """Strip tier and enchantment words from an English item name.
+
+    - "Expert's Claymore" -> 'claymore'
+    - "Uncommon Heavy Hide" -> 'heavy hide'
+    """
+
+    words = name.lower().split()
+    while len(words) > 1 and words[0] in _PREFIX_WORDS:
+        words = words[1:]
+
+    return " ".join(words)
+
+
+def base_of_id(rest):
+    """Base name from an item ID without tier/enchantment, '2H_CLAYMORE' -> '2h claymore'."""
+
+    return rest.lower().replace("_", " ")
+
+
+class ShorthandTable:
+    """Precomputed (base name, tier, enchantment) -> catalog row.
+
+    - Bases come from item IDs ('2h claymore') and English names ('claymore').
+    - When two items share a key, the one with the shorter ID wins.
+    - resolve(text) is a parse plus one dict lookup.
+    """
+
+    def __init__(self, ids, names):
+        """ids and names are catalog columns (UniqueName and EN-US name)."""
+
+        self.table = {}
+
+        # Shorter IDs first, e.g. T4_BAG before T4_BAG_INSIGHT
+        for row in sorted(range(len(ids)), key=lambda row: len(ids[row])):
+            match = _ID_PATTERN.match(ids[row])
+            if not match:
+                continue
+
+            tier, rest, enchant = match.groups()
+            tier = int(tier)
+            enchant = int(enchant or 0)
+
+            self.table.setdefault((base_of_id(rest), tier, enchant), row)
+            if names[row]:
+                self.table.setdefault((base_of_name(names[row]), tier, enchant), row)
+
+    def resolve(self, text):
+        """Returns catalog row of shorthand query, None if not shorthand or no item."""
+
+        key = parse_shorthand(text)
+        if key is None:
+            return None
+
+        return self.table.get(key)
+
+    def neighbours(self, text):
+        """Returns rows of the same base at nearby enchantments and tiers."""
+
+        key = parse_shorthand(text)
+        if key is None:
+            return []
+
+        base, tier, enchant = key
+        keys = [(base, tier, e) for e in range(4) if e != enchant]
+        keys += [(base, t, enchant) for t in (tier - 1, tier + 1)]
+
+        return [self.table[key] for key in keys if key in self.table]
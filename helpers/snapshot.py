@@ -0,0 +1,127 @@
+"""Local snapshot of current market prices, stored in SQLite."""
+
+import sqlite3
+import threading
+
+from helpers.records import PriceRecord
+
+
+class SnapshotStore:
+    """Current prices per item, with when they were fetched.
+
+    - Tables:
+        prices: one row per (item, location, quality), same fields as PriceRecord.
+        fetched: when each item was last fetched (even if it had no prices).
+        query_days: how often each item is asked for per day (UTC epoch
+            days), to pick the most asked for items of the past week.
+    - Times are UTC epoch seconds.
+    - Methods are called from executor threads, so each holds self.lock:
+        one connection, one transaction at a time.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS prices (
+                item TEXT NOT NULL,
+                location INTEGER NOT NULL,
+                quality INTEGER NOT NULL,
+                sell_min INTEGER NOT NULL,
+                sell_date INTEGER NOT NULL,
+                buy_max INTEGER NOT NULL,
+                buy_date INTEGER NOT NULL,
+                PRIMARY KEY (item, location, quality)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS fetched (
+                item TEXT PRIMARY KEY,
+                fetched_at INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            DROP TABLE IF EXISTS queries;
+            CREATE TABLE IF NOT EXISTS query_days (
+                day INTEGER NOT NULL,
+                item TEXT NOT NULL,
+                hits INTEGER NOT NULL,
+                PRIMARY KEY (day, item)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def put(self, itemIDs, records, fetchedAt):
+        """Replace prices of itemIDs with records, all fetched at fetchedAt."""
+
+        with self.lock, self.db:
+            self.db.executemany(
+                "DELETE FROM prices WHERE item = ?", [(itemID,) for itemID in itemIDs]
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        record.item,
+                        record.location,
+                        record.quality,
+                        record.sellPriceMin,
+                        record.sellPriceMinDate,
+                        record.buyPriceMax,
+                        record.buyPriceMaxDate,
+                    )
+                    for record in records
+                ],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO fetched VALUES (?, ?)",
+                [(itemID, fetchedAt) for itemID in itemIDs],
+            )
+
+    def get(self, itemID):
+        """Returns (records, fetchedAt) of item, None if never fetched."""
+
+        with self.lock:
+            row = self.db.execute(
+                "SELECT fetched_at FROM fetched WHERE item = ?", (itemID,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            records = [
+                PriceRecord(*values)
+                for values in self.db.execute(
+                    "SELECT * FROM prices WHERE item = ? ORDER BY location, quality",
+                    (itemID,),
+                )
+            ]
+
+        return records, row[0]
+
+    def hit(self, itemID, now):
+        """Count a query for item, in the day of now."""
+
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO query_days VALUES (?, ?, 1) "
+                "ON CONFLICT (day, item) DO UPDATE SET hits = hits + 1",
+                (now // 86400, itemID),
+            )
+
+    def hot_items(self, limit, since):
+        """Returns up to limit most queried item IDs, by queries since 'since'.
+
+        - Counted per day, so since is rounded down to its day.
+        - Days before since are deleted, they are never counted again.
+        """
+
+        sinceDay = since // 86400
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM query_days WHERE day < ?", (sinceDay,))
+            return [
+                row[0]
+                for row in self.db.execute(
+                    "SELECT item FROM query_days WHERE day >= ? "
+                    "GROUP BY item ORDER BY SUM(hits) DESC LIMIT ?",
+                    (sinceDay, limit),
+                )
+            ]
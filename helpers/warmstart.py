@@ -0,0 +1,115 @@
+"""Warm restarts: in-memory caches saved to a local file, and restored at startup.
+
+- Each cache registers dump() -> state and load(state, downtime) under a
+    name. State must be picklable, downtime is how many seconds the file
+    is old, so that each cache can drop what expired meanwhile.
+- read() at startup keeps the saved states until their cache registers,
+    since caches are created as cogs load. A state is applied once, so a
+    cog reload does not bring back old data.
+- The file is a pickle compressed with zlib, written by this bot only.
+    Pickling runs on the event loop (so nothing changes halfway through),
+    compressing and writing can run in a thread.
+"""
+
+import os
+import pickle
+import time
+import zlib
+
+from helpers import metrics
+
+# Bumped when a cache's saved state changes, so older files are not read
+MAGIC = b"WARM2\n"
+
+# Name -> (dump, load)
+_registered = {}
+
+# Name -> state read from the file, waiting for its cache to register
+_pending = {}
+_downtime = 0.0
+
+
+def register(name, dump, load):
+    """Register a cache, and restore its saved state if there is one."""
+
+    _registered[name] = (dump, load)
+
+    if name in _pending:
+        state = _pending.pop(name)
+        try:
+            load(state, _downtime)
+            metrics.increment("warmstart.restored")
+        except Exception as e:
+            print(f"Could not restore {name}: {e}")
+
+
+def read(path, maxAge):
+    """Read saved states from path, unless it is older than maxAge seconds.
+
+    - Returns names of the saved caches, empty if nothing was read.
+    """
+
+    global _downtime
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return []
+
+    if not data.startswith(MAGIC):
+        return []
+
+    try:
+        snapshot = pickle.loads(zlib.decompress(data[len(MAGIC) :]))
+    except Exception as e:
+        print(f"Could not read {path}: {e}")
+        return []
+
+    _downtime = max(0.0, time.time() - snapshot["savedAt"])
+    if _downtime > maxAge:
+        return []
+
+    _pending.update(snapshot["caches"])
+    return list(snapshot["caches"])
+
+
+def dumps():
+    """Returns pickled states of every registered cache, run on the event loop."""
+
+    caches = {}
+    for (name, (dump, _)) in _registered.items():
+        try:
+            state = dump()
+        except Exception as e:
+            print(f"Could not save {name}: {e}")
+            continue
+        if state is not None:
+            caches[name] = state
+
+    return pickle.dumps(
+        {"savedAt": time.time(), "caches": caches}, pickle.HIGHEST_PROTOCOL
+    )
+
+
+def write(path, pickled):
+    """Compress and write pickled states to path, returns bytes written.
+
+    - Written to a temporary file first, so a crash never leaves half a file.
+    """
+
+    data = MAGIC + zlib.compress(pickled, 6)
+
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(data)
+    os.replace(tmpPath, path)
+
+    metrics.set_value("warmstart.bytes", len(data))
+    return len(data)
+
+
+def save(path):
+    """Save every registered cache to path, returns bytes written."""
+
+    return write(path, dumps())
@@ -0,0 +1,136 @@
+"""Event loop lag watchdog, names the code that blocks the loop.
+
+- The loop runs a heartbeat callback every 'interval' seconds.
+- A watchdog thread checks the heartbeat. When it is late by more than
+    'threshold' seconds, the loop's thread is blocked, and its stack is
+    captured right then (sys._current_frames).
+- Once the loop is back, the stall is logged with the command (outermost
+    frame in cogs/) and function (innermost frame in cogs/ or helpers/) that
+    blocked it, e.g. 'prices' and 'item_match', and exported as metrics.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from helpers import metrics
+from helpers.profiler import frame_label
+
+logger = logging.getLogger("watchdog")
+
+# Bot's own code, the rest is discord.py, matplotlib, urllib etc.
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+COGS = os.path.join(ROOT, "cogs") + os.sep
+HELPERS = os.path.join(ROOT, "helpers") + os.sep
+
+
+def blame(frame):
+    """Returns (command, function, stack labels) of a blocked frame.
+
+    - command is the outermost cogs/ function, function the innermost
+        cogs/ or helpers/ function, '?' if none.
+    """
+
+    command = function = "?"
+    labels = []
+
+    while frame is not None:
+        filename = os.path.realpath(frame.f_code.co_filename)
+        if filename.startswith(COGS):
+            command = frame.f_code.co_name
+            if function == "?":
+                function = frame.f_code.co_name
+        elif filename.startswith(HELPERS) and function == "?":
+            function = frame.f_code.co_name
+
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+
+    labels.reverse()
+    return command, function, labels
+
+
+class LoopWatchdog:
+    """Watches one event loop from a thread, see module docstring."""
+
+    def __init__(self, loop, threshold=0.25, interval=0.1):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+
+        self.loopThreadID = None
+        self.lastBeat = time.monotonic()
+        self.handle = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # A new event per start, so a stopped thread that has not woken up
+        # yet still sees its own event set
+        self._stop = threading.Event()
+        self.handle = self.loop.call_soon_threadsafe(self._beat)
+        self._thread = threading.Thread(
+            target=self._watch, args=(self._stop,), name="loop watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        # Not joined, that would block the loop for up to an interval
+        # The thread is a daemon and exits at its next wake up
+        self._stop.set()
+        if self.handle is not None:
+            self.handle.cancel()
+        self._thread = None
+
+    def _beat(self):
+        """Heartbeat, runs on the loop."""
+
+        now = time.monotonic()
+        if self.loopThreadID is None:
+            self.loopThreadID = threading.get_ident()
+        else:
+            lag = max(0.0, now - self.lastBeat - self.interval)
+            metrics.set_value("watchdog.lag_ms", round(lag * 1000))
+
+        self.lastBeat = now
+        if not self._stop.is_set():
+            self.handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self, stop):
+        """Watchdog thread, captures the loop's stack when it stalls."""
+
+        captured = None
+        capturedBeat = None
+
+        while not stop.wait(self.interval / 2):
+            beat = self.lastBeat
+            late = time.monotonic() - beat - self.interval
+
+            # Stall over, report it
+            if captured is not None and beat != capturedBeat:
+                self._report(beat - capturedBeat - self.interval, *captured)
+                captured = None
+
+            # Stall started, capture what is running now
+            if captured is None and late > self.threshold:
+                frame = sys._current_frames().get(self.loopThreadID)
+                if frame is not None:
+                    captured = blame(frame)
+                    capturedBeat = beat
+                del frame
+
+    def _report(self, lag, command, function, labels):
+        metrics.increment("watchdog.stalls")
+        metrics.increment(f"watchdog.blocked.{command}.{function}")
+        metrics.set_value("watchdog.last_stall_ms", round(lag * 1000))
+
+        logger.warning(
+            "Event loop blocked for %dms by %s -> %s\n    %s",
+            lag * 1000,
+            command,
+            function,
+            "\n    ".join(labels[-15:]),
+        )
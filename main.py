@@ -4,6 +4,9 @@ import os
 import logging
 import configparser
 
+from helpers import warmstart
+from helpers.cachepolicy import client_options
+
 
 # Load config.ini
 currentPath = os.path.dirname(os.path.realpath(__file__))
@@ -14,8 +17,22 @@ configs.read(currentPath + "/config.ini")
 adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
 commandPrefix = configs["General"]["commandPrefix"].replace("'", "").split(", ")
 
+# Caches saved by the last run (helpers/warmstart.py)
+# Each is restored when its cog creates it, unless the file is too old
+warmStart = configs["WarmStart"].getboolean("enabled")
+warmStartFile = os.path.join(currentPath, configs["WarmStart"]["file"])
+if warmStart:
+    restored = warmstart.read(
+        warmStartFile, configs["WarmStart"].getfloat("maxAgeHours") * 3600
+    )
+    if restored:
+        print(f"Restoring caches: {', '.join(restored)}")
+
+# Gateway intents and what discord.py caches, see [Cache] in config.ini
 client = commands.AutoShardedBot(
-    command_prefix=commands.when_mentioned_or(*commandPrefix), case_insensitive=True
+    command_prefix=commands.when_mentioned_or(*commandPrefix),
+    case_insensitive=True,
+    **client_options(configs["Cache"]),
 )
 
 # Set up logging to discord.log
@@ -27,6 +44,9 @@ handler.setFormatter(
 )
 logger.addHandler(handler)
 
+# Event loop stalls (helpers/watchdog.py) go to discord.log too
+logging.getLogger("watchdog").addHandler(handler)
+
 
 @client.event
 async def on_ready():
@@ -104,4 +124,9 @@ async def extension(ctx, option, extension):
 
 # Copy from your Discord developer portal
 token = configs["TOKEN"]["botToken"]
-client.run(token)
+try:
+    client.run(token)
+finally:
+    # client.run returns once the bot is closed (e.g. Ctrl+C or SIGTERM)
+    if warmStart:
+        warmstart.save(warmStartFile)
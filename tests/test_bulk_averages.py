@@ -0,0 +1,99 @@
+"""Bulk weekly averages: chunk_ids, and average_prices against reject_outliers."""
+
+import numpy as np
+
+from helpers.bulk import MAX_URL_LENGTH, chunk_ids
+from helpers.records import HISTORY_DTYPE, average_prices, reject_outliers
+
+
+def make_history(rng, itemCount, locations):
+    """Random history, with outliers, a constant item and an item without rows."""
+
+    rows = []
+    for item in range(itemCount - 2):
+        base = rng.uniform(100, 100000)
+        for _ in range(rng.integers(1, 40)):
+            price = base * rng.uniform(0.8, 1.2)
+            # Now and then a price far off, to be rejected
+            if rng.random() < 0.1:
+                price *= rng.choice([50, 0.001])
+            rows.append((item, rng.choice(locations), 1, 0, price, 1))
+
+    # Every price the same, so the median distance is 0
+    # The last item has no rows
+    rows += [(itemCount - 2, locations[0], 1, 0, 500.0, 1)] * 3
+
+    return np.array(rows, dtype=HISTORY_DTYPE)
+
+
+def loop_averages(history, itemCount, locations=None):
+    """The per-item path: reject_outliers and a mean, one item at a time."""
+
+    averages = np.zeros(itemCount)
+    for item in range(itemCount):
+        rows = history[history["item"] == item]
+        if locations is not None:
+            rows = rows[np.isin(rows["location"], locations)]
+        prices = rows["price"]
+        if len(prices):
+            averages[item] = prices[reject_outliers(prices)].mean()
+    return averages
+
+
+def test_average_prices_matches_per_item_path():
+    rng = np.random.default_rng(3)
+    history = make_history(rng, 50, [1, 2, 3, 4])
+
+    np.testing.assert_allclose(
+        average_prices(history, 50), loop_averages(history, 50), rtol=1e-12
+    )
+
+
+def test_average_prices_with_locations():
+    rng = np.random.default_rng(7)
+    history = make_history(rng, 30, [1, 2, 3, 4])
+
+    np.testing.assert_allclose(
+        average_prices(history, 30, [2, 3]),
+        loop_averages(history, 30, [2, 3]),
+        rtol=1e-12,
+    )
+
+
+def test_constant_prices_and_missing_items():
+    history = np.array(
+        [(0, 1, 1, 0, 500.0, 1)] * 4 + [(2, 1, 1, 0, 10.0, 1)], dtype=HISTORY_DTYPE
+    )
+
+    assert list(average_prices(history, 4)) == [500.0, 0.0, 10.0, 0.0]
+    assert list(average_prices(history[:0], 2)) == [0.0, 0.0]
+
+
+def test_reject_outliers():
+    prices = np.array([100.0, 101.0, 99.0, 102.0, 98.0, 100000.0])
+
+    assert list(reject_outliers(prices)) == [True] * 5 + [False]
+    assert len(reject_outliers(np.zeros(0))) == 0
+
+
+def test_chunk_ids_by_count():
+    itemIDs = [f"T4_ITEM_{i}" for i in range(45)]
+    chunks = chunk_ids(itemIDs, 20)
+
+    assert [len(chunk) for chunk in chunks] == [20, 20, 5]
+    assert sum(chunks, []) == itemIDs
+
+
+def test_chunk_ids_by_url_length():
+    itemIDs = ["T8_" + "X" * 97] * 100
+    baseLength = 200
+    chunks = chunk_ids(itemIDs, 100, baseLength)
+
+    assert len(chunks) > 1
+    assert sum(chunks, []) == itemIDs
+    for chunk in chunks:
+        assert baseLength + sum(len(itemID) + 1 for itemID in chunk) <= MAX_URL_LENGTH
+
+
+def test_chunk_ids_empty():
+    assert chunk_ids([], 20) == []
@@ -0,0 +1,90 @@
+"""SizedCache: size and cost aware eviction under its own and the total budget."""
+
+import pytest
+
+from helpers import cachemanager, memory, metrics
+from helpers.cachemanager import SizedCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(cachemanager, "_caches", {})
+    monkeypatch.setattr(cachemanager, "_totalBytes", 10 ** 6)
+    monkeypatch.setattr(cachemanager, "_clock", 0.0)
+    monkeypatch.setattr(metrics, "_gauges", {})
+    monkeypatch.setattr(memory, "_tracked", {})
+
+
+def test_large_cheap_entries_evicted_first():
+    sized = SizedCache("test", 300)
+    sized.put("small costly", 1, size=100, cost=5.0)
+    sized.put("large cheap", 2, size=150, cost=0.1)
+    sized.put("new", 3, size=100, cost=1.0)
+
+    assert "large cheap" not in sized
+    assert "small costly" in sized and "new" in sized
+    assert sized.size == 200
+    assert sized.evictions == 1
+
+
+def test_unused_entries_age_out():
+    sized = SizedCache("test", 300)
+    sized.put("old", 1, size=100, cost=1.0)
+
+    # Each eviction moves the clock up, so new entries outrank "old"
+    for i in range(10):
+        sized.put(i, i, size=100, cost=0.5)
+
+    assert "old" not in sized
+
+
+def test_max_entries_and_too_big():
+    sized = SizedCache("test", 10 ** 6, maxEntries=2)
+    for key in "abc":
+        sized.put(key, key, size=10)
+
+    assert len(sized) == 2
+    assert sized.put("huge", 0, size=2 * 10 ** 6) is False
+    assert "huge" not in sized
+
+
+def test_get_counts_hits_and_misses():
+    sized = SizedCache("test", 1000)
+    sized.put("a", 1, size=10)
+
+    assert sized.get("a") == 1
+    assert sized.get("b", "default") == "default"
+    assert sized.peek("a") == 1
+    assert (sized.hits, sized.misses, sized.hitRate) == (1, 1, 0.5)
+
+
+def test_total_budget_evicts_across_caches(monkeypatch):
+    monkeypatch.setattr(cachemanager, "_totalBytes", 250)
+    first = cachemanager.cache("first", 1000)
+    second = cachemanager.cache("second", 1000)
+
+    first.put("cheap", 1, size=100, cost=0.1)
+    second.put("costly", 2, size=100, cost=10.0)
+    second.put("other", 3, size=100, cost=1.0)
+
+    assert "cheap" not in first
+    assert cachemanager.total_size() == 200
+
+
+def test_new_limits_applied_at_once():
+    sized = cachemanager.cache("test", 1000)
+    for key in range(5):
+        sized.put(key, key, size=100)
+
+    assert cachemanager.cache("test", 250, maxEntries=1) is sized
+    assert len(sized) == 1 and sized.size == 100
+
+
+def test_heap_stays_bounded_on_hits():
+    sized = SizedCache("test", 1000)
+    sized.put("a", 1, size=10)
+    for _ in range(1000):
+        sized.get("a")
+
+    assert len(sized.heap) <= 2 * len(sized) + 65
+    assert sized.items() == [("a", 1, 1.0)]
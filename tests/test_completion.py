@@ -0,0 +1,54 @@
+"""PrefixIndex.complete: ordering, word keys, and the scan limit."""
+
+from helpers.completion import PrefixIndex
+
+
+def test_shortest_keys_first():
+    index = PrefixIndex([["t4_bag_insight", "t4_bag", "t4_bag@1", "t5_bag"]])
+
+    assert index.complete("t4_bag") == [1, 2, 0]
+
+
+def test_every_word_is_a_key():
+    index = PrefixIndex([["adept's bag", "expert's claymore", "bag of holding"]])
+
+    # Row 2 starts with 'bag', row 0 has it as its second word
+    assert sorted(index.complete("bag")) == [0, 2]
+    assert index.complete("clay") == [1]
+
+
+def test_row_ranked_by_its_shortest_key():
+    # ID and name columns of the same two rows
+    index = PrefixIndex([["t4_bag", "t4_bag_insight"], ["bag", "bag of insight"]])
+
+    assert index.complete("t4_bag") == [0, 1]
+    assert index.complete("bag") == [0, 1]
+
+
+def test_limit_and_empty_prefix():
+    index = PrefixIndex([[f"t4_item_{i}" for i in range(20)]])
+
+    assert len(index.complete("t4_", limit=5)) == 5
+    assert index.complete("  ") == []
+    assert index.complete("zzz") == []
+
+
+def test_case_and_whitespace_ignored():
+    index = PrefixIndex([["t4_bag"]])
+
+    assert index.complete("  T4_BAG ") == [0]
+
+
+def test_too_many_matches_returns_none():
+    index = PrefixIndex([[f"t4_item_{i:03d}" for i in range(300)]])
+
+    assert index.complete("t4_", scan=256) is None
+    assert len(index.complete("t4_item_1", scan=256)) == 10
+
+
+def test_unbounded_scan_finds_shortest_past_the_window():
+    # The shortest key sorts after 300 longer ones
+    names = [f"t4_a{'x' * (300 - i)}" for i in range(300)] + ["t4_b"]
+    index = PrefixIndex([names])
+
+    assert index.complete("t4_", limit=1, scan=None) == [300]
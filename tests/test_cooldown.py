@@ -0,0 +1,91 @@
+"""Cooldown token buckets: charging, refilling, and costs that are not positive."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import cooldown
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fresh buckets with known limits, and a clock the test moves."""
+
+    now = [1000.0]
+    monkeypatch.setattr(cooldown.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(
+        cooldown,
+        "_limits",
+        {"user": (10.0, 100.0), "channel": (30.0, 100.0), "guild": (60.0, 100.0)},
+    )
+    monkeypatch.setattr(cooldown, "_buckets", cooldown.OrderedDict())
+    return now
+
+
+def context(user=1, channel=10, guild=100):
+    return SimpleNamespace(
+        author=SimpleNamespace(id=user),
+        channel=SimpleNamespace(id=channel),
+        guild=SimpleNamespace(id=guild) if guild is not None else None,
+    )
+
+
+def test_charge_spends_all_three_buckets(clock):
+    assert cooldown.charge(context(), 4) == 0
+
+    assert cooldown._buckets[("user", 1)][0] == 6
+    assert cooldown._buckets[("channel", 10)][0] == 26
+    assert cooldown._buckets[("guild", 100)][0] == 56
+
+
+def test_over_budget_waits_and_spends_nothing(clock):
+    assert cooldown.charge(context(), 8) == 0
+
+    # 2 tokens left, 5 more needed at 10 tokens per 100s
+    assert cooldown.charge(context(), 7) == pytest.approx(50)
+    assert cooldown._buckets[("user", 1)][0] == 2
+
+    # Other users only share the channel and guild buckets
+    assert cooldown.charge(context(user=2), 7) == 0
+
+
+def test_buckets_refill_over_time(clock):
+    assert cooldown.charge(context(), 10) == 0
+    assert cooldown.charge(context(), 5) > 0
+
+    clock[0] += 50
+    assert cooldown.charge(context(), 5) == 0
+
+
+def test_cost_above_capacity_needs_a_full_bucket(clock):
+    assert cooldown.charge(context(), 25) == 0
+    assert cooldown._buckets[("user", 1)][0] == 0
+
+
+def test_zero_cost_is_free(clock):
+    assert cooldown.charge(context(), 10) == 0
+    assert cooldown.charge(context(), 0) == 0
+    assert cooldown._buckets[("user", 1)][0] == 0
+
+
+def test_negative_cost_never_refills(clock):
+    assert cooldown.charge(context(), 10) == 0
+    assert cooldown.charge(context(), -100) == 0
+
+    assert cooldown._buckets[("user", 1)][0] == 0
+    assert cooldown.charge(context(), 1) > 0
+
+
+def test_direct_messages_have_no_guild_bucket(clock):
+    assert cooldown.charge(context(guild=None), 1) == 0
+    assert all(key[0] != "guild" for key in cooldown._buckets)
+
+
+def test_least_recently_used_buckets_dropped(clock, monkeypatch):
+    monkeypatch.setattr(cooldown, "_maxKeys", 4)
+
+    for user in range(5):
+        cooldown.charge(context(user=user), 1)
+
+    assert len(cooldown._buckets) == 4
+    assert ("user", 0) not in cooldown._buckets
@@ -0,0 +1,106 @@
+"""RollingStats against brute force, and RollingStore's incremental feeding."""
+
+import math
+
+import numpy as np
+import pytest
+
+from helpers.rolling import RollingStats, RollingStore
+
+HOUR = 3600
+
+
+def brute_force(points, window):
+    """SMA, VWAP and std of the points in the window ending at the last one."""
+
+    last = points[-1][0]
+    inWindow = [(price, count) for (t, price, count) in points if t > last - window]
+    prices = np.array([price for (price, _) in inWindow])
+    counts = np.array([count for (_, count) in inWindow], dtype=float)
+
+    vwap = (prices * counts).sum() / counts.sum() if counts.sum() else None
+    return prices.mean(), vwap, prices.std()
+
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(1)
+    stats = RollingStats(24 * HOUR, 12 * HOUR, 168)
+
+    points = []
+    t = 0
+    for _ in range(200):
+        # Uneven gaps, large prices to check precision
+        t += int(rng.integers(1, 4)) * HOUR
+        points.append((t, float(rng.uniform(1e6, 1.1e6)), int(rng.integers(0, 5))))
+        stats.add(*points[-1])
+
+        (sma, vwap, std) = brute_force(points, 24 * HOUR)
+        assert stats.sma == pytest.approx(sma, rel=1e-9)
+        assert stats.std == pytest.approx(std, rel=1e-6, abs=1e-6)
+        if vwap is None:
+            assert stats.vwap is None
+        else:
+            assert stats.vwap == pytest.approx(vwap, rel=1e-9)
+
+
+def test_ema_weighted_by_time():
+    stats = RollingStats(24 * HOUR, 12 * HOUR, 10)
+    stats.add(0, 100.0)
+    stats.add(12 * HOUR, 200.0)
+
+    alpha = 1 - math.exp(-1)
+    assert stats.ema == pytest.approx(100 + alpha * 100)
+
+
+def test_history_ring_keeps_last_points():
+    stats = RollingStats(24 * HOUR, 12 * HOUR, 5)
+    for i in range(8):
+        stats.add(i * HOUR, float(i))
+
+    history = stats.history()
+    assert len(history) == 5
+    assert list(history["timestamp"].astype("int64")) == [
+        i * HOUR for i in range(3, 8)
+    ]
+    assert (np.diff(history["timestamp"].astype("int64")) > 0).all()
+
+
+def test_bands():
+    stats = RollingStats(24 * HOUR, 12 * HOUR, 5)
+    for (i, price) in enumerate([90.0, 110.0]):
+        stats.add(i * HOUR, price)
+
+    assert stats.bands(2) == pytest.approx((80.0, 120.0))
+
+
+def test_store_feeds_only_new_points():
+    store = RollingStore("test.feed", 24 * HOUR, 12 * HOUR, 100, 10, 2 ** 20)
+    timestamps = np.arange(48, dtype="int64").astype("datetime64[h]")
+    prices = np.arange(48, dtype="f8")
+
+    stats = store.feed("a", timestamps[:24], prices[:24])
+    assert stats.size == 24
+
+    # Refetching overlapping data adds only the new hours
+    stats = store.feed("a", timestamps[12:], prices[12:])
+    assert stats.size == 48
+    assert stats.sma == pytest.approx(prices[24:].mean())
+
+
+def test_store_starts_over_on_older_data():
+    store = RollingStore("test.restart", 24 * HOUR, 12 * HOUR, 100, 10, 2 ** 20)
+    timestamps = np.arange(48, dtype="int64").astype("datetime64[h]")
+    prices = np.arange(48, dtype="f8")
+
+    store.feed("a", timestamps[24:], prices[24:])
+    stats = store.feed("a", timestamps, prices)
+    assert stats.size == 48
+
+
+def test_store_empty_series_returns_none():
+    store = RollingStore("test.empty", 24 * HOUR, 12 * HOUR, 100, 10, 2 ** 20)
+    timestamps = np.arange(5, dtype="int64").astype("datetime64[h]")
+
+    store.feed("a", timestamps, np.ones(5))
+    assert store.feed("a", timestamps[:0], np.ones(0)) is None
+    assert store.get("a") is not None
@@ -0,0 +1,36 @@
+"""Tier/enchantment shorthand parsing and the lookup table."""
+
+from helpers.shorthand import ShorthandTable, base_of_name, parse_shorthand
+
+
+def test_parse_front_and_back():
+    assert parse_shorthand("4.1 bag") == ("bag", 4, 1)
+    assert parse_shorthand("T6.3  Claymore") == ("claymore", 6, 3)
+    assert parse_shorthand("heavy hide t8") == ("heavy hide", 8, 0)
+
+
+def test_parse_rejects_other_text():
+    assert parse_shorthand("bag") is None
+    assert parse_shorthand("9.1 bag") is None
+    assert parse_shorthand("4.5 bag") is None
+
+
+def test_base_of_name_strips_tier_words():
+    assert base_of_name("Expert's Claymore") == "claymore"
+    assert base_of_name("Uncommon Heavy Hide") == "heavy hide"
+    assert base_of_name("Elder") == "elder"
+
+
+def test_table_resolves_ids_and_names():
+    ids = ["T4_BAG", "T4_BAG@1", "T4_BAG_INSIGHT", "T6_2H_CLAYMORE@3", "T5_BAG"]
+    names = ["Adept's Bag", "Adept's Bag", "Adept's Satchel of Insight", "", ""]
+    table = ShorthandTable(ids, names)
+
+    assert table.resolve("4 bag") == 0
+    assert table.resolve("4.1 bag") == 1
+    assert table.resolve("t6.3 2h claymore") == 3
+    assert table.resolve("4.2 bag") is None
+    assert table.resolve("bag") is None
+
+    # Same base at other enchantments and tiers
+    assert sorted(table.neighbours("4 bag")) == [1, 4]
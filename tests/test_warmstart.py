@@ -0,0 +1,80 @@
+"""Warm restarts: save, read back, and restore as caches register."""
+
+import time
+import zlib
+
+import pytest
+
+from helpers import warmstart
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(warmstart, "_registered", {})
+    monkeypatch.setattr(warmstart, "_pending", {})
+    monkeypatch.setattr(warmstart, "_downtime", 0.0)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "warmstart.bin")
+    warmstart.register("a", lambda: {"x": [1, 2, 3]}, lambda state, downtime: None)
+    warmstart.register("empty", lambda: None, lambda state, downtime: None)
+
+    assert warmstart.save(path) > 0
+
+    # Next run: read first, caches register later and get their state once
+    warmstart._registered.clear()
+    assert warmstart.read(path, 3600) == ["a"]
+
+    restored = []
+    warmstart.register("a", dict, lambda state, downtime: restored.append(state))
+    warmstart.register("a", dict, lambda state, downtime: restored.append(state))
+
+    assert restored == [{"x": [1, 2, 3]}]
+
+
+def test_downtime_passed_to_load(tmp_path, monkeypatch):
+    path = str(tmp_path / "warmstart.bin")
+    warmstart.register("a", lambda: 1, lambda state, downtime: None)
+    warmstart.save(path)
+
+    now = time.time()
+    monkeypatch.setattr(warmstart.time, "time", lambda: now + 600)
+    warmstart.read(path, 3600)
+
+    downtimes = []
+    warmstart.register("a", int, lambda state, downtime: downtimes.append(downtime))
+    assert downtimes == [pytest.approx(600, abs=5)]
+
+
+def test_old_or_bad_files_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "warmstart.bin")
+    warmstart.register("a", lambda: 1, lambda state, downtime: None)
+    warmstart.save(path)
+
+    now = time.time()
+    monkeypatch.setattr(warmstart.time, "time", lambda: now + 7200)
+    assert warmstart.read(path, 3600) == []
+
+    with open(path, "wb") as f:
+        f.write(b"WARM0\n" + zlib.compress(b"junk"))
+    assert warmstart.read(path, 3600) == []
+
+    assert warmstart.read(str(tmp_path / "missing.bin"), 3600) == []
+
+
+def test_failing_dump_and_load_are_skipped(tmp_path, capsys):
+    path = str(tmp_path / "warmstart.bin")
+
+    def broken():
+        raise ValueError("broken")
+
+    warmstart.register("bad", broken, lambda state, downtime: None)
+    warmstart.register("good", lambda: 2, lambda state, downtime: None)
+    warmstart.save(path)
+
+    warmstart._registered.clear()
+    assert warmstart.read(path, 3600) == ["good"]
+    warmstart.register("good", int, lambda state, downtime: broken())
+
+    assert "Could not save bad" in capsys.readouterr().out
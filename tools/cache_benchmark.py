@@ -0,0 +1,215 @@
+"""Resident memory per 1000 guilds of each [Cache] preset.
+
+- Usage: python tools/cache_benchmark.py --guilds 1000 --members 200
+- Each preset runs in its own process. Synthetic gateway events are fed
+    straight to discord.py's connection state, as the gateway would send
+    them with the preset's intents:
+        GUILD_CREATE with every member only if the members intent is on
+            and the guild is small (250 members or less),
+        MESSAGE_CREATE for 'messages' messages spread over the guilds,
+        GUILD_MEMBERS_CHUNK of large guilds if the preset chunks guilds.
+- Reports RSS growth, and how many members/users/messages are cached.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def user_data(ID):
+    return {
+        "id": str(ID),
+        "username": f"user{ID}",
+        "discriminator": f"{ID % 10000:04d}",
+        "avatar": None,
+    }
+
+
+def member_data(ID):
+    return {
+        "user": user_data(ID),
+        "roles": [],
+        "joined_at": "2020-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def guild_data(guildID, members, channels, withMembers, botID):
+    """GUILD_CREATE payload, with all members or only the bot's."""
+
+    memberIDs = range(guildID * 100000, guildID * 100000 + members)
+
+    return {
+        "id": str(guildID),
+        "name": f"guild {guildID}",
+        "member_count": members,
+        "large": members > 250,
+        "roles": [
+            {
+                "id": str(guildID),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [
+            {
+                "id": str(guildID * 1000 + i),
+                "type": 0,
+                "name": f"channel-{i}",
+                "position": i,
+                "permission_overwrites": [],
+            }
+            for i in range(channels)
+        ],
+        "members": (
+            [member_data(ID) for ID in memberIDs]
+            if withMembers
+            else [member_data(botID)]
+        ),
+        "emojis": [],
+        "features": [],
+        "voice_states": [],
+        "presences": [],
+    }
+
+
+def message_data(ID, guildID, channelID, authorID):
+    return {
+        "id": str(ID),
+        "channel_id": str(channelID),
+        "guild_id": str(guildID),
+        "author": user_data(authorID),
+        "member": {"roles": [], "joined_at": "2020-01-01T00:00:00+00:00"},
+        "content": "emilie prices t4 bag",
+        "timestamp": "2026-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def run_preset(preset, guilds, members, channels, messages):
+    """Feed events to a client with preset's options, returns result dict."""
+
+    sys.path.insert(0, ROOT)
+
+    import discord
+
+    from helpers.cachepolicy import client_options
+    from helpers.memory import rss
+
+    options = client_options({"preset": preset})
+    client = discord.Client(**options)
+    state = client._connection
+
+    botID = 1
+    state.user = discord.ClientUser(state=state, data=user_data(botID))
+
+    before = rss()
+
+    large = members > 250
+    for guildID in range(1, guilds + 1):
+        state._add_guild_from_data(
+            guild_data(
+                guildID,
+                members,
+                channels,
+                options["intents"].members and not large,
+                botID,
+            )
+        )
+
+        # Members of large guilds are downloaded in chunks after startup
+        if large and options["chunk_guilds_at_startup"]:
+            guild = state._get_guild(guildID)
+            memberIDs = range(guildID * 100000, guildID * 100000 + members)
+            for ID in memberIDs:
+                guild._add_member(
+                    discord.Member(data=member_data(ID), guild=guild, state=state)
+                )
+
+    # Commands, spread over guilds and channels
+    if options["intents"].guild_messages:
+        for i in range(messages):
+            guildID = i % guilds + 1
+            channelID = guildID * 1000 + i % channels
+            authorID = guildID * 100000 + i % members
+            state.parse_message_create(
+                message_data(10 ** 12 + i, guildID, channelID, authorID)
+            )
+
+    after = rss()
+
+    return {
+        "preset": preset,
+        "bytes": after - before,
+        "guilds": len(client.guilds),
+        "members": sum(len(guild.members) for guild in client.guilds),
+        "users": len(client.users),
+        "messages": len(client.cached_messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=200, help="Members per guild")
+    parser.add_argument("--channels", type=int, default=10, help="Channels per guild")
+    parser.add_argument(
+        "--messages", type=int, default=5000, help="Command messages received"
+    )
+    parser.add_argument("--presets", default="lean,default,full")
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: run one preset, print result as JSON
+    if args.run:
+        result = run_preset(
+            args.run, args.guilds, args.members, args.channels, args.messages
+        )
+        print(json.dumps(result))
+        return
+
+    print(
+        f"{args.guilds} guilds, {args.members} members and {args.channels} channels "
+        f"each, {args.messages} messages"
+    )
+    for preset in args.presets.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", preset.strip()]
+            + [
+                f"--{name}={getattr(args, name)}"
+                for name in ["guilds", "members", "channels", "messages"]
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+
+        perThousand = result["bytes"] / result["guilds"] * 1000 / 2 ** 20
+        print(
+            f"{result['preset']:>8}: {perThousand:8.1f} MB per 1000 guilds "
+            f"({result['members']} members, {result['users']} users, "
+            f"{result['messages']} messages cached)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""Replay a recorded command stream against the cogs, for load testing.
+
+- Record commands by setting [Replay] record = True in config.ini.
+- Usage: python tools/replay.py commands.jsonl --speed 10 --fixtures fixtures/
+- Cogs are loaded into a bot that never connects to Discord: channels and
+    messages are fakes that only count what is sent.
+- Every urllib request (API, item list) is sent to a local HTTP server
+    instead, which answers from fixture files:
+        https://www.albion-online-data.com/api/v2/stats/prices/T4_BAG?...
+    is answered by the first file found of
+        <fixtures>/www.albion-online-data.com/api/v2/stats/prices/T4_BAG.json
+        <fixtures>/www.albion-online-data.com/api/v2/stats/prices.json
+        ... and so on up the path, else '[]'.
+    Paths that already end in .json (e.g. items.json) can be stored as is.
+- The cogs run from a temporary copy of the bot, so snapshot, locale and
+    cache files of the real bot are not touched.
+- Reports throughput, command latency percentiles, and event loop lag.
+"""
+
+import argparse
+import asyncio
+import configparser
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from discord.ext import commands
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class FixtureServer:
+    """Local HTTP server answering every request from fixture files."""
+
+    def __init__(self, directory, delay=0.0):
+        self.directory = directory
+        self.delay = delay
+        self.served = Counter()
+        self.missed = Counter()
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.answer(self.path)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def answer(self, path):
+        """Returns fixture bytes for request path '/<host>/<path>?<query>'."""
+
+        # Simulated upstream latency, in the server's thread like a real API
+        if self.delay:
+            time.sleep(self.delay)
+
+        segments = [
+            urllib.parse.unquote(segment)
+            for segment in urllib.parse.urlsplit(path).path.split("/")
+            if segment
+        ]
+
+        # Most specific fixture first
+        if self.directory:
+            candidates = [os.path.join(self.directory, *segments)]
+            for i in range(len(segments), 0, -1):
+                candidates.append(os.path.join(self.directory, *segments[:i]) + ".json")
+
+            for fixture in candidates:
+                if os.path.isfile(fixture):
+                    with self.lock:
+                        self.served[fixture] += 1
+                    with open(fixture, "rb") as f:
+                        return f.read()
+
+        with self.lock:
+            self.missed["/".join(segments[:4])] += 1
+        return b"[]"
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+class FixtureHandler(urllib.request.BaseHandler):
+    """urllib handler sending http and https requests to a FixtureServer."""
+
+    # Before the default HTTP(S) handlers
+    handler_order = 100
+
+    def __init__(self, address):
+        self.address = address
+        # Plain opener, as the installed one would send requests back here
+        self.opener = urllib.request.build_opener()
+
+    def http_open(self, req):
+        parts = urllib.parse.urlsplit(req.full_url)
+        fullURL = (
+            f"http://{self.address[0]}:{self.address[1]}/{parts.netloc}{parts.path}"
+        )
+        if parts.query:
+            fullURL += "?" + parts.query
+
+        local = urllib.request.Request(
+            fullURL, data=req.data, headers=dict(req.header_items())
+        )
+        return self.opener.open(local, timeout=req.timeout)
+
+    https_open = http_open
+
+
+class FakeUser:
+    def __init__(self, ID, name, bot=False):
+        self.id = ID
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{ID}>"
+        self.display_name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, ID):
+        self.id = ID
+        self.name = f"guild {ID}"
+        self.members = []
+        self.roles = []
+
+
+class FakeMessage:
+    """Message that was 'sent', reactions and edits are counted only."""
+
+    _nextID = 1
+
+    def __init__(self, transport, content, author, channel, embed=None, file=None):
+        self.id = FakeMessage._nextID
+        FakeMessage._nextID += 1
+
+        self.transport = transport
+        self.content = content or ""
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.embeds = [embed] if embed else []
+        self.attachments = [file] if file else []
+        self.mentions = []
+        self.role_mentions = []
+        self._state = None
+
+    async def add_reaction(self, emoji):
+        await self.transport.call("add_reaction")
+
+    async def edit(self, **fields):
+        await self.transport.call("edit")
+
+    async def delete(self):
+        await self.transport.call("delete")
+
+
+class FakeChannel:
+    def __init__(self, transport, ID, guild):
+        self.transport = transport
+        self.id = ID
+        self.guild = guild
+        self.name = f"channel {ID}"
+        self.mention = f"<#{ID}>"
+
+    async def send(self, content=None, **fields):
+        await self.transport.call("send")
+        return FakeMessage(
+            self.transport,
+            str(content) if content is not None else None,
+            self.transport.user,
+            self,
+            fields.get("embed"),
+            fields.get("file"),
+        )
+
+    async def trigger_typing(self):
+        await self.transport.call("trigger_typing")
+
+
+class FakeTransport:
+    """Counts Discord API calls, each taking 'delay' seconds."""
+
+    def __init__(self, user, delay=0.0):
+        self.user = user
+        self.delay = delay
+        self.calls = Counter()
+        self.channels = {}
+        self.guilds = {}
+
+    async def call(self, name):
+        self.calls[name] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+    def channel(self, ID, guildID=None):
+        if ID not in self.channels:
+            guild = None
+            if guildID is not None:
+                guild = self.guilds.setdefault(guildID, FakeGuild(guildID))
+            self.channels[ID] = FakeChannel(self, ID, guild)
+        return self.channels[ID]
+
+
+class ReplayContext(commands.Context):
+    async def send(self, content=None, **fields):
+        return await self.channel.send(content, **fields)
+
+
+class ReplayBot(commands.Bot):
+    """Bot that runs commands from recorded messages, never connects."""
+
+    def __init__(self, prefixes, transport):
+        super().__init__(
+            command_prefix=commands.when_mentioned_or(*prefixes), case_insensitive=True
+        )
+        self.transport = transport
+        self.errors = Counter()
+
+        # First traceback of each error type
+        self.examples = {}
+
+    @property
+    def user(self):
+        return self.transport.user
+
+    def get_channel(self, ID):
+        return self.transport.channel(ID)
+
+    async def on_command_error(self, ctx, error):
+        error = getattr(error, "original", error)
+        self.count_error(error)
+
+    def count_error(self, error):
+        name = type(error).__name__
+        self.errors[name] += 1
+        if name not in self.examples and not isinstance(error, commands.CommandError):
+            self.examples[name] = "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )
+
+    async def run_entry(self, entry, copy):
+        """Run recorded entry as if sent by copy number copy of its author."""
+
+        # Each copy is a different user, channel and server
+        offset = copy * 10**19
+        guildID = entry["guild"] + offset if entry["guild"] is not None else None
+        channel = self.transport.channel(entry["channel"] + offset, guildID)
+        author = FakeUser(entry["author"] + offset, f"user{entry['author']}#{copy}")
+        message = FakeMessage(self.transport, entry["content"], author, channel)
+
+        ctx = await self.get_context(message, cls=ReplayContext)
+        await self.invoke(ctx)
+        return ctx.command.qualified_name if ctx.command else "unknown"
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of values, 0 if empty."""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def watch_lag(lags, interval, stop):
+    """Append how late each interval sleep wakes up, until stop is set."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def replay(bot, entries, speed, copies):
+    """Replay entries at speed times their recorded pace.
+
+    - Returns (wall seconds, {command: [latencies]}).
+    """
+
+    latencies = defaultdict(list)
+
+    async def timed(entry, copy):
+        start = time.perf_counter()
+        try:
+            name = await bot.run_entry(entry, copy)
+        except Exception as e:
+            bot.count_error(e)
+            name = "crashed"
+        latencies[name].append(time.perf_counter() - start)
+
+    loop = asyncio.get_event_loop()
+    tasks = []
+    start = time.perf_counter()
+    firstTime = entries[0]["time"]
+
+    for entry in entries:
+        delay = (entry["time"] - firstTime) / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for copy in range(copies):
+            tasks.append(loop.create_task(timed(entry, copy)))
+
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start, latencies
+
+
+def format_seconds(values):
+    return " ".join(
+        f"{label}={percentile(values, fraction) * 1000:.0f}ms"
+        for (label, fraction) in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1)]
+    )
+
+
+def report(wallTime, latencies, lags, bot, fixtures, recordedSpan, speed, copies):
+    allLatencies = [value for values in latencies.values() for value in values]
+
+    print(
+        f"Replayed {len(allLatencies)} commands ({copies} copies) in {wallTime:.1f}s "
+        f"at {speed}x (recorded span {recordedSpan:.1f}s)"
+    )
+    print(f"Throughput: {len(allLatencies) / max(wallTime, 1e-9):.2f} commands/s")
+    print(f"Latency: {format_seconds(allLatencies)}")
+    for (name, values) in sorted(latencies.items()):
+        print(f"    {name} (n={len(values)}): {format_seconds(values)}")
+    print(f"Event loop lag: {format_seconds(lags)}")
+
+    print(f"Discord calls: {dict(bot.transport.calls)}")
+    print(f"Errors: {dict(bot.errors) or 'none'}")
+    for example in bot.examples.values():
+        print("    " + example.strip().replace("\n", "\n    "))
+    print(
+        f"Fixtures: {sum(fixtures.served.values())} served, "
+        f"{sum(fixtures.missed.values())} missed"
+    )
+    for (path, count) in fixtures.missed.most_common(5):
+        print(f"    missing {path}* ({count})")
+
+
+def prepare_copy(overrides):
+    """Copies the bot to a temporary directory, with config overrides.
+
+    - overrides are 'Section.key=value' strings.
+    - Returns (path of the copy, its ConfigParser with the overrides).
+    """
+
+    directory = tempfile.mkdtemp(prefix="replay-")
+    for name in ["cogs", "helpers"]:
+        shutil.copytree(
+            os.path.join(ROOT, name),
+            os.path.join(directory, name),
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+
+    configs = configparser.ConfigParser()
+    configs.read(os.path.join(ROOT, "config.ini"))
+
+    # Never record the replay itself
+    configs["Replay"]["record"] = "False"
+
+    for override in overrides:
+        (key, value) = override.split("=", 1)
+        (section, option) = key.split(".", 1)
+        configs[section][option] = value
+
+    with open(os.path.join(directory, "config.ini"), "w") as f:
+        configs.write(f)
+
+    # Reuse the item catalog instead of building it from fixtures
+    catalogFile = configs["Catalog"]["catalogFile"]
+    if os.path.isfile(os.path.join(ROOT, catalogFile)):
+        shutil.copy(os.path.join(ROOT, catalogFile), directory)
+
+    return directory, configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", help="JSON lines file recorded by the bot")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pace multiplier")
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Replay each command this many times"
+    )
+    parser.add_argument("--fixtures", default=None, help="Fixture directory")
+    parser.add_argument(
+        "--upstream-ms", type=float, default=0, help="Delay of each fixture response"
+    )
+    parser.add_argument(
+        "--discord-ms", type=float, default=0, help="Delay of each Discord API call"
+    )
+    parser.add_argument(
+        "--cogs", default=None, help="Comma separated cogs to load (default all)"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SECTION.KEY=VALUE",
+        help="Override a config.ini setting, e.g. Snapshot.enabled=False",
+    )
+    args = parser.parse_args()
+
+    # Absolute paths, as the cogs run from the copy's directory
+    recordingPath = os.path.abspath(args.recording)
+    fixturesPath = os.path.abspath(args.fixtures) if args.fixtures else None
+
+    # Every urllib request goes to the fixture server
+    fixtures = FixtureServer(fixturesPath, args.upstream_ms / 1000)
+    urllib.request.install_opener(
+        urllib.request.build_opener(FixtureHandler(fixtures.address))
+    )
+
+    (directory, configs) = prepare_copy(args.set)
+    sys.path.insert(0, directory)
+    os.chdir(directory)
+
+    from helpers.recorder import load_recording
+
+    entries = load_recording(recordingPath)
+    if not entries:
+        print("Recording is empty.")
+        return
+
+    # Cogs' background tasks bind to the current event loop when imported
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    prefixes = configs["General"]["commandPrefix"].replace("'", "").split(", ")
+    transport = FakeTransport(
+        FakeUser(1, "replay#0000", bot=True), args.discord_ms / 1000
+    )
+    bot = ReplayBot(prefixes, transport)
+    bot.remove_command("help")
+
+    if args.cogs:
+        cogNames = args.cogs.split(",")
+    else:
+        cogNames = [
+            filename[:-3]
+            for filename in sorted(os.listdir(os.path.join(directory, "cogs")))
+            if filename.endswith(".py")
+        ]
+    for cogName in cogNames:
+        bot.load_extension(f"cogs.{cogName.strip()}")
+
+    lags = []
+    stop = asyncio.Event()
+    watcher = loop.create_task(watch_lag(lags, 0.05, stop))
+
+    try:
+        (wallTime, latencies) = loop.run_until_complete(
+            replay(bot, entries, args.speed, args.copies)
+        )
+        stop.set()
+        loop.run_until_complete(watcher)
+    finally:
+        for cogName in list(bot.extensions):
+            bot.unload_extension(cogName)
+        fixtures.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report(
+        wallTime,
+        latencies,
+        lags,
+        bot,
+        fixtures,
+        entries[-1]["time"] - entries[0]["time"],
+        args.speed,
+        args.copies,
+    )
+
+
+if __name__ == "__main__":
+    main()